@@ -0,0 +1,94 @@
+"""
+Measures hotel text search latency on a large hotels table.
+
+Usage:
+    IS_DEBUG=1 python -m benchmarks.search_hotels [hotels_count] [db_url]
+
+By default 100k hotels are generated in a temporary sqlite database.
+Pass a mysql:// url to run it against MariaDB.
+"""
+
+import asyncio
+import random
+import sys
+from statistics import median, quantiles
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from tortoise import Tortoise
+
+from hhb.models import Hotel
+from hhb.routes.hotels import search_hotels
+from hhb.schemas.hotels import SearchHotelsQuery
+from hhb.utils.count_cache import CountCache
+from hhb.utils.hotel_search import HotelSearch
+
+BATCH_SIZE = 10000
+RUNS = 50
+WORDS = [
+    "grand", "plaza", "royal", "palace", "sea", "breeze", "mountain", "lodge", "city", "inn", "river", "garden",
+    "park", "central", "luxury", "boutique", "resort", "spa", "harbor", "sunset", "forest", "lake", "view", "old",
+    "town", "station", "airport", "tower", "bridge", "castle", "golden", "silver", "crown", "star", "ocean", "bay",
+]
+# Descriptions use a bigger vocabulary, so that words are about as selective as in real texts
+VOCABULARY = WORDS + ["".join(random.choices("abcdefghijklmnopqrstuvwxyz", k=random.randint(4, 10))) for _ in range(5000)]
+CITIES = ["Kyiv", "Lviv", "Odesa", "Kharkiv", "Dnipro", "Zaporizhzhia", "Vinnytsia", "Poltava", "Chernihiv", "Uzhhorod"]
+
+
+def words(count: int, vocabulary: list[str] = WORDS) -> str:
+    return " ".join(random.choice(vocabulary) for _ in range(count))
+
+
+async def fill_database(hotels_count: int) -> None:
+    for offset in range(0, hotels_count, BATCH_SIZE):
+        await Hotel.bulk_create([
+            Hotel(
+                name=f"{words(2).title()} {offset + i}",
+                address=f"{random.randint(1, 200)} {words(1).title()} street, {random.choice(CITIES)}",
+                description=words(30, VOCABULARY),
+            )
+            for i in range(min(BATCH_SIZE, hotels_count - offset))
+        ])
+        print(f"\rInserted {offset + BATCH_SIZE}/{hotels_count} hotels", end="", flush=True)
+    print()
+
+
+async def legacy_search(text: str) -> None:
+    CountCache.clear()
+    await search_hotels(SearchHotelsQuery(description=text, page_size=50))
+
+
+async def full_text_search(text: str) -> None:
+    CountCache.clear()
+    await search_hotels(SearchHotelsQuery(q=text, page_size=50))
+
+
+async def measure(name: str, func) -> None:
+    timings = []
+    for _ in range(RUNS):
+        text = random.choice(VOCABULARY + CITIES)
+        start = perf_counter()
+        await func(text)
+        timings.append((perf_counter() - start) * 1000)
+
+    print(f"{name:>9}: p50={median(timings):.2f}ms p95={quantiles(timings, n=20)[-1]:.2f}ms")
+
+
+async def main(hotels_count: int, db_url: str | None) -> None:
+    with TemporaryDirectory() as tmp_dir:
+        await Tortoise.init(db_url=db_url or f"sqlite://{tmp_dir}/bench.sqlite3", modules={"models": ["hhb.models"]})
+        await Tortoise.generate_schemas()
+        try:
+            await HotelSearch.setup()
+            await fill_database(hotels_count)
+            await measure("legacy", legacy_search)
+            await measure("full-text", full_text_search)
+        finally:
+            await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100_000,
+        sys.argv[2] if len(sys.argv) > 2 else None,
+    ))
@@ -0,0 +1,104 @@
+"""
+Measures room availability search latency on a large bookings table.
+
+Usage:
+    IS_DEBUG=1 python -m benchmarks.search_rooms [bookings_count] [db_url]
+
+By default 1M bookings are generated in a temporary sqlite database.
+Pass a mysql:// url to run it against MariaDB.
+"""
+
+import asyncio
+import random
+import sys
+from datetime import date, timedelta
+from statistics import median, quantiles
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from tortoise import Tortoise
+from tortoise.expressions import Q, Subquery
+
+from hhb.models import User, Hotel, Room, Booking, BookingStatus
+from hhb.routes.rooms import search_rooms
+from hhb.schemas.rooms import SearchRoomsQuery
+
+HOTELS_COUNT = 100
+ROOMS_PER_HOTEL = 100
+BATCH_SIZE = 10000
+RUNS = 50
+START_DATE = date(2024, 1, 1)
+DAYS = 365 * 3
+
+
+async def fill_database(bookings_count: int) -> None:
+    user = await User.create(email="bench@example.com", password="", first_name="bench", last_name="bench")
+    await Hotel.bulk_create([Hotel(name=f"Hotel {i}", address=f"Address {i}") for i in range(HOTELS_COUNT)])
+    await Room.bulk_create([
+        Room(hotel=hotel, type="bench", price=10 + i)
+        for hotel in await Hotel.all()
+        for i in range(ROOMS_PER_HOTEL)
+    ])
+    room_ids = await Room.all().values_list("id", flat=True)
+
+    statuses = (BookingStatus.PENDING, BookingStatus.CONFIRMED, BookingStatus.CONFIRMED, BookingStatus.CANCELLED)
+    for offset in range(0, bookings_count, BATCH_SIZE):
+        bookings = []
+        for _ in range(min(BATCH_SIZE, bookings_count - offset)):
+            check_in = START_DATE + timedelta(days=random.randrange(DAYS))
+            bookings.append(Booking(
+                user=user, room_id=random.choice(room_ids), check_in=check_in,
+                check_out=check_in + timedelta(days=random.randint(1, 14)), total_price=100,
+                status=random.choice(statuses),
+            ))
+        await Booking.bulk_create(bookings)
+        print(f"\rInserted {offset + len(bookings)}/{bookings_count} bookings", end="", flush=True)
+    print()
+
+
+def random_range() -> tuple[date, date]:
+    check_in = START_DATE + timedelta(days=random.randrange(DAYS))
+    return check_in, check_in + timedelta(days=random.randint(1, 7))
+
+
+async def legacy_search(check_in: date, check_out: date) -> None:
+    db_query = Room.filter(id__not_in=Subquery(
+        Booking.filter(Q(check_in__lte=check_out) & Q(check_out__gte=check_in))
+        .select_related("room").values_list("room__id", flat=True)
+    ))
+    await db_query.count()
+    await db_query.order_by("id").select_related("hotel").limit(50)
+
+
+async def current_search(check_in: date, check_out: date) -> None:
+    await search_rooms(SearchRoomsQuery(check_in=check_in, check_out=check_out, page_size=50))
+
+
+async def measure(name: str, func) -> None:
+    timings = []
+    for _ in range(RUNS):
+        check_in, check_out = random_range()
+        start = perf_counter()
+        await func(check_in, check_out)
+        timings.append((perf_counter() - start) * 1000)
+
+    print(f"{name:>8}: p50={median(timings):.2f}ms p95={quantiles(timings, n=20)[-1]:.2f}ms")
+
+
+async def main(bookings_count: int, db_url: str | None) -> None:
+    with TemporaryDirectory() as tmp_dir:
+        await Tortoise.init(db_url=db_url or f"sqlite://{tmp_dir}/bench.sqlite3", modules={"models": ["hhb.models"]})
+        await Tortoise.generate_schemas()
+        try:
+            await fill_database(bookings_count)
+            await measure("legacy", legacy_search)
+            await measure("current", current_search)
+        finally:
+            await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000,
+        sys.argv[2] if len(sys.argv) > 2 else None,
+    ))
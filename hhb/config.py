@@ -26,9 +26,52 @@ if RECAPTCHA_SECRET is None:  # pragma: no cover
     import warnings
     warnings.warn("RECAPTCHA_SECRET is not set!")
 
+RECAPTCHA_DEADLINE_MS = _try_parse_int(environ.get("RECAPTCHA_DEADLINE_MS", 1500), 1500)
+RECAPTCHA_CONCURRENCY = _try_parse_int(environ.get("RECAPTCHA_CONCURRENCY", 32), 32)
+# Let requests through when reCAPTCHA can not be reached in time instead of failing them with 503
+RECAPTCHA_FAIL_OPEN = str(environ.get("RECAPTCHA_FAIL_OPEN")).lower() in ("true", "1")
+
 AUTH_JWT_TTL = _try_parse_int(environ.get("AUTH_JWT_TTL", 86400), 86400)
 AUTH_REFRESH_JWT_TTL = _try_parse_int(environ.get("AUTH_JWT_TTL", AUTH_JWT_TTL * 7), AUTH_JWT_TTL * 7)
 
+SESSION_CACHE_SIZE = _try_parse_int(environ.get("SESSION_CACHE_SIZE", 10000), 10000)
+SESSION_CACHE_TTL = _try_parse_int(environ.get("SESSION_CACHE_TTL", 60), 60)
+
+COUNT_CACHE_SIZE = _try_parse_int(environ.get("COUNT_CACHE_SIZE", 4096), 4096)
+COUNT_CACHE_TTL = _try_parse_int(environ.get("COUNT_CACHE_TTL", 30), 30)
+
+HOTEL_ADMIN_CACHE_SIZE = _try_parse_int(environ.get("HOTEL_ADMIN_CACHE_SIZE", 4096), 4096)
+# Without invalidation bus other workers notice removed hotel admins only after ttl, same as removed sessions
+HOTEL_ADMIN_CACHE_TTL = _try_parse_int(environ.get("HOTEL_ADMIN_CACHE_TTL", SESSION_CACHE_TTL), SESSION_CACHE_TTL)
+
+RESPONSE_CACHE_SIZE = _try_parse_int(environ.get("RESPONSE_CACHE_SIZE", 4096), 4096)
+RESPONSE_CACHE_TTL = _try_parse_int(environ.get("RESPONSE_CACHE_TTL", 30), 30)
+CATALOG_CACHE_MAX_AGE = _try_parse_int(environ.get("CATALOG_CACHE_MAX_AGE", 0), 0)
+
+# "memory" keeps cache in every worker process, "redis" shares it between workers
+CACHE_BACKEND = environ.get("CACHE_BACKEND", "memory").lower()
+CACHE_REDIS_URL = environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_REDIS_POOL_SIZE = _try_parse_int(environ.get("CACHE_REDIS_POOL_SIZE", 16), 16)
+CACHE_REDIS_TIMEOUT_MS = _try_parse_int(environ.get("CACHE_REDIS_TIMEOUT_MS", 250), 250)
+CACHE_KEY_PREFIX = environ.get("CACHE_KEY_PREFIX", "hhb")
+CACHE_MEMORY_SIZE = _try_parse_int(environ.get("CACHE_MEMORY_SIZE", 10000), 10000)
+CACHE_DEFAULT_TTL = _try_parse_int(environ.get("CACHE_DEFAULT_TTL", 60), 60)
+CACHE_LOCK_TIMEOUT = _try_parse_int(environ.get("CACHE_LOCK_TIMEOUT", 10), 10)
+CACHE_LOCK_POLL_MS = _try_parse_int(environ.get("CACHE_LOCK_POLL_MS", 50), 50)
+
+PASSWORD_HASHER_EXECUTOR = environ.get("PASSWORD_HASHER_EXECUTOR", "thread").lower()
+PASSWORD_HASHER_WORKERS = _try_parse_int(environ.get("PASSWORD_HASHER_WORKERS", 4), 4)
+PASSWORD_HASHER_QUEUE_SIZE = _try_parse_int(environ.get("PASSWORD_HASHER_QUEUE_SIZE", 64), 64)
+
+BREAKER_FAILURE_THRESHOLD = _try_parse_int(environ.get("BREAKER_FAILURE_THRESHOLD", 5), 5)
+BREAKER_RECOVERY_TIMEOUT = _try_parse_int(environ.get("BREAKER_RECOVERY_TIMEOUT", 30), 30)
+RETRY_ATTEMPTS = _try_parse_int(environ.get("RETRY_ATTEMPTS", 3), 3)
+RETRY_BASE_DELAY_MS = _try_parse_int(environ.get("RETRY_BASE_DELAY_MS", 100), 100)
+RETRY_MAX_DELAY_MS = _try_parse_int(environ.get("RETRY_MAX_DELAY_MS", 2000), 2000)
+RETRY_BUDGET_PERCENT = _try_parse_int(environ.get("RETRY_BUDGET_PERCENT", 20), 20)
+RETRY_BUDGET_MIN_PER_SECOND = _try_parse_int(environ.get("RETRY_BUDGET_MIN_PER_SECOND", 1), 1)
+RETRY_BUDGET_CAPACITY = _try_parse_int(environ.get("RETRY_BUDGET_CAPACITY", 50), 50)
+
 SMTP_HOST = environ.get("SMTP_HOST", "127.0.0.1")
 SMTP_PORT = _try_parse_int(environ.get("SMTP_PORT", 0), 0)
 
@@ -46,3 +89,53 @@ if IS_DEBUG:  # pragma: no cover
 else:  # pragma: no cover
     PAYPAL_ID = environ["PAYPAL_ID"]
     PAYPAL_SECRET = environ["PAYPAL_SECRET"]
+
+PAYPAL_WEBHOOK_ID = environ.get("PAYPAL_WEBHOOK_ID")
+
+PAYPAL_MAX_CONNECTIONS = _try_parse_int(environ.get("PAYPAL_MAX_CONNECTIONS", 32), 32)
+PAYPAL_MAX_KEEPALIVE_CONNECTIONS = _try_parse_int(environ.get("PAYPAL_MAX_KEEPALIVE_CONNECTIONS", 16), 16)
+PAYPAL_KEEPALIVE_EXPIRY = _try_parse_int(environ.get("PAYPAL_KEEPALIVE_EXPIRY", 60), 60)
+PAYPAL_CONNECT_TIMEOUT = _try_parse_int(environ.get("PAYPAL_CONNECT_TIMEOUT", 5), 5)
+PAYPAL_AUTH_TIMEOUT = _try_parse_int(environ.get("PAYPAL_AUTH_TIMEOUT", 10), 10)
+PAYPAL_CREATE_TIMEOUT = _try_parse_int(environ.get("PAYPAL_CREATE_TIMEOUT", 15), 15)
+PAYPAL_CAPTURE_TIMEOUT = _try_parse_int(environ.get("PAYPAL_CAPTURE_TIMEOUT", 30), 30)
+PAYPAL_REFUND_TIMEOUT = _try_parse_int(environ.get("PAYPAL_REFUND_TIMEOUT", 30), 30)
+PAYPAL_TOKEN_RENEW_MARGIN = _try_parse_int(environ.get("PAYPAL_TOKEN_RENEW_MARGIN", 300), 300)
+
+PAYPAL_CAPTURE_CONCURRENCY = _try_parse_int(environ.get("PAYPAL_CAPTURE_CONCURRENCY", 8), 8)
+PAYPAL_CAPTURE_ATTEMPTS = _try_parse_int(environ.get("PAYPAL_CAPTURE_ATTEMPTS", 5), 5)
+PAYPAL_CAPTURE_RETRY_DELAY = _try_parse_int(environ.get("PAYPAL_CAPTURE_RETRY_DELAY", 2), 2)
+
+OCCUPANCY_INDEX_ENABLED = str(environ.get("OCCUPANCY_INDEX_ENABLED")).lower() in ("true", "1")
+OCCUPANCY_INDEX_POLL_INTERVAL = _try_parse_int(environ.get("OCCUPANCY_INDEX_POLL_INTERVAL", 1), 1)
+OCCUPANCY_INDEX_MAX_STALENESS = _try_parse_int(environ.get("OCCUPANCY_INDEX_MAX_STALENESS", 5), 5)
+OCCUPANCY_INDEX_FEED_OVERLAP = _try_parse_int(environ.get("OCCUPANCY_INDEX_FEED_OVERLAP", 5), 5)
+OCCUPANCY_INDEX_RELOAD_INTERVAL = _try_parse_int(environ.get("OCCUPANCY_INDEX_RELOAD_INTERVAL", 300), 300)
+# Above this many occupied rooms searches use NOT EXISTS subquery instead of binding every room id into NOT IN
+OCCUPANCY_INDEX_MAX_EXCLUDED_ROOMS = _try_parse_int(environ.get("OCCUPANCY_INDEX_MAX_EXCLUDED_ROOMS", 500), 500)
+
+HOTEL_SUGGEST_MAX_HOTELS = _try_parse_int(environ.get("HOTEL_SUGGEST_MAX_HOTELS", 100_000), 100_000)
+HOTEL_SUGGEST_MAX_KEY_LENGTH = _try_parse_int(environ.get("HOTEL_SUGGEST_MAX_KEY_LENGTH", 64), 64)
+HOTEL_SUGGEST_SCAN_FACTOR = _try_parse_int(environ.get("HOTEL_SUGGEST_SCAN_FACTOR", 8), 8)
+
+# Other workers are told about changes made here through CacheChange rows, needed only with more than one worker
+CACHE_INVALIDATION_ENABLED = str(environ.get("CACHE_INVALIDATION_ENABLED")).lower() in ("true", "1")
+CACHE_INVALIDATION_POLL_INTERVAL = _try_parse_int(environ.get("CACHE_INVALIDATION_POLL_INTERVAL", 1), 1)
+CACHE_INVALIDATION_OVERLAP = _try_parse_int(environ.get("CACHE_INVALIDATION_OVERLAP", 5), 5)
+CACHE_INVALIDATION_RETENTION = _try_parse_int(environ.get("CACHE_INVALIDATION_RETENTION", 60 * 60), 60 * 60)
+
+# RoomSlot row is written for every night, so stay length bounds writes done by one booking request
+MAX_BOOKING_DAYS = _try_parse_int(environ.get("MAX_BOOKING_DAYS", 90), 90)
+PENDING_BOOKING_TTL = _try_parse_int(environ.get("PENDING_BOOKING_TTL", 60 * 60), 60 * 60)
+EXPIRY_SWEEP_INTERVAL = _try_parse_int(environ.get("EXPIRY_SWEEP_INTERVAL", 60), 60)
+EXPIRY_SWEEP_BATCH_SIZE = _try_parse_int(environ.get("EXPIRY_SWEEP_BATCH_SIZE", 100), 100)
+EXPIRY_SWEEP_LOCK_TIMEOUT = _try_parse_int(environ.get("EXPIRY_SWEEP_LOCK_TIMEOUT", 300), 300)
+
+# "inline" creates PayPal order while handling booking request, "outbox" leaves it to OutboxWorker
+PAYPAL_ORDER_MODE = environ.get("PAYPAL_ORDER_MODE", "inline").lower()
+OUTBOX_CONCURRENCY = _try_parse_int(environ.get("OUTBOX_CONCURRENCY", 8), 8)
+OUTBOX_BATCH_SIZE = _try_parse_int(environ.get("OUTBOX_BATCH_SIZE", 32), 32)
+OUTBOX_POLL_INTERVAL = _try_parse_int(environ.get("OUTBOX_POLL_INTERVAL", 1), 1)
+OUTBOX_LOCK_TIMEOUT = _try_parse_int(environ.get("OUTBOX_LOCK_TIMEOUT", 120), 120)
+OUTBOX_ATTEMPTS = _try_parse_int(environ.get("OUTBOX_ATTEMPTS", 5), 5)
+OUTBOX_RETRY_DELAY = _try_parse_int(environ.get("OUTBOX_RETRY_DELAY", 2), 2)
@@ -2,12 +2,12 @@ import warnings
 from typing import Annotated
 
 from fastapi.params import Header, Depends
-from httpx import AsyncClient
 
 from . import config
 from .models import UserRole, Session, User, Hotel, Room, Booking
 from .schemas.common import CaptchaExpectedRequest
 from .utils.multiple_errors_exception import MultipleErrorsException
+from .utils.recaptcha import ReCaptcha
 
 
 class JWTAuthSession:
@@ -81,12 +81,8 @@ async def captcha_dep(data: CaptchaExpectedRequest) -> None:
     if not data.captcha_key:
         raise MultipleErrorsException("Wrong captcha data.")
 
-    async with AsyncClient() as client:
-        resp = await client.post("https://www.google.com/recaptcha/api/siteverify", data={
-            "secret": config.RECAPTCHA_SECRET, "response": data.captcha_key
-        })
-        if not resp.json()["success"]:
-            raise MultipleErrorsException("Wrong captcha data.")
+    if not await ReCaptcha.verify(data.captcha_key):
+        raise MultipleErrorsException("Wrong captcha data.")
 
 
 CaptchaDep = Depends(captcha_dep)
@@ -13,9 +13,25 @@ from tortoise import Tortoise
 from tortoise.contrib.fastapi import RegisterTortoise
 
 from . import config
-from .routes import auth, user, hotels, admin, rooms, bookings
+from .models import RoomSlot
+from .routes import auth, user, hotels, admin, rooms, bookings, payments
 from .utils.create_test_data import create_test_data
+from .utils.expiry_sweeper import ExpirySweeper
+from .utils.cache import Cache
+from .utils.capture_worker import CaptureWorker
+from .utils.count_cache import CountCache
+from .utils.response_cache import ResponseCache
+from .utils.hotel_admin_cache import HotelAdminCache
+from .utils.hotel_search import HotelSearch
+from .utils.hotel_suggest import HotelSuggestIndex
+from .utils.invalidation_bus import InvalidationBus
 from .utils.multiple_errors_exception import MultipleErrorsException
+from .utils.occupancy_index import OccupancyIndex
+from .utils.outbox_worker import OutboxWorker
+from .utils.password_hasher import PasswordHasher
+from .utils.paypal import PayPal
+from .utils.recaptcha import ReCaptcha
+from .utils.session_cache import SessionCache
 
 try:
     import git
@@ -46,9 +62,35 @@ async def migrate_and_connect_orm(app_: FastAPI):  # pragma: no cover
             modules={"models": ["hhb.models"]},
             generate_schemas=True,
     ):
+        SessionCache.clear()
+        HotelAdminCache.clear()
+        CountCache.clear()
+        ResponseCache.clear()
+        await RoomSlot.backfill()
+        await HotelSearch.setup()
+        await OccupancyIndex.start()
+        await PayPal.init_client()
+        await ReCaptcha.init_client()
+        await Cache.init()
+        CaptureWorker.start()
+        OutboxWorker.start()
+        ExpirySweeper.start()
         if config.IS_DEBUG and not config.DONT_CREATE_TEST_DATA:
             await create_test_data()
+        await HotelSuggestIndex.load()
+        await InvalidationBus.start()
         yield
+        await InvalidationBus.stop()
+        await ExpirySweeper.stop()
+        await OutboxWorker.stop()
+        await CaptureWorker.stop()
+        await OccupancyIndex.stop()
+        await PayPal.close_client()
+        await ReCaptcha.close_client()
+        await Cache.close()
+        HotelSuggestIndex.clear()
+
+    PasswordHasher.shutdown()
 
 
 app = FastAPI(
@@ -70,6 +112,7 @@ app.include_router(user.router)
 app.include_router(hotels.router)
 app.include_router(rooms.router)
 app.include_router(bookings.router)
+app.include_router(payments.router)
 app.include_router(admin.router)
 
 
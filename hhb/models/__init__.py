@@ -3,6 +3,10 @@ from .session import Session
 from .hotel import Hotel
 from .hotel_admin import HotelAdmin
 from .room import Room
-from .booking import Booking, BookingStatus
+from .booking import Booking, BookingStatus, ACTIVE_BOOKING_STATUSES
 from .payment import Payment
 from .review import Review
+from .room_slot import RoomSlot
+from .paypal_event import PaypalEvent
+from .outbox_job import OutboxJob, OutboxJobStatus, OutboxJobKind
+from .cache_change import CacheChange
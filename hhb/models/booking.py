@@ -1,12 +1,18 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import datetime, date
 from enum import IntEnum
 
-from tortoise import fields, Model
+from tortoise import fields, Model, timezone
+from tortoise.expressions import Q
+from tortoise.signals import post_save, post_delete
 
 from hhb import models, config
 from hhb.utils import JWT
+from hhb.utils.count_cache import CountCache
+from hhb.utils.invalidation_bus import InvalidationBus
+from hhb.utils.occupancy_index import OccupancyIndex
+from hhb.utils.response_cache import ResponseCache
 from hhb.utils.jwt import JWTPurpose
 
 
@@ -16,6 +22,10 @@ class BookingStatus(IntEnum):
     CANCELLED = 2
 
 
+# Bookings in these statuses are holding the room
+ACTIVE_BOOKING_STATUSES = (BookingStatus.PENDING, BookingStatus.CONFIRMED)
+
+
 class Booking(Model):
     id: int = fields.BigIntField(pk=True)
     user: models.User = fields.ForeignKeyField("models.User")
@@ -25,6 +35,30 @@ class Booking(Model):
     total_price: float = fields.FloatField()
     status: BookingStatus = fields.IntEnumField(BookingStatus, default=BookingStatus.PENDING)
     created_at: datetime = fields.DatetimeField(auto_now_add=True)
+    # Change feed for OccupancyIndex, queryset updates of bookings must set it explicitly
+    updated_at: datetime | None = fields.DatetimeField(auto_now=True, null=True, index=True)
+    # Set by ExpirySweeper claiming the booking, sweepers of other workers skip it until then
+    sweep_locked_until: int = fields.BigIntField(default=0)
+
+    class Meta:
+        indexes = (("room_id", "check_in", "check_out", "status"), ("status", "created_at"))
+
+    @staticmethod
+    def overlap_q(check_in: date, check_out: date) -> Q:
+        return Q(check_in__lte=check_out) & Q(check_out__gte=check_in) & Q(status__in=ACTIVE_BOOKING_STATUSES)
+
+    async def change_status(self, expected: BookingStatus, status: BookingStatus) -> bool:
+        # Conditional update, so concurrent capture and cancellation of the same booking can not both win.
+        # Queryset updates do not fire signals, caches are invalidated here instead
+        if not await Booking.filter(id=self.id, status=expected).update(status=status, updated_at=timezone.now()):
+            return False
+
+        self.status = status
+        CountCache.invalidate("rooms", "bookings")
+        ResponseCache.invalidate("room", self.room_id)
+        OccupancyIndex.apply(self.id, self.room_id, self.check_in, self.check_out, status)
+        await InvalidationBus.publish("room", self.room_id)
+        return True
 
     def to_jwt(self) -> str:
         return JWT.encode(
@@ -59,16 +93,51 @@ class Booking(Model):
                 "created_at": int(self.created_at.timestamp()),
             }
 
-        payment = await models.Payment.get_or_none(booking=self)
-
-        return {
-            "id": self.id,
-            "user_id": self.user.id,
-            "room_id": self.room.id,
-            "check_in": self.check_in,
-            "check_out": self.check_out,
-            "total_price": self.total_price,
-            "status": self.status,
-            "created_at": int(self.created_at.timestamp()),
-            "payment_id": payment.paypal_order_id,
-        }
+        return (await Booking.to_json_bulk([self]))[0]
+
+    @classmethod
+    async def to_json_bulk(cls, bookings: list[Booking]) -> list[dict]:
+        if not bookings:
+            return []
+
+        order_ids = dict(await models.Payment.filter(
+            booking_id__in=[booking.id for booking in bookings]
+        ).values_list("booking_id", "paypal_order_id"))
+
+        return [
+            {
+                "id": booking.id,
+                "user_id": booking.user_id,
+                "room_id": booking.room_id,
+                "check_in": booking.check_in,
+                "check_out": booking.check_out,
+                "total_price": booking.total_price,
+                "status": booking.status,
+                "created_at": int(booking.created_at.timestamp()),
+                "payment_id": order_ids.get(booking.id),
+            }
+            for booking in bookings
+        ]
+
+
+@post_save(Booking)
+@post_delete(Booking)
+async def _invalidate_cached_counts(*args, **kwargs) -> None:
+    CountCache.invalidate("rooms", "bookings")
+
+
+@post_save(Booking)
+@post_delete(Booking)
+async def _invalidate_cached_room_response(_, instance: Booking, *args, **kwargs) -> None:
+    # Room responses include availability for today
+    ResponseCache.invalidate("room", instance.room_id)
+
+
+@post_save(Booking)
+async def _update_occupancy_index(_, instance: Booking, *args, **kwargs) -> None:
+    OccupancyIndex.apply(instance.id, instance.room_id, instance.check_in, instance.check_out, instance.status)
+
+
+@post_delete(Booking)
+async def _remove_from_occupancy_index(_, instance: Booking, *args, **kwargs) -> None:
+    OccupancyIndex.discard(instance.id)
@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from tortoise import fields, Model
+
+
+class CacheChange(Model):
+    id: int = fields.BigIntField(pk=True)
+    entity: str = fields.CharField(max_length=32)
+    # Null means that every cached entity of this type is stale
+    entity_id: int | None = fields.BigIntField(null=True, default=None)
+    created_at: datetime = fields.DatetimeField(auto_now_add=True, index=True)
@@ -1,14 +1,33 @@
 from __future__ import annotations
 
 from tortoise import fields, Model
+from tortoise.contrib.mysql.indexes import FullTextIndex
+from tortoise.signals import post_save, post_delete
 
+from hhb.utils.count_cache import CountCache
+from hhb.utils.hotel_suggest import HotelSuggestIndex
+from hhb.utils.invalidation_bus import InvalidationBus
+from hhb.utils.response_cache import ResponseCache
+from hhb.models.versioned import VersionedMixin
 
-class Hotel(Model):
+
+class _MysqlFullTextIndex(FullTextIndex):
+    # Other databases have no FULLTEXT indexes, sqlite search uses fts5 table created by HotelSearch.setup
+    def get_sql(self, schema_generator, model, safe):
+        if schema_generator.DIALECT != "mysql":
+            return ""
+        return super().get_sql(schema_generator, model, safe)
+
+
+class Hotel(VersionedMixin, Model):
     id: int = fields.BigIntField(pk=True)
     name: str = fields.CharField(max_length=255)
     address: str = fields.TextField()
     description: str = fields.TextField(null=True, default=None)
 
+    class Meta:
+        indexes = (_MysqlFullTextIndex(fields=("name", "address", "description"), name="hotel_fulltext"),)
+
     def to_json(self) -> dict:
         return {
             "id": self.id,
@@ -16,3 +35,57 @@ class Hotel(Model):
             "address": self.address,
             "description": self.description,
         }
+
+
+@post_save(Hotel)
+@post_delete(Hotel)
+async def _invalidate_cached_counts(*args, **kwargs) -> None:
+    CountCache.invalidate("hotels", "rooms")
+
+
+@post_save(Hotel)
+async def _update_suggest_index(_, instance: Hotel, *args, **kwargs) -> None:
+    HotelSuggestIndex.update(instance)
+
+
+@post_delete(Hotel)
+async def _remove_from_suggest_index(_, instance: Hotel, *args, **kwargs) -> None:
+    HotelSuggestIndex.remove(instance.id)
+
+
+@post_save(Hotel)
+async def _invalidate_cached_responses(_, instance: Hotel, *args, **kwargs) -> None:
+    ResponseCache.invalidate("hotel", instance.id)
+    ResponseCache.invalidate("hotels")
+
+
+@post_delete(Hotel)
+async def _invalidate_deleted_cached_responses(_, instance: Hotel, *args, **kwargs) -> None:
+    ResponseCache.invalidate("hotel", instance.id)
+    ResponseCache.invalidate("hotels")
+    # Rooms are deleted by cascade, without their own signals
+    ResponseCache.invalidate("room")
+
+
+@post_save(Hotel)
+async def _publish_change(_, instance: Hotel, *args, **kwargs) -> None:
+    await InvalidationBus.publish("hotel", instance.id)
+
+
+@post_delete(Hotel)
+async def _publish_delete(_, instance: Hotel, *args, **kwargs) -> None:
+    await InvalidationBus.publish("hotel", instance.id)
+    await InvalidationBus.publish("room")
+
+
+async def _evict_changed_by_other_worker(hotel_id: int | None) -> None:
+    CountCache.invalidate("hotels", "rooms")
+    ResponseCache.invalidate("hotels")
+    if hotel_id is None:
+        ResponseCache.invalidate("hotel")
+    else:
+        ResponseCache.invalidate("hotel", hotel_id)
+    await HotelSuggestIndex.refresh(hotel_id)
+
+
+InvalidationBus.subscribe("hotel", _evict_changed_by_other_worker)
@@ -1,11 +1,31 @@
 from __future__ import annotations
 
 from tortoise import fields, Model
+from tortoise.signals import post_save, post_delete
 
 from hhb import models
+from hhb.utils.hotel_admin_cache import HotelAdminCache
+from hhb.utils.invalidation_bus import InvalidationBus
 
 
 class HotelAdmin(Model):
     id: int = fields.BigIntField(pk=True)
     hotel: models.Hotel = fields.ForeignKeyField("models.Hotel")
     user: models.User = fields.ForeignKeyField("models.User", unique=True)
+
+
+@post_save(HotelAdmin)
+@post_delete(HotelAdmin)
+async def _invalidate_cached_membership(_, instance: HotelAdmin, *args, **kwargs) -> None:
+    HotelAdminCache.invalidate(instance.user_id)
+    await InvalidationBus.publish("hotel_admin", instance.user_id)
+
+
+def _evict_changed_by_other_worker(user_id: int | None) -> None:
+    if user_id is None:
+        HotelAdminCache.clear()
+    else:
+        HotelAdminCache.invalidate(user_id)
+
+
+InvalidationBus.subscribe("hotel_admin", _evict_changed_by_other_worker)
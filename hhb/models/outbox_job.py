@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from datetime import datetime
+from enum import IntEnum
+
+from tortoise import fields, Model
+
+from hhb import models
+
+
+class OutboxJobStatus(IntEnum):
+    PENDING = 0
+    PROCESSING = 1
+    DONE = 2
+    FAILED = 3
+
+
+class OutboxJobKind(IntEnum):
+    CREATE_ORDER = 0
+    REFUND = 1
+
+
+class OutboxJob(Model):
+    id: int = fields.BigIntField(pk=True)
+    booking: models.Booking = fields.ForeignKeyField("models.Booking", related_name="outbox_jobs")
+    kind: OutboxJobKind = fields.IntEnumField(OutboxJobKind, default=OutboxJobKind.CREATE_ORDER)
+    status: OutboxJobStatus = fields.IntEnumField(OutboxJobStatus, default=OutboxJobStatus.PENDING)
+    attempts: int = fields.IntField(default=0)
+    run_after: int = fields.BigIntField(default=0)
+    locked_until: int = fields.BigIntField(default=0)
+    created_at: datetime = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (("booking", "kind"),)
+        indexes = (("status", "run_after"),)
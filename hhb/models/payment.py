@@ -11,6 +11,8 @@ class Payment(Model):
     id: int = fields.BigIntField(pk=True)
     booking: models.Booking = fields.ForeignKeyField("models.Booking", unique=True)
     payment_date: datetime = fields.DatetimeField(auto_now_add=True)
-    paypal_order_id: str = fields.CharField(max_length=64)
-    paypal_capture_id: str = fields.CharField(max_length=64, null=True, default=None)
+    paypal_order_id: str = fields.CharField(max_length=64, index=True)
+    paypal_capture_id: str = fields.CharField(max_length=64, null=True, default=None, index=True)
+    # Set by CHECKOUT.ORDER.APPROVED webhook, until then there is nothing to capture
+    approved: bool = fields.BooleanField(default=False)
 
@@ -0,0 +1,12 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from tortoise import fields, Model
+
+
+class PaypalEvent(Model):
+    id: int = fields.BigIntField(pk=True)
+    event_id: str = fields.CharField(max_length=64, unique=True)
+    event_type: str = fields.CharField(max_length=64)
+    received_at: datetime = fields.DatetimeField(auto_now_add=True)
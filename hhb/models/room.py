@@ -3,25 +3,83 @@ from __future__ import annotations
 from datetime import date
 
 from tortoise import fields, Model
+from tortoise.signals import post_save, post_delete
 from tortoise.expressions import Q
 
 from hhb import models
+from hhb.utils.count_cache import CountCache
+from hhb.utils.expressions import NotExists
+from hhb.utils.invalidation_bus import InvalidationBus
+from hhb.utils.occupancy_index import OccupancyIndex
+from hhb.utils.response_cache import ResponseCache
+from hhb.models.versioned import VersionedMixin
 
 
-class Room(Model):
+class Room(VersionedMixin, Model):
     id: int = fields.BigIntField(pk=True)
     hotel: models.Hotel = fields.ForeignKeyField("models.Hotel")
     hotel_id: int
     type: str = fields.CharField(max_length=64)
     price: float = fields.FloatField()
 
+    @staticmethod
+    def available_q(check_in: date, check_out: date) -> Q:
+        # Fresh occupancy index already knows occupied rooms, so subquery over bookings is not needed
+        if (occupied := OccupancyIndex.occupied_rooms(check_in, check_out)) is not None:
+            return ~Q(id__in=sorted(occupied)) if occupied else Q()
+
+        return NotExists(models.Booking.filter(models.Booking.overlap_q(check_in, check_out)), "room_id")
+
     async def to_json(self) -> dict:
-        return {
-            "id": self.id,
-            "hotel_id": self.hotel_id if not isinstance(self.hotel, models.Hotel) else self.hotel.id,
-            "type": self.type,
-            "price": self.price,
-            "available": not await models.Booking.exists(
-                Q(room=self) & Q(check_in__lte=date.today()) & Q(check_out__gte=date.today())
-            ),
-        }
+        return (await Room.to_json_bulk([self]))[0]
+
+    @classmethod
+    async def to_json_bulk(cls, rooms: list[Room]) -> list[dict]:
+        if not rooms:
+            return []
+
+        today = date.today()
+        room_ids = [room.id for room in rooms]
+        if (free := OccupancyIndex.free_rooms(room_ids, today, today)) is not None:
+            occupied = set(room_ids) - free
+        else:
+            occupied = set(await models.Booking.filter(
+                Q(room_id__in=room_ids) & models.Booking.overlap_q(today, today)
+            ).distinct().values_list("room_id", flat=True))
+
+        return [
+            {
+                "id": room.id,
+                "hotel_id": room.hotel_id if not isinstance(room.hotel, models.Hotel) else room.hotel.id,
+                "type": room.type,
+                "price": room.price,
+                "available": room.id not in occupied,
+            }
+            for room in rooms
+        ]
+
+
+@post_save(Room)
+@post_delete(Room)
+async def _invalidate_cached_counts(*args, **kwargs) -> None:
+    CountCache.invalidate("rooms")
+
+
+@post_save(Room)
+@post_delete(Room)
+async def _invalidate_cached_responses(_, instance: Room, *args, **kwargs) -> None:
+    ResponseCache.invalidate("room", instance.id)
+
+
+@post_save(Room)
+@post_delete(Room)
+async def _publish_change(_, instance: Room, *args, **kwargs) -> None:
+    await InvalidationBus.publish("room", instance.id)
+
+
+def _evict_changed_by_other_worker(room_id: int | None) -> None:
+    CountCache.invalidate("rooms")
+    ResponseCache.invalidate("room", *(() if room_id is None else (room_id,)))
+
+
+InvalidationBus.subscribe("room", _evict_changed_by_other_worker)
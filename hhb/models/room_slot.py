@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+from tortoise import fields, Model
+
+from hhb import models
+from hhb.utils.expressions import NotExists
+
+
+class RoomSlot(Model):
+    id: int = fields.BigIntField(pk=True)
+    room: models.Room = fields.ForeignKeyField("models.Room")
+    booking: models.Booking = fields.ForeignKeyField("models.Booking", related_name="slots")
+    day: date = fields.DateField()
+
+    class Meta:
+        unique_together = (("room", "day"),)
+
+    @staticmethod
+    def for_booking(booking: models.Booking) -> list[RoomSlot]:
+        # Check-out day is held too, same as in overlap check used by rooms search
+        return [
+            RoomSlot(room_id=booking.room.id, booking=booking, day=booking.check_in + timedelta(days=offset))
+            for offset in range((booking.check_out - booking.check_in).days + 1)
+        ]
+
+    @classmethod
+    async def backfill(cls) -> None:
+        bookings = await models.Booking.filter(
+            status__in=models.ACTIVE_BOOKING_STATUSES, check_out__gte=date.today(),
+        ).filter(NotExists(RoomSlot.all(), "booking_id")).select_related("room")
+
+        for booking in bookings:
+            await RoomSlot.bulk_create(RoomSlot.for_booking(booking), ignore_conflicts=True)
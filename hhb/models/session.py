@@ -4,10 +4,13 @@ from datetime import datetime
 from os import urandom
 
 from tortoise import fields, Model
+from tortoise.signals import post_save, post_delete
 
 from hhb import models, config
 from ..utils import JWT
+from ..utils.invalidation_bus import InvalidationBus
 from ..utils.jwt import JWTPurpose
+from ..utils.session_cache import SessionCache
 
 
 class Session(Model):
@@ -34,6 +37,36 @@ class Session(Model):
         if (payload := JWT.decode(token, config.JWT_KEY, purpose)) is None:
             return
 
-        return await Session.get_or_none(
+        if (session := SessionCache.get(payload["s"], payload["n"])) is not None and session.user.id == payload["u"]:
+            return session
+
+        session = await Session.get_or_none(
             id=payload["s"], user__id=payload["u"], nonce=payload["n"]
         ).select_related("user")
+        if session is not None:
+            SessionCache.set(session)
+
+        return session
+
+
+@post_save(Session)
+async def _invalidate_cached_session_on_save(_, instance: Session, created: bool, *args) -> None:
+    if not created:
+        SessionCache.invalidate_session(instance.id)
+        await InvalidationBus.publish("session", instance.id)
+
+
+@post_delete(Session)
+async def _invalidate_cached_session_on_delete(_, instance: Session, *args) -> None:
+    SessionCache.invalidate_session(instance.id)
+    await InvalidationBus.publish("session", instance.id)
+
+
+def _evict_changed_by_other_worker(session_id: int | None) -> None:
+    if session_id is None:
+        SessionCache.clear()
+    else:
+        SessionCache.invalidate_session(session_id)
+
+
+InvalidationBus.subscribe("session", _evict_changed_by_other_worker)
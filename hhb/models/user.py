@@ -2,11 +2,15 @@ from __future__ import annotations
 
 from enum import IntEnum
 
-import bcrypt
 from tortoise import fields, Model
+from tortoise.signals import post_save, post_delete
 
 from hhb import models
+from hhb.utils.hotel_admin_cache import HotelAdminCache
+from hhb.utils.invalidation_bus import InvalidationBus
 from hhb.utils.multiple_errors_exception import MultipleErrorsException
+from hhb.utils.password_hasher import PasswordHasher
+from hhb.utils.session_cache import SessionCache
 
 
 class UserRole(IntEnum):
@@ -31,12 +35,12 @@ class User(Model):
         if hotel is None and room is None:
             return
 
-        hotel = hotel if hotel is not None else room.hotel
-        if self.role != UserRole.GLOBAL_ADMIN and not await models.HotelAdmin.filter(hotel=hotel, user=self).exists():
+        hotel_id = hotel.id if hotel is not None else room.hotel_id
+        if self.role != UserRole.GLOBAL_ADMIN and await HotelAdminCache.get_hotel_id(self.id) != hotel_id:
             raise MultipleErrorsException("You dont have permissions to manage this hotel.", 403)
 
-    def check_password(self, password: str) -> bool:
-        return bcrypt.checkpw(password.encode("utf8"), self.password.encode("utf8"))
+    async def check_password(self, password: str) -> bool:
+        return await PasswordHasher.check(password, self.password)
 
     def to_json(self) -> dict:
         return {
@@ -48,3 +52,31 @@ class User(Model):
             "role": self.role,
             "mfa_enabled": self.mfa_key is not None,
         }
+
+
+@post_save(User)
+async def _invalidate_cached_sessions_on_save(_, instance: User, created: bool, *args) -> None:
+    if not created:
+        SessionCache.invalidate_user(instance.id)
+        # Role changes of hotel admins (edit_hotel_admin) also reset their membership
+        HotelAdminCache.invalidate(instance.id)
+        await InvalidationBus.publish("user", instance.id)
+
+
+@post_delete(User)
+async def _invalidate_cached_sessions_on_delete(_, instance: User, *args) -> None:
+    SessionCache.invalidate_user(instance.id)
+    HotelAdminCache.invalidate(instance.id)
+    await InvalidationBus.publish("user", instance.id)
+
+
+def _evict_changed_by_other_worker(user_id: int | None) -> None:
+    if user_id is None:
+        SessionCache.clear()
+        HotelAdminCache.clear()
+    else:
+        SessionCache.invalidate_user(user_id)
+        HotelAdminCache.invalidate(user_id)
+
+
+InvalidationBus.subscribe("user", _evict_changed_by_other_worker)
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Iterable
+
+from tortoise import fields
+from tortoise.expressions import F
+
+
+class VersionedMixin:
+    """
+    Row version and modification time, used as ETag source. Every update through `save` bumps the version,
+    queryset updates must bump it explicitly.
+    """
+
+    version: int = fields.IntField(default=1)
+    updated_at: datetime | None = fields.DatetimeField(auto_now=True, null=True)
+
+    async def save(self, *args, update_fields: Iterable[str] | None = None, **kwargs) -> None:
+        if not self._saved_in_db:
+            return await super().save(*args, update_fields=update_fields, **kwargs)
+
+        # Incremented by the database, so concurrent saves of the same row can not end up with the same version
+        version, self.version = self.version, F("version") + 1
+        if update_fields is not None:
+            update_fields = {*update_fields, "version", "updated_at"}
+
+        try:
+            await super().save(*args, update_fields=update_fields, **kwargs)
+        except BaseException:
+            self.version = version
+            raise
+
+        await self.refresh_from_db(fields=["version"], using_db=kwargs.get("using_db"))
@@ -9,6 +9,7 @@ from hhb.schemas.hotels import HotelResponse, HotelCreateRequest, HotelEditReque
 from hhb.schemas.rooms import RoomResponse, RoomCreateRequest
 from hhb.schemas.user import UserInfoResponse
 from hhb.utils.multiple_errors_exception import MultipleErrorsException
+from hhb.utils.pagination import paginate
 
 router = APIRouter(prefix="/hotels")
 
@@ -115,10 +116,7 @@ async def edit_hotel(hotel: HotelDep, data: HotelEditRequest):
 async def get_hotel_rooms(hotel: HotelDep, user: JwtAuthRoomsDep):
     await user.check_access_to(hotel=hotel)
 
-    return [
-        await room.to_json()
-        for room in await Room.filter(hotel=hotel).select_related("hotel")
-    ]
+    return await Room.to_json_bulk(await Room.filter(hotel=hotel).select_related("hotel"))
 
 
 @router.post("/{hotel_id}/rooms", response_model=RoomResponse)
@@ -131,16 +129,13 @@ async def create_hotel_room(hotel: HotelDep, user: JwtAuthRoomsDep, data: RoomCr
 
 @router.get("", response_model=PaginationResponse[HotelResponse])
 async def get_hotels_for_admins(user: JwtAuthRoomsDep, query: GetHotelsQuery = Query()):
-    query.page -= 1
-
+    next_cursor = None
     if user.role < UserRole.GLOBAL_ADMIN:
         admin = await HotelAdmin.get_or_none(user=user).select_related("hotel")
         count = 1 if admin else 0
         hotels = [admin.hotel] if admin else []
     else:
-        db_query = Hotel.all()
-        count = await db_query.count()
-        hotels = await db_query.order_by("id").offset(query.page * query.page_size).limit(query.page_size)
+        count, hotels, next_cursor = await paginate(query, Hotel.all(), count_cache=("hotels",))
 
     return {
         "count": count,
@@ -148,5 +143,6 @@ async def get_hotels_for_admins(user: JwtAuthRoomsDep, query: GetHotelsQuery = Q
             hotel.to_json()
             for hotel in hotels
         ],
+        "next_cursor": next_cursor,
     }
 
@@ -7,17 +7,15 @@ from hhb.schemas.admin import GetUsersQuery
 from hhb.schemas.common import PaginationResponse
 from hhb.schemas.user import UserInfoResponse
 from hhb.utils.multiple_errors_exception import MultipleErrorsException
+from hhb.utils.pagination import paginate
 
 router = APIRouter(prefix="/users")
 
 
 @router.get("", response_model=PaginationResponse[UserInfoResponse], dependencies=[JwtAuthGlobalDepN])
 async def get_users(query: GetUsersQuery = Query()):
-    query.page -= 1
-
     db_query = User.filter(**({"role": query.role} if query.role is not None else {}))
-    count = await db_query.count()
-    users = await db_query.order_by("id").offset(query.page * query.page_size).limit(query.page_size)
+    count, users, next_cursor = await paginate(query, db_query)
 
     return {
         "count": count,
@@ -25,6 +23,7 @@ async def get_users(query: GetUsersQuery = Query()):
             user.to_json()
             for user in users
         ],
+        "next_cursor": next_cursor,
     }
 
 
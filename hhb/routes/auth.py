@@ -3,7 +3,6 @@ from os import urandom
 from time import time
 
 import aiosmtplib
-import bcrypt
 from fastapi import APIRouter
 from starlette.responses import Response, JSONResponse
 
@@ -16,6 +15,7 @@ from ..utils import JWT
 from ..utils.jwt import JWTPurpose
 from ..utils.mfa import Mfa
 from ..utils.multiple_errors_exception import MultipleErrorsException
+from ..utils.password_hasher import PasswordHasher
 
 router = APIRouter(prefix="/auth")
 
@@ -25,10 +25,9 @@ async def register(data: RegisterRequest):
     if await User.filter(email=data.email).exists():
         raise MultipleErrorsException("User with this email already registered!")
 
-    password = bcrypt.hashpw(data.password.encode("utf8"), bcrypt.gensalt(config.BCRYPT_ROUNDS)).decode("utf8")
     user = await User.create(
         email=data.email,
-        password=password,
+        password=await PasswordHasher.hash(data.password),
         first_name=data.first_name,
         last_name=data.last_name,
         phone_number=data.phone_number,
@@ -49,7 +48,7 @@ async def login(data: LoginRequest):
     if (user := await User.get_or_none(email=data.email)) is None:
         raise MultipleErrorsException("User with this credentials is not found!")
 
-    if not user.check_password(data.password):
+    if not await user.check_password(data.password):
         raise MultipleErrorsException("User with this credentials is not found!")
 
     session = await Session.create(user=user)
@@ -122,5 +121,5 @@ async def reset_password(data: RealResetPasswordRequest):
     if (user := await User.get_or_none(id=payload["u"])) is None:
         raise MultipleErrorsException("User not found!")
 
-    user.password = bcrypt.hashpw(data.new_password.encode("utf8"), bcrypt.gensalt(config.BCRYPT_ROUNDS)).decode("utf8")
+    user.password = await PasswordHasher.hash(data.new_password)
     await user.save(update_fields=["password"])
@@ -1,14 +1,22 @@
 from datetime import date
 
 from fastapi import APIRouter, Query
-from tortoise.expressions import Q
+from httpx import HTTPError
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
 
+from .. import config
 from ..dependencies import JwtAuthUserDep, BookingDep, room_dep
-from ..models import Booking, BookingStatus, Payment
+from ..models import Booking, BookingStatus, Payment, RoomSlot, OutboxJob, OutboxJobKind
 from ..schemas.bookings import ListBookingsQuery, BookingType, BookingResponse, BookRoomRequest, BookingTokenResponse
 from ..schemas.common import PaginationResponse
+from ..utils.capture_worker import CaptureWorker
 from ..utils.multiple_errors_exception import MultipleErrorsException
+from ..utils.occupancy_index import OccupancyIndex
+from ..utils.outbox_worker import OutboxWorker
+from ..utils.pagination import paginate
 from ..utils.paypal import PayPal
+from ..utils.resilience import ServiceUnavailableException
 
 router = APIRouter(prefix="/bookings")
 
@@ -16,18 +24,41 @@ router = APIRouter(prefix="/bookings")
 @router.post("", response_model=BookingResponse)
 async def book_room(user: JwtAuthUserDep, data: BookRoomRequest):
     room = await room_dep(data.room_id)
-    query = Q(room=room) & Q(check_in__lte=data.check_out) & Q(check_out__gte=data.check_in)
-    if await Booking.exists(query):
+    # Occupied room is rejected without a write, RoomSlot constraint still guards against index lag
+    free = OccupancyIndex.free_rooms([room.id], data.check_in, data.check_out)
+    if free is not None and room.id not in free:
         raise MultipleErrorsException("Room is not available for this dates!")
 
     price = room.price * (data.check_out - data.check_in).days
-    booking = await Booking.create(
-        room=room, user=user, check_in=data.check_in, check_out=data.check_out, total_price=price
-    )
+    booking = None
     try:
-        order_id = await PayPal.create(price)
-    except MultipleErrorsException:
-        await booking.delete()
+        async with in_transaction():
+            booking = await Booking.create(
+                room=room, user=user, check_in=data.check_in, check_out=data.check_out, total_price=price
+            )
+            await RoomSlot.bulk_create(RoomSlot.for_booking(booking))
+            if config.PAYPAL_ORDER_MODE == "outbox":
+                await OutboxJob.create(booking=booking)
+    except IntegrityError:
+        if booking is not None:
+            # Booking was already added to occupancy index by post_save signal, but transaction was rolled back
+            OccupancyIndex.discard(booking.id)
+        raise MultipleErrorsException("Room is not available for this dates!")
+
+    if config.PAYPAL_ORDER_MODE == "outbox":
+        # Order is created by OutboxWorker, client gets payment_id from GET /bookings/{booking_id} when it is ready
+        OutboxWorker.notify()
+        return await booking.to_json()
+
+    try:
+        order_id = await PayPal.create(price, request_id=f"booking-{booking.id}")
+    except (MultipleErrorsException, HTTPError) as e:
+        # Cancelled instead of deleted, deletes are not in Booking.updated_at feed of other workers' occupancy index
+        async with in_transaction():
+            await booking.change_status(BookingStatus.PENDING, BookingStatus.CANCELLED)
+            await RoomSlot.filter(booking=booking).delete()
+        if isinstance(e, HTTPError):
+            raise ServiceUnavailableException("PayPal")
         raise
 
     await Payment.create(booking=booking, paypal_order_id=order_id)
@@ -37,8 +68,6 @@ async def book_room(user: JwtAuthUserDep, data: BookRoomRequest):
 
 @router.get("", response_model=PaginationResponse[BookingResponse])
 async def list_bookings(user: JwtAuthUserDep, query: ListBookingsQuery = Query()):
-    query.page -= 1
-
     db_query = Booking.filter(user=user)
 
     booking_type = query.type
@@ -49,30 +78,24 @@ async def list_bookings(user: JwtAuthUserDep, query: ListBookingsQuery = Query()
     elif booking_type == BookingType.EXPIRED:
         db_query = db_query.filter(status=BookingStatus.CONFIRMED, check_out__lt=date.today())
 
-    count = await db_query.count()
-    bookings = await db_query.order_by("-id").select_related("room", "user")\
-        .offset(query.page * query.page_size).limit(query.page_size)
+    count, bookings, next_cursor = await paginate(query, db_query, "-id", count_cache=("bookings", user.id))
 
     return {
         "count": count,
-        "result": [
-            await booking.to_json()
-            for booking in bookings
-        ],
+        "result": await Booking.to_json_bulk(bookings),
+        "next_cursor": next_cursor,
     }
 
 
 @router.get("/{booking_id}", response_model=BookingResponse)
 async def get_booking(booking: BookingDep):
-    if booking.status == BookingStatus.PENDING:
-        payment = await Payment.get_or_none(booking=booking)
-        payment.paypal_capture_id = await PayPal.capture(payment.paypal_order_id)
-        if payment.paypal_capture_id is not None:
-            await payment.save(update_fields=["paypal_capture_id"])
-            booking.status = BookingStatus.CONFIRMED
-            await booking.save(update_fields=["status"])
+    await CaptureWorker.schedule_approved(booking)
 
-    return await booking.to_json()
+    capture_in_progress = CaptureWorker.in_progress(booking.id)
+    return {
+        **await booking.to_json(),
+        "capture_in_progress": capture_in_progress,
+    }
 
 
 @router.post("/{booking_id}/cancel", status_code=204)
@@ -81,22 +104,31 @@ async def cancel_booking(booking: BookingDep):
         raise MultipleErrorsException("This booking is already cancelled.")
     if date.today() >= booking.check_in:
         raise MultipleErrorsException("Active booking can not be cancelled.")
+    if CaptureWorker.in_progress(booking.id):
+        raise MultipleErrorsException("Payment for this booking is being processed, try again later.")
+
+    paid = booking.status != BookingStatus.PENDING
+    if paid and (await Payment.get(booking=booking)).paypal_capture_id is None:  # pragma: no cover
+        raise MultipleErrorsException("Payment does not have capture id.")
 
-    payment = await Payment.get_or_none(booking=booking)
-    if booking.status != BookingStatus.PENDING:
-        if payment.paypal_capture_id is None:  # pragma: no cover
-            raise MultipleErrorsException("Payment does not have capture id.")
-        if not await PayPal.refund(payment.paypal_capture_id, booking.total_price):  # pragma: no cover
-            raise MultipleErrorsException("Failed to request refund for this booking.")
+    async with in_transaction():
+        # Booking might have been captured by another worker since it was loaded.
+        # Status is claimed first, refund is issued by OutboxWorker only for booking this request cancelled
+        if not await booking.change_status(booking.status, BookingStatus.CANCELLED):
+            raise MultipleErrorsException("Payment for this booking is being processed, try again later.")
+        await RoomSlot.filter(booking=booking).delete()
+        if paid:
+            await OutboxJob.create(booking=booking, kind=OutboxJobKind.REFUND)
 
-    booking.status = BookingStatus.CANCELLED
-    await booking.save(update_fields=["status"])
+    if paid:
+        OutboxWorker.notify()
 
 
 @router.get("/{booking_id}/verification-token", response_model=BookingTokenResponse)
 async def get_booking_verification_token(booking: BookingDep):
-    if booking.status == BookingStatus.PENDING:
-        await get_booking(booking=booking)
+    await CaptureWorker.schedule_approved(booking)
+    if CaptureWorker.in_progress(booking.id):
+        raise MultipleErrorsException("Payment for this booking is being processed, try again later.")
     if booking.status != BookingStatus.CONFIRMED:
         raise MultipleErrorsException("Cannot generate verification token for this booking.", 400)
     if booking.check_out > date.today() > booking.check_in:
@@ -1,15 +1,56 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Request
+from fastapi.encoders import jsonable_encoder
+from tortoise.expressions import Q
+from tortoise.functions import Min, Count
 
-from ..dependencies import HotelDep
-from ..models import Hotel
+from .. import config
+from ..dependencies import hotel_dep
+from ..models import Hotel, Room
 from ..schemas.common import PaginationResponse
-from ..schemas.hotels import HotelResponse, SearchHotelsQuery
+from ..schemas.hotels import HotelResponse, SearchHotelsQuery, HotelSuggestionResponse, HotelSearchResponse
+from ..utils.expressions import Exists
+from ..utils.hotel_search import HotelSearch
+from ..utils.hotel_suggest import HotelSuggestIndex
+from ..utils.http_cache import etag_json_response, make_etag, version_etag
+from ..utils.multiple_errors_exception import MultipleErrorsException
+from ..utils.response_cache import ResponseCache
+from ..utils.pagination import paginate, PAGINATION_FIELDS
 
 router = APIRouter(prefix="/hotels")
+CATALOG_CACHE_CONTROL = f"public, max-age={config.CATALOG_CACHE_MAX_AGE}, must-revalidate"
+ROOM_FILTER_FIELDS = {"check_in", "check_out", "price_min", "price_max"}
 
 
-@router.get("", response_model=PaginationResponse[HotelResponse])
-async def search_hotels(query: SearchHotelsQuery = Query()):
+def _rooms_q(query: SearchHotelsQuery) -> Q | None:
+    if not query.model_dump(exclude_defaults=True, include=ROOM_FILTER_FIELDS):
+        return None
+
+    rooms_q = Q()
+    if query.price_min is not None:
+        rooms_q &= Q(price__gte=query.price_min)
+    if query.price_max is not None:
+        rooms_q &= Q(price__lte=query.price_max)
+    if query.check_in is not None and query.check_out is not None:
+        check_in, check_out = sorted((query.check_in, query.check_out))
+        rooms_q &= Room.available_q(check_in, check_out)
+
+    return rooms_q
+
+
+async def _rooms_summary(hotels: list[Hotel], rooms_q: Q) -> dict[int, dict]:
+    if not hotels:
+        return {}
+
+    rows = await Room.filter(rooms_q, hotel_id__in=[hotel.id for hotel in hotels]).annotate(
+        min_price=Min("price"), free_rooms=Count("id"),
+    ).group_by("hotel_id").values("hotel_id", "min_price", "free_rooms")
+
+    return {row.pop("hotel_id"): row for row in rows}
+
+
+# Unset fields are excluded, so min_price and free_rooms are returned only when rooms are filtered
+@router.get("", response_model=PaginationResponse[HotelSearchResponse], response_model_exclude_unset=True)
+async def search_hotels(request: Request, query: SearchHotelsQuery = Query()):
     """
     # !!! WARNING !!!
     # THIS ROUTE WAS CHANGED!
@@ -18,23 +59,65 @@ async def search_hotels(query: SearchHotelsQuery = Query()):
     # !!! WARNING !!!
     """
 
-    query.page -= 1
+    if (query.check_in is None) != (query.check_out is None):
+        raise MultipleErrorsException("Both check-in and check-out dates must be specified.")
+
+    # Only unfiltered listing is cached, filtered searches are too diverse to be worth it
+    cache_key = None
+    if not query.model_dump(exclude_defaults=True, exclude=PAGINATION_FIELDS):
+        cache_key = ("hotels", query.page, query.page_size, query.after, query.with_count)
+        if (cached := ResponseCache.get(*cache_key)) is not None:
+            return etag_json_response(request, *cached, cache_control=CATALOG_CACHE_CONTROL)
 
-    db_query_params = query.model_dump(exclude_defaults=True, exclude={"page", "page_size"})
-    db_query_params = {f"{k}__icontains": v for k, v in db_query_params.items()}
-    db_query = Hotel.filter(**db_query_params)
-    count = await db_query.count()
-    hotels = await db_query.order_by("id").offset(query.page * query.page_size).limit(query.page_size)
+    filters = query.model_dump(exclude_defaults=True, exclude=PAGINATION_FIELDS | ROOM_FILTER_FIELDS | {"q"})
+    rooms_q = _rooms_q(query)
+    if query.q and HotelSearch.available():
+        count, hotels, next_cursor = await HotelSearch.search(query, filters)
+    else:
+        db_query = Hotel.filter(**{f"{k}__icontains": v for k, v in filters.items()})
+        if query.q:
+            db_query = db_query.filter(HotelSearch.fallback_q(query.q))
+        if rooms_q is not None:
+            # Hotels without matching free rooms are filtered out before pagination
+            db_query = db_query.filter(Exists(Room.filter(rooms_q), "hotel_id"))
+        count, hotels, next_cursor = await paginate(
+            query, db_query, count_cache=("hotels",) if rooms_q is None else ("rooms", "hotels"),
+        )
 
-    return {
+    result = [hotel.to_json() for hotel in hotels]
+    if rooms_q is not None:
+        summary = await _rooms_summary(hotels, rooms_q)
+        for hotel in result:
+            hotel.update(summary.get(hotel["id"], {"min_price": None, "free_rooms": 0}))
+            # Without dates every room matching price is counted, which says nothing about availability
+            if query.check_in is None:
+                hotel["free_rooms"] = None
+
+    response = {
         "count": count,
-        "result": [
-            hotel.to_json()
-            for hotel in hotels
-        ],
+        "result": result,
+        "next_cursor": next_cursor,
     }
+    if cache_key is None:
+        return response
+
+    etag = make_etag([count, next_cursor, [(hotel.id, hotel.version) for hotel in hotels]], weak=False)
+    ResponseCache.set(cache_key, response, etag)
+    return etag_json_response(request, response, etag, CATALOG_CACHE_CONTROL)
+
+
+@router.get("/suggest", response_model=list[HotelSuggestionResponse])
+async def suggest_hotels(
+        prefix: str = Query(min_length=1, max_length=64), limit: int = Query(default=10, ge=1, le=25),
+):
+    return await HotelSuggestIndex.suggest(prefix, limit)
 
 
 @router.get("/{hotel_id}", response_model=HotelResponse)
-async def get_hotel(hotel: HotelDep):
-    return hotel.to_json()
+async def get_hotel(request: Request, hotel_id: int):
+    if (cached := ResponseCache.get("hotel", hotel_id)) is None:
+        hotel = await hotel_dep(hotel_id)
+        cached = jsonable_encoder(hotel.to_json()), version_etag("hotel", hotel.id, hotel.version)
+        ResponseCache.set(("hotel", hotel_id), *cached)
+
+    return etag_json_response(request, *cached, cache_control=CATALOG_CACHE_CONTROL)
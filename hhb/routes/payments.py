@@ -0,0 +1,97 @@
+import logfire
+from fastapi import APIRouter, Request
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
+
+from .. import config
+from ..models import Payment, PaypalEvent, BookingStatus, RoomSlot
+from ..utils.capture_worker import CaptureWorker
+from ..utils.multiple_errors_exception import MultipleErrorsException
+from ..utils.paypal import PayPal
+
+router = APIRouter(prefix="/payments")
+
+
+async def _get_payment(**filters) -> Payment | None:
+    return await Payment.get_or_none(**filters).select_related("booking")
+
+
+async def _order_approved(resource: dict) -> None:
+    if (payment := await _get_payment(paypal_order_id=resource.get("id"))) is None:
+        return
+    if not payment.approved:
+        payment.approved = True
+        await payment.save(update_fields=["approved"])
+    if payment.booking.status == BookingStatus.PENDING:
+        CaptureWorker.schedule(payment.booking.id)
+
+
+async def _capture_completed(resource: dict) -> None:
+    order_id = resource.get("supplementary_data", {}).get("related_ids", {}).get("order_id")
+    if (payment := await _get_payment(paypal_order_id=order_id)) is None:
+        return
+
+    # Capture of a booking cancelled or expired in the meantime is refunded through outbox
+    await CaptureWorker.confirm(payment.booking, payment, resource["id"])
+
+
+async def _capture_refunded(resource: dict) -> None:
+    capture_id = None
+    for link in resource.get("links", []):
+        if link.get("rel") == "up" and "/captures/" in link.get("href", ""):
+            capture_id = link["href"].rstrip("/").split("/")[-1]
+            break
+
+    if (payment := await _get_payment(paypal_capture_id=capture_id)) is None:
+        return
+
+    # Only full refund cancels the booking, total covers several partial refunds of the same capture
+    refunded = resource.get("seller_payable_breakdown", {}).get("total_refunded_amount") or resource.get("amount", {})
+    if float(refunded.get("value", 0)) + 0.005 < payment.booking.total_price:
+        logfire.info("PayPal capture was refunded partially", booking_id=payment.booking.id, refunded=refunded)
+        return
+
+    if payment.booking.status != BookingStatus.CANCELLED:
+        payment.booking.status = BookingStatus.CANCELLED
+        await payment.booking.save(update_fields=["status"])
+        await RoomSlot.filter(booking=payment.booking).delete()
+
+
+EVENT_HANDLERS = {
+    "CHECKOUT.ORDER.APPROVED": _order_approved,
+    "PAYMENT.CAPTURE.COMPLETED": _capture_completed,
+    "PAYMENT.CAPTURE.REFUNDED": _capture_refunded,
+}
+
+
+@router.post("/paypal/webhook", status_code=204)
+async def paypal_webhook(request: Request):
+    if config.PAYPAL_WEBHOOK_ID is None:  # pragma: no cover
+        raise MultipleErrorsException("PayPal webhooks are not configured.", 503)
+
+    try:
+        event = await request.json()
+        event_id = event["id"]
+        event_type = event["event_type"]
+        resource = event.get("resource", {})
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise MultipleErrorsException("Invalid event.")
+    if not isinstance(resource, dict):
+        raise MultipleErrorsException("Invalid event.")
+
+    if await PaypalEvent.exists(event_id=event_id):
+        return
+
+    if not await PayPal.verify_webhook(request.headers, event):
+        raise MultipleErrorsException("Invalid event signature.")
+
+    try:
+        async with in_transaction():
+            await PaypalEvent.create(event_id=event_id, event_type=event_type)
+            if (handler := EVENT_HANDLERS.get(event_type)) is not None:
+                await handler(resource)
+    except IntegrityError:
+        logfire.debug("Duplicate PayPal event", event_id=event_id, event_type=event_type)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        # Signed event with unexpected resource shape, it is not recorded so a fixed one can be delivered again
+        raise MultipleErrorsException("Invalid event.")
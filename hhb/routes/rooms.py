@@ -1,56 +1,84 @@
-from fastapi import APIRouter, Query
-from tortoise.expressions import Subquery, Q
+from datetime import date, timedelta
 
-from ..dependencies import RoomDep
+from fastapi import APIRouter, Query, Request
+from fastapi.encoders import jsonable_encoder
+from tortoise.expressions import Q
+
+from ..dependencies import RoomDep, room_dep
 from ..models import Room, Booking
 from ..schemas.common import PaginationResponse
-from ..schemas.rooms import RoomResponse, SearchRoomsQuery
+from ..schemas.rooms import RoomResponse, SearchRoomsQuery, RoomCalendarResponse
+from ..utils.http_cache import cached_json_response, etag_json_response, version_etag
+from ..utils.intervals import merge_intervals, clip_intervals, free_intervals
+from ..utils.multiple_errors_exception import MultipleErrorsException
+from ..utils.pagination import paginate, PAGINATION_FIELDS
+from ..utils.response_cache import ResponseCache
+from .hotels import CATALOG_CACHE_CONTROL
 
 router = APIRouter(prefix="/rooms")
 
 
 @router.get("", response_model=PaginationResponse[RoomResponse])
 async def search_rooms(query: SearchRoomsQuery = Query()):
-    query.page -= 1
-
-    db_query_params = query.model_dump(exclude_defaults=True, exclude={"page", "page_size"})
-    if "hotel_id" in db_query_params:
-        db_query_params["hotel__id"] = db_query_params["hotel_id"]
-        del db_query_params["hotel_id"]
+    db_query_params = query.model_dump(exclude_defaults=True, exclude=PAGINATION_FIELDS)
     if "price_min" in db_query_params:
         db_query_params["price__gte"] = db_query_params["price_min"]
         del db_query_params["price_min"]
     if "price_max" in db_query_params:
         db_query_params["price__lte"] = db_query_params["price_max"]
         del db_query_params["price_max"]
+    availability_q = Q()
     if "check_in" in db_query_params and "check_out" in db_query_params:
         check_in = db_query_params.pop("check_in")
         check_out = db_query_params.pop("check_out")
         if check_in > check_out:  # pragma: no cover
             check_in, check_out = check_out, check_in
 
-        db_query_params["id__not_in"] = Subquery(
-            Booking.filter(Q(check_in__lte=check_out) & Q(check_out__gte=check_in))\
-                .select_related("room").values_list("room__id", flat=True)
-        )
+        availability_q = Room.available_q(check_in, check_out)
     elif "check_in" in db_query_params or "check_out" in db_query_params:
         db_query_params.pop("check_in", None)
         db_query_params.pop("check_out", None)
 
-    db_query = Room.filter(**db_query_params)
-    count = await db_query.count()
-    rooms = await db_query.order_by("id").select_related("hotel")\
-        .offset(query.page * query.page_size).limit(query.page_size)
+    db_query = Room.filter(availability_q, **db_query_params)
+    count, rooms, next_cursor = await paginate(query, db_query, related=("hotel",), count_cache=("rooms",))
 
     return {
         "count": count,
-        "result": [
-            await room.to_json()
-            for room in rooms
-        ],
+        "result": await Room.to_json_bulk(rooms),
+        "next_cursor": next_cursor,
     }
 
 
 @router.get("/{room_id}", response_model=RoomResponse)
-async def get_room(room: RoomDep):
-    return await room.to_json()
+async def get_room(request: Request, room_id: int):
+    if (cached := ResponseCache.get("room", room_id)) is None:
+        room = await room_dep(room_id)
+        payload = jsonable_encoder(await room.to_json())
+        # Availability is not a part of room row, so it goes into ETag next to the version
+        cached = payload, version_etag("room", room.id, room.version, int(payload["available"]))
+        ResponseCache.set(("room", room_id), *cached)
+
+    return etag_json_response(request, *cached, cache_control=CATALOG_CACHE_CONTROL)
+
+
+@router.get("/{room_id}/calendar", response_model=RoomCalendarResponse)
+async def get_room_calendar(
+        request: Request, room: RoomDep, start: date = Query(alias="from"), end: date = Query(alias="to"),
+):
+    if end < start:
+        raise MultipleErrorsException("End date cannot be before start date.")
+    if end - start > timedelta(days=366):
+        raise MultipleErrorsException("Calendar can not be requested for more than a year.")
+
+    bookings = await Booking.filter(Q(room_id=room.id) & Booking.overlap_q(start, end)).values_list(
+        "check_in", "check_out",
+    )
+    occupied = clip_intervals(merge_intervals(bookings), start, end)
+
+    return cached_json_response(request, {
+        "room_id": room.id,
+        "start": start,
+        "end": end,
+        "occupied": [{"start": start_, "end": end_} for start_, end_ in occupied],
+        "free": [{"start": start_, "end": end_} for start_, end_ in free_intervals(occupied, start, end)],
+    })
@@ -32,7 +32,7 @@ async def enable_mfa(user: JwtAuthUserDep, data: UserMfaEnableRequest):
         raise MultipleErrorsException("Mfa already enabled.")
     if data.code not in Mfa.get_codes(data.key):
         raise MultipleErrorsException("Invalid code.")
-    if not user.check_password(data.password):
+    if not await user.check_password(data.password):
         raise MultipleErrorsException("Wrong password!")
 
     user.mfa_key = data.key
@@ -47,7 +47,7 @@ async def disable_mfa(user: JwtAuthUserDep, data: UserMfaDisableRequest):
         raise MultipleErrorsException("Mfa is not enabled.")
     if data.code not in Mfa.get_codes(user.mfa_key):
         raise MultipleErrorsException("Invalid code.")
-    if not user.check_password(data.password):
+    if not await user.check_password(data.password):
         raise MultipleErrorsException("Wrong password!")
 
     user.mfa_key = None
@@ -32,6 +32,7 @@ class BookingResponse(BaseModel):
     status: BookingStatus
     created_at: int
     payment_id: str | None
+    capture_in_progress: bool = False
 
 
 class BookRoomRequest(BaseModel):
@@ -57,6 +58,8 @@ class BookRoomRequest(BaseModel):
     def validate_check_out(cls, value: date, values: ValidationInfo) -> date:
         if "check_in" in values.data and value <= values.data["check_in"]:
             raise MultipleErrorsException("Check-out date cannot be before (or same as) check-in date.")
+        if "check_in" in values.data and (value - values.data["check_in"]).days > config.MAX_BOOKING_DAYS:
+            raise MultipleErrorsException(f"Booking cannot be longer than {config.MAX_BOOKING_DAYS} days.")
 
         now = date.today()
         if (now - value).days > 0 and not values.data.get("DEBUG_DISABLE_PAST_DATES_CHECK"):  # pragma: no cover
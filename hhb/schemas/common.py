@@ -14,13 +14,16 @@ T = TypeVar("T", bound=BaseModel)
 
 
 class PaginationResponse(BaseModel, Generic[T]):
-    count: int
+    count: int | None
     result: list[T]
+    next_cursor: str | None = None
 
 
 class PaginationQuery(BaseModel):
     page: int = 1
     page_size: int = 50
+    after: str | None = None
+    with_count: bool = True
 
     @field_validator("page")
     def validate_page(cls, value: int) -> int:
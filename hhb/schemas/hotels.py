@@ -1,3 +1,5 @@
+from datetime import date
+
 from pydantic import BaseModel, field_validator
 
 from hhb.models import UserRole
@@ -12,6 +14,16 @@ class HotelResponse(BaseModel):
     description: str | None
 
 
+class HotelSearchResponse(HotelResponse):
+    min_price: float | None = None
+    free_rooms: int | None = None
+
+
+class HotelSuggestionResponse(BaseModel):
+    id: int
+    name: str
+
+
 class HotelCreateRequest(BaseModel):
     name: str
     address: str
@@ -47,6 +59,11 @@ class HotelEditAdminRequest(HotelRoleRequest):
 
 
 class SearchHotelsQuery(PaginationQuery):
+    q: str | None = None
     name: str | None = None
     address: str | None = None
     description: str | None = None
+    check_in: date | None = None
+    check_out: date | None = None
+    price_min: float | None = None
+    price_max: float | None = None
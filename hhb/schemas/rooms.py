@@ -32,3 +32,16 @@ class SearchRoomsQuery(PaginationQuery):
     price_max: float | None = None
     check_in: date | None = None
     check_out: date | None = None
+
+
+class DateRange(BaseModel):
+    start: date
+    end: date
+
+
+class RoomCalendarResponse(BaseModel):
+    room_id: int
+    start: date
+    end: date
+    occupied: list[DateRange]
+    free: list[DateRange]
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from time import monotonic
+from typing import Any, Awaitable, Callable, Iterable
+
+import logfire
+from redis.asyncio import Redis, BlockingConnectionPool
+from redis.exceptions import ResponseError
+
+from .lru_cache import LRUCache
+from .resilience import CircuitBreaker
+from .. import config
+
+
+class CacheError(Exception):
+    ...
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    async def get_many(self, keys: list[str]) -> list[bytes | None]:
+        ...
+
+    @abstractmethod
+    async def set_many(self, items: dict[str, bytes], ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        """Sets key only if it does not exist yet, returns whether it was set."""
+
+    @abstractmethod
+    async def delete(self, keys: list[str]) -> None:
+        ...
+
+    async def close(self) -> None:
+        ...
+
+
+class MemoryCacheBackend(CacheBackend):
+    def __init__(self, max_size: int) -> None:
+        self._cache: LRUCache[str, bytes] = LRUCache(max_size, config.CACHE_DEFAULT_TTL)
+
+    async def get_many(self, keys: list[str]) -> list[bytes | None]:
+        return [self._cache.get(key) for key in keys]
+
+    async def set_many(self, items: dict[str, bytes], ttl: float) -> None:
+        for key, value in items.items():
+            self._cache.set(key, value, ttl)
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        if self._cache.get(key) is not None:
+            return False
+
+        self._cache.set(key, value, ttl)
+        return True
+
+    async def delete(self, keys: list[str]) -> None:
+        for key in keys:
+            self._cache.delete(key)
+
+
+class RedisCacheBackend(CacheBackend):
+    def __init__(self, client: Redis) -> None:
+        self._redis = client
+        self.breaker = CircuitBreaker("Redis", config.BREAKER_FAILURE_THRESHOLD, config.BREAKER_RECOVERY_TIMEOUT)
+
+    @classmethod
+    def from_url(cls, url: str, pool_size: int, timeout: float) -> RedisCacheBackend:
+        # Blocking pool waits for a free connection instead of failing when all of them are busy
+        pool = BlockingConnectionPool.from_url(
+            url, max_connections=pool_size, timeout=timeout, socket_timeout=timeout, socket_connect_timeout=timeout,
+        )
+        return cls(Redis(connection_pool=pool))
+
+    async def _execute(self, operation: Callable[[Redis], Awaitable[Any]]) -> Any:
+        if not self.breaker.allow():
+            raise CacheError("Redis is temporarily unavailable")
+
+        try:
+            result = await operation(self._redis)
+        except ResponseError as e:
+            # Server replied with an error, connection itself is fine
+            self.breaker.record_success()
+            raise CacheError(f"Redis request failed: {e!r}") from e
+        except BaseException as e:
+            if not isinstance(e, Exception):
+                self.breaker.release()
+                raise
+            self.breaker.record_failure()
+            raise CacheError(f"Redis request failed: {e!r}") from e
+
+        self.breaker.record_success()
+        return result
+
+    async def get_many(self, keys: list[str]) -> list[bytes | None]:
+        if not keys:
+            return []
+
+        return await self._execute(lambda redis: redis.mget(keys))
+
+    async def set_many(self, items: dict[str, bytes], ttl: float) -> None:
+        if not items:
+            return
+
+        ttl_ms = max(1, int(ttl * 1000))
+
+        async def _set_many(redis: Redis) -> None:
+            async with redis.pipeline(transaction=False) as pipe:
+                for key, value in items.items():
+                    pipe.set(key, value, px=ttl_ms)
+                await pipe.execute()
+
+        await self._execute(_set_many)
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        return bool(await self._execute(lambda redis: redis.set(key, value, nx=True, px=max(1, int(ttl * 1000)))))
+
+    async def delete(self, keys: list[str]) -> None:
+        if keys:
+            await self._execute(lambda redis: redis.delete(*keys))
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+class Cache:
+    """
+    Cache shared by all workers when redis backend is used. Values are stored as json, so None can not be cached.
+    Backend errors are logged and treated as misses, cache is never required for request to succeed.
+    """
+
+    _backend: CacheBackend = MemoryCacheBackend(config.CACHE_MEMORY_SIZE)
+    _inflight: dict[str, asyncio.Future] = {}
+    _hits_counter = logfire.metric_counter("cache.hits", unit="1", description="Shared cache hits")
+    _misses_counter = logfire.metric_counter("cache.misses", unit="1", description="Shared cache misses")
+    _errors_counter = logfire.metric_counter("cache.errors", unit="1", description="Failed cache backend calls")
+
+    @classmethod
+    async def init(cls, backend: CacheBackend | None = None) -> None:
+        await cls.close()
+        if backend is None and config.CACHE_BACKEND == "redis":
+            backend = RedisCacheBackend.from_url(
+                config.CACHE_REDIS_URL, config.CACHE_REDIS_POOL_SIZE, config.CACHE_REDIS_TIMEOUT_MS / 1000,
+            )
+        elif backend is None:
+            backend = MemoryCacheBackend(config.CACHE_MEMORY_SIZE)
+
+        cls._backend = backend
+        cls._inflight = {}
+
+    @classmethod
+    async def close(cls) -> None:
+        await cls._backend.close()
+
+    @staticmethod
+    def _key(namespace: str, key: str) -> str:
+        return f"{config.CACHE_KEY_PREFIX}:{namespace}:{key}"
+
+    @classmethod
+    async def _call(cls, operation: str, coro: Awaitable[Any], default: Any = None) -> Any:
+        try:
+            return await coro
+        except CacheError as e:
+            cls._errors_counter.add(1, {"operation": operation})
+            logfire.warn("Cache {operation} failed", operation=operation, _exc_info=e)
+            return default
+
+    @classmethod
+    async def get_many(cls, namespace: str, keys: Iterable[str]) -> dict[str, Any]:
+        keys = list(keys)
+        values = await cls._call("get", cls._backend.get_many([cls._key(namespace, key) for key in keys]))
+        if values is None:
+            values = [None] * len(keys)
+
+        result = {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+        cls._hits_counter.add(len(result), {"namespace": namespace})
+        cls._misses_counter.add(len(keys) - len(result), {"namespace": namespace})
+        return result
+
+    @classmethod
+    async def get(cls, namespace: str, key: str) -> Any | None:
+        return (await cls.get_many(namespace, [key])).get(key)
+
+    @classmethod
+    async def set_many(cls, namespace: str, items: dict[str, Any], ttl: float | None = None) -> None:
+        items = {
+            cls._key(namespace, key): json.dumps(value, separators=(",", ":")).encode("utf8")
+            for key, value in items.items()
+        }
+        await cls._call("set", cls._backend.set_many(items, config.CACHE_DEFAULT_TTL if ttl is None else ttl))
+
+    @classmethod
+    async def set(cls, namespace: str, key: str, value: Any, ttl: float | None = None) -> None:
+        await cls.set_many(namespace, {key: value}, ttl)
+
+    @classmethod
+    async def delete(cls, namespace: str, *keys: str) -> None:
+        await cls._call("delete", cls._backend.delete([cls._key(namespace, key) for key in keys]))
+
+    @classmethod
+    async def get_or_set(
+            cls, namespace: str, key: str, factory: Callable[[], Awaitable[Any]], ttl: float | None = None,
+    ) -> Any:
+        if (value := await cls.get(namespace, key)) is not None:
+            return value
+
+        # Concurrent misses in this worker wait for a single load, other workers are held off by a lock in backend
+        full_key = cls._key(namespace, key)
+        if (task := cls._inflight.get(full_key)) is None:
+            task = asyncio.ensure_future(cls._load(namespace, key, factory, ttl))
+            cls._inflight[full_key] = task
+            task.add_done_callback(lambda _: cls._inflight.pop(full_key, None))
+
+        return await asyncio.shield(task)
+
+    @classmethod
+    async def _load(cls, namespace: str, key: str, factory: Callable[[], Awaitable[Any]], ttl: float | None) -> Any:
+        lock_key = cls._key(namespace, f"{key}:lock")
+        locked = await cls._call("lock", cls._backend.add(lock_key, b"1", config.CACHE_LOCK_TIMEOUT), True)
+        if not locked:
+            deadline = monotonic() + config.CACHE_LOCK_TIMEOUT
+            while monotonic() < deadline:
+                await asyncio.sleep(config.CACHE_LOCK_POLL_MS / 1000)
+                if (value := await cls.get(namespace, key)) is not None:
+                    return value
+            # Lock holder did not store the value in time, most likely it failed, so value is loaded anyway
+
+        try:
+            value = await factory()
+            if value is not None:
+                await cls.set(namespace, key, value, ttl)
+            return value
+        finally:
+            if locked:
+                await cls._call("unlock", cls._backend.delete([lock_key]))
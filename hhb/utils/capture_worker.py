@@ -0,0 +1,126 @@
+import asyncio
+import random
+
+import logfire
+from httpx import HTTPError
+from tortoise.transactions import in_transaction
+
+from .multiple_errors_exception import MultipleErrorsException
+from .outbox_worker import OutboxWorker
+from .paypal import PayPal
+from .. import config
+from ..models import Booking, BookingStatus, Payment, OutboxJob, OutboxJobKind
+
+
+class CaptureWorker:
+    _jobs: dict[int, asyncio.Task] = {}
+    # Jobs started by polling without webhooks, tried once and not blocking cancellation of the booking
+    _speculative: set[int] = set()
+    _semaphore: asyncio.Semaphore | None = None
+
+    @classmethod
+    def start(cls) -> None:
+        cls._semaphore = asyncio.Semaphore(config.PAYPAL_CAPTURE_CONCURRENCY)
+
+    @classmethod
+    async def stop(cls) -> None:
+        jobs = list(cls._jobs.values())
+        for job in jobs:
+            job.cancel()
+        await asyncio.gather(*jobs, return_exceptions=True)
+        cls._jobs.clear()
+        cls._speculative.clear()
+
+    @classmethod
+    async def join(cls) -> None:
+        while cls._jobs:
+            await asyncio.gather(*cls._jobs.values(), return_exceptions=True)
+
+    @classmethod
+    def in_progress(cls, booking_id: int) -> bool:
+        return booking_id in cls._jobs and booking_id not in cls._speculative
+
+    @classmethod
+    def schedule(cls, booking_id: int, speculative: bool = False) -> None:
+        if booking_id in cls._jobs:
+            if not speculative:
+                cls._speculative.discard(booking_id)
+            return
+
+        if speculative:
+            cls._speculative.add(booking_id)
+        cls._jobs[booking_id] = asyncio.create_task(cls._run(booking_id))
+
+    @classmethod
+    async def schedule_approved(cls, booking: Booking) -> None:
+        if booking.status != BookingStatus.PENDING:
+            return
+        if await Payment.exists(booking=booking, approved=True):
+            return cls.schedule(booking.id)
+        # Without webhooks approval is never reported, so capture is attempted once on every poll instead
+        if config.PAYPAL_WEBHOOK_ID is None:
+            cls.schedule(booking.id, speculative=True)
+
+    @classmethod
+    async def confirm(cls, booking: Booking, payment: Payment, capture_id: str) -> bool:
+        """
+        Records completed capture and confirms pending booking, returns whether booking was confirmed by this call.
+        Capture of a booking cancelled in the meantime is refunded.
+        """
+
+        async with in_transaction():
+            # Capture worker, expiry sweeper and webhook may all see the same capture, only the first one handles it
+            if not await Payment.filter(id=payment.id, paypal_capture_id=None).update(paypal_capture_id=capture_id):
+                return False
+            confirmed = await booking.change_status(BookingStatus.PENDING, BookingStatus.CONFIRMED)
+            if not confirmed:
+                await OutboxJob.create(booking=booking, kind=OutboxJobKind.REFUND)
+
+        payment.paypal_capture_id = capture_id
+        if not confirmed:
+            logfire.warn("Booking was cancelled while being captured, refunding", booking_id=booking.id)
+            OutboxWorker.notify()
+
+        return confirmed
+
+    @classmethod
+    async def _run(cls, booking_id: int) -> None:
+        try:
+            attempt = 0
+            while not await cls._capture(booking_id):
+                attempt += 1
+                # Speculative capture is repeated by the next poll anyway
+                if booking_id in cls._speculative or attempt >= config.PAYPAL_CAPTURE_ATTEMPTS:
+                    return
+                delay = config.PAYPAL_CAPTURE_RETRY_DELAY * 2 ** (attempt - 1)
+                await asyncio.sleep(random.uniform(delay / 2, delay))
+        except Exception as e:  # pragma: no cover
+            logfire.exception("PayPal capture job failed", booking_id=booking_id, _exc_info=e)
+        finally:
+            cls._jobs.pop(booking_id, None)
+            cls._speculative.discard(booking_id)
+
+    @classmethod
+    async def _capture(cls, booking_id: int) -> bool:
+        # Returns False only on transient errors worth retrying
+        booking = await Booking.get_or_none(id=booking_id)
+        if booking is None or booking.status != BookingStatus.PENDING:
+            return True
+        if (payment := await Payment.get_or_none(booking=booking)) is None:
+            # PayPal order is not created yet by OutboxWorker, so there is nothing to capture
+            return True
+
+        if cls._semaphore is None:
+            cls.start()
+        async with cls._semaphore:
+            try:
+                capture_id = await PayPal.capture(payment.paypal_order_id)
+            except (MultipleErrorsException, HTTPError):
+                return False
+
+        if capture_id is None:
+            # PayPal answered that order can not be captured (e.g. ORDER_NOT_APPROVED), retrying will not change it
+            return True
+
+        await cls.confirm(booking, payment, capture_id)
+        return True
@@ -0,0 +1,29 @@
+from typing import Hashable
+
+from .lru_cache import LRUCache
+from .. import config
+
+
+class CountCache:
+    _cache: LRUCache[tuple, int] = LRUCache(config.COUNT_CACHE_SIZE, config.COUNT_CACHE_TTL)
+
+    @staticmethod
+    def make_key(namespace: str, *parts: Hashable, filters: dict) -> tuple:
+        return namespace, *parts, tuple(sorted((key, str(value)) for key, value in filters.items()))
+
+    @classmethod
+    def get(cls, key: tuple) -> int | None:
+        return cls._cache.get(key)
+
+    @classmethod
+    def set(cls, key: tuple, count: int) -> None:
+        cls._cache.set(key, count, tags=(key[0],))
+
+    @classmethod
+    def invalidate(cls, *namespaces: str) -> None:
+        for namespace in namespaces:
+            cls._cache.evict_tag(namespace)
+
+    @classmethod
+    def clear(cls) -> None:
+        cls._cache.clear()
@@ -0,0 +1,131 @@
+import asyncio
+from datetime import timedelta
+from time import perf_counter, time
+
+import logfire
+from httpx import HTTPError
+from tortoise import timezone
+from tortoise.transactions import in_transaction
+
+from .capture_worker import CaptureWorker
+from .multiple_errors_exception import MultipleErrorsException
+from .paypal import PayPal
+from .. import config
+from ..models import Booking, BookingStatus, Payment, RoomSlot
+
+
+class ExpirySweeper:
+    _task: asyncio.Task | None = None
+
+    _expired = logfire.metric_counter(
+        "booking_sweeper.expired", unit="1",
+        description="Pending bookings cancelled because they were not paid in time",
+    )
+    _confirmed = logfire.metric_counter(
+        "booking_sweeper.confirmed", unit="1", description="Pending bookings that turned out to be paid while expiring",
+    )
+    _skipped = logfire.metric_counter(
+        "booking_sweeper.skipped", unit="1", description="Expired bookings left for the next sweep",
+    )
+    _sweep_time = logfire.metric_histogram(
+        "booking_sweeper.sweep_time", unit="ms", description="Time spent on one sweep over expired bookings",
+    )
+
+    @classmethod
+    def start(cls) -> None:
+        cls._task = asyncio.create_task(cls._loop())
+
+    @classmethod
+    async def stop(cls) -> None:
+        if cls._task is None:
+            return
+
+        task, cls._task = cls._task, None
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    @classmethod
+    async def _loop(cls) -> None:
+        while True:
+            try:
+                await cls.sweep()
+            except Exception as e:  # pragma: no cover
+                logfire.exception("Failed to sweep expired bookings", _exc_info=e)
+            await asyncio.sleep(config.EXPIRY_SWEEP_INTERVAL)
+
+    @classmethod
+    async def sweep(cls) -> int:
+        start = perf_counter()
+        cutoff = timezone.now() - timedelta(seconds=config.PENDING_BOOKING_TTL)
+        semaphore = asyncio.Semaphore(config.PAYPAL_CAPTURE_CONCURRENCY)
+
+        async def _expire(booking_: Booking) -> bool:
+            async with semaphore:
+                return await cls._expire(booking_)
+
+        expired = 0
+        last_id = 0
+        while True:
+            now = int(time())
+            # Served by (status, created_at) index, id keyset skips bookings left for the next sweep
+            booking_ids = await Booking.filter(
+                status=BookingStatus.PENDING, created_at__lt=cutoff, id__gt=last_id, sweep_locked_until__lt=now,
+            ).order_by("id").limit(config.EXPIRY_SWEEP_BATCH_SIZE).values_list("id", flat=True)
+            if not booking_ids:
+                break
+
+            last_id = booking_ids[-1]
+            bookings = await cls._claim(booking_ids, now)
+            results = await asyncio.gather(*(_expire(booking) for booking in bookings))
+            # Skipped bookings are released, so the next sweep of any worker retries them
+            await Booking.filter(id__in=[booking.id for booking in bookings]).update(sweep_locked_until=0)
+            expired += sum(results)
+            logfire.debug("Expired pending bookings batch", expired=sum(results), batch=len(bookings), last_id=last_id)
+
+        cls._sweep_time.record((perf_counter() - start) * 1000)
+        if expired:
+            logfire.info("Expired pending bookings", count=expired)
+
+        return expired
+
+    @staticmethod
+    async def _claim(booking_ids: list[int], now: int) -> list[Booking]:
+        claimed = []
+        for booking_id in booking_ids:
+            # Conditional update, bookings swept by every worker are captured or cancelled only by the one claiming them
+            if await Booking.filter(id=booking_id, status=BookingStatus.PENDING, sweep_locked_until__lt=now).update(
+                    sweep_locked_until=now + config.EXPIRY_SWEEP_LOCK_TIMEOUT,
+            ):
+                claimed.append(booking_id)
+
+        if not claimed:
+            return []
+        return await Booking.filter(id__in=claimed).order_by("id")
+
+    @classmethod
+    async def _expire(cls, booking: Booking) -> bool:
+        if CaptureWorker.in_progress(booking.id):
+            cls._skipped.add(1)
+            return False
+
+        if (payment := await Payment.get_or_none(booking=booking)) is not None:
+            # User might have approved the order right before expiry, so it is captured instead of being lost
+            try:
+                capture_id = await PayPal.capture(payment.paypal_order_id)
+            except (MultipleErrorsException, HTTPError):
+                cls._skipped.add(1)
+                return False
+
+            if capture_id is not None:
+                if await CaptureWorker.confirm(booking, payment, capture_id):
+                    cls._confirmed.add(1)
+                return False
+
+        # Orders with CAPTURE intent can not be voided, abandoned order is never captured once booking is cancelled
+        async with in_transaction():
+            if not await booking.change_status(BookingStatus.PENDING, BookingStatus.CANCELLED):
+                return False
+            await RoomSlot.filter(booking_id=booking.id).delete()
+
+        cls._expired.add(1)
+        return True
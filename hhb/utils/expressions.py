@@ -0,0 +1,57 @@
+from typing import Any, Type
+
+from pypika import Table
+from pypika.terms import Criterion, Field, Term
+from tortoise import Model
+from tortoise.expressions import Q, QueryModifier
+from tortoise.queryset import QuerySet
+
+
+class _OuterField(Term):
+    def __init__(self, field: Field) -> None:
+        super().__init__()
+        self.field = field
+
+    def get_sql(self, **kwargs: Any) -> str:
+        # Outer query columns must always be qualified, otherwise they would resolve to the subquery table
+        return self.field.get_sql(**{**kwargs, "with_namespace": True})
+
+
+class _ExistsCriterion(Criterion):
+    def __init__(self, subquery: Term, negate: bool) -> None:
+        super().__init__()
+        self.subquery = subquery
+        self.negate = negate
+
+    def get_sql(self, **kwargs: Any) -> str:
+        sql = f"EXISTS ({self.subquery.get_sql(**{**kwargs, 'subquery': False, 'with_alias': False})})"
+        return f"NOT {sql}" if self.negate else sql
+
+
+class Exists(Q):
+    """
+    Correlated semi-join: keeps only rows for which `query` has rows with `inner_field` equal to `outer_field`.
+    """
+
+    _negate = False
+
+    def __init__(self, query: QuerySet, inner_field: str, outer_field: str = "id") -> None:
+        super().__init__()
+        self._query = query
+        self._inner_field = inner_field
+        self._outer_field = outer_field
+
+    def resolve(self, model: Type[Model], table: Table) -> QueryModifier:
+        inner_table = self._query.model._meta.basetable
+        subquery = self._query.only("id").as_query().where(
+            inner_table[self._inner_field] == _OuterField(table[self._outer_field])
+        )
+        return QueryModifier(where_criterion=_ExistsCriterion(subquery, self._negate))
+
+
+class NotExists(Exists):
+    """
+    Correlated anti-join: keeps only rows for which `query` has no rows with `inner_field` equal to `outer_field`.
+    """
+
+    _negate = True
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import logfire
+
+from .lru_cache import LRUCache
+from .. import config, models
+
+
+class HotelAdminCache:
+    """
+    Id of the hotel managed by user, resolved once and reused by every access check of the user.
+    0 is cached for users that do not manage any hotel, since None means a cache miss.
+    """
+
+    _cache: LRUCache[int, int] = LRUCache(config.HOTEL_ADMIN_CACHE_SIZE, config.HOTEL_ADMIN_CACHE_TTL)
+    _hits_counter = logfire.metric_counter(
+        "hotel_admin_cache.hits", unit="1", description="Hotel admin membership cache hits",
+    )
+    _misses_counter = logfire.metric_counter(
+        "hotel_admin_cache.misses", unit="1", description="Hotel admin membership cache misses",
+    )
+
+    @classmethod
+    async def get_hotel_id(cls, user_id: int) -> int | None:
+        if (hotel_id := cls._cache.get(user_id)) is not None:
+            cls._hits_counter.add(1)
+            return hotel_id or None
+
+        cls._misses_counter.add(1)
+        hotel_id = await models.HotelAdmin.filter(user_id=user_id).first().values_list("hotel_id", flat=True)
+        cls._cache.set(user_id, hotel_id or 0)
+        return hotel_id
+
+    @classmethod
+    def invalidate(cls, user_id: int) -> None:
+        cls._cache.delete(user_id)
+
+    @classmethod
+    def clear(cls) -> None:
+        cls._cache.clear()
+
+    @classmethod
+    def stats(cls) -> dict:
+        return cls._cache.stats()
@@ -0,0 +1,192 @@
+import re
+
+import logfire
+from tortoise import Tortoise
+from tortoise.expressions import Q
+
+from .count_cache import CountCache
+from .occupancy_index import OccupancyIndex
+from .pagination import encode_cursor, decode_cursor, PAGINATION_FIELDS
+from ..models import Hotel, ACTIVE_BOOKING_STATUSES
+from ..schemas.hotels import SearchHotelsQuery
+
+SEARCH_FIELDS = ("name", "address", "description")
+
+_SQLITE_SETUP = """
+CREATE VIRTUAL TABLE hotel_fts USING fts5(
+    name, address, description, content='hotel', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS hotel_fts_ai AFTER INSERT ON hotel BEGIN
+    INSERT INTO hotel_fts(rowid, name, address, description) VALUES (new.id, new.name, new.address, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS hotel_fts_ad AFTER DELETE ON hotel BEGIN
+    INSERT INTO hotel_fts(hotel_fts, rowid, name, address, description)
+    VALUES ('delete', old.id, old.name, old.address, old.description);
+END;
+CREATE TRIGGER IF NOT EXISTS hotel_fts_au AFTER UPDATE ON hotel BEGIN
+    INSERT INTO hotel_fts(hotel_fts, rowid, name, address, description)
+    VALUES ('delete', old.id, old.name, old.address, old.description);
+    INSERT INTO hotel_fts(rowid, name, address, description) VALUES (new.id, new.name, new.address, new.description);
+END;
+INSERT INTO hotel_fts(hotel_fts) VALUES ('rebuild');
+"""
+
+
+class HotelSearch:
+    _dialect: str | None = None
+
+    @classmethod
+    def available(cls) -> bool:
+        return cls._dialect is not None
+
+    @classmethod
+    async def setup(cls) -> None:
+        cls._dialect = None
+        connection = Tortoise.get_connection("default")
+        dialect = connection.capabilities.dialect
+        try:
+            if dialect == "sqlite":
+                _, rows = await connection.execute_query(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'hotel_fts'"
+                )
+                if not rows:
+                    await connection.execute_script(_SQLITE_SETUP)
+            elif dialect == "mysql":  # pragma: no cover
+                _, rows = await connection.execute_query(
+                    "SELECT 1 FROM information_schema.statistics "
+                    "WHERE table_schema = DATABASE() AND table_name = 'hotel' AND index_name = 'hotel_fulltext'"
+                )
+                # Index itself is declared in Hotel.Meta and created by migrations
+                if not rows:
+                    logfire.warn("Full-text index on hotels does not exist, falling back to LIKE")
+                    return
+            else:  # pragma: no cover
+                return
+        except Exception as e:  # pragma: no cover
+            logfire.exception("Full-text hotel search is not available, falling back to LIKE", _exc_info=e)
+            return
+
+        cls._dialect = dialect
+
+    @staticmethod
+    def fallback_q(text: str) -> Q:
+        return Q(*[Q(**{f"{field}__icontains": text}) for field in SEARCH_FIELDS], join_type=Q.OR)
+
+    @staticmethod
+    def _escape_like(value: str) -> str:
+        return "%" + value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+    @staticmethod
+    def _rooms_filter(query: SearchHotelsQuery, placeholder: str) -> tuple[str, list] | None:
+        has_dates = query.check_in is not None and query.check_out is not None
+        if query.price_min is None and query.price_max is None and not has_dates:
+            return None
+
+        where = []
+        params = []
+        if query.price_min is not None:
+            where.append(f"room.price >= {placeholder}")
+            params.append(query.price_min)
+        if query.price_max is not None:
+            where.append(f"room.price <= {placeholder}")
+            params.append(query.price_max)
+        if has_dates:
+            check_in, check_out = sorted((query.check_in, query.check_out))
+            if (occupied := OccupancyIndex.occupied_rooms(check_in, check_out)) is None:
+                statuses = ", ".join([placeholder] * len(ACTIVE_BOOKING_STATUSES))
+                where.append(
+                    f"NOT EXISTS (SELECT 1 FROM booking WHERE booking.room_id = room.id "
+                    f"AND booking.check_in <= {placeholder} AND booking.check_out >= {placeholder} "
+                    f"AND booking.status IN ({statuses}))"
+                )
+                params.extend([check_out.isoformat(), check_in.isoformat(), *map(int, ACTIVE_BOOKING_STATUSES)])
+            elif occupied:
+                where.append(f"room.id NOT IN ({', '.join([placeholder] * len(occupied))})")
+                params.extend(sorted(occupied))
+
+        # With no occupied rooms and no price bounds hotel still has to have at least one room
+        rooms = "SELECT room.hotel_id FROM room" + (f" WHERE {' AND '.join(where)}" if where else "")
+        return f"hotel.id IN ({rooms})", params
+
+    @classmethod
+    def _build_query(
+            cls, query: SearchHotelsQuery, filters: dict[str, str],
+    ) -> tuple[str, list, str, list] | None:
+        text = query.q
+        if cls._dialect == "sqlite":
+            # Every word is quoted, so user input can not use fts5 query syntax. Last word is matched as a prefix
+            words = re.findall(r"\w+", text)
+            if not words:
+                return None
+            match = " ".join(f"\"{word}\"" for word in words) + "*"
+
+            source = "hotel_fts JOIN hotel ON hotel.id = hotel_fts.rowid"
+            where = ["hotel_fts MATCH ?"]
+            params = [match]
+            # Matches in name weigh more than in address, and those more than in description
+            rank = "bm25(hotel_fts, 10.0, 5.0, 1.0)"
+            rank_params = []
+            placeholder = "?"
+            # Sqlite has no default escape character for LIKE
+            escape = " ESCAPE '\\'"
+        else:
+            source = "hotel"
+            where = ["MATCH(name, address, description) AGAINST (%s IN NATURAL LANGUAGE MODE)"]
+            params = [text]
+            rank = "MATCH(name, address, description) AGAINST (%s IN NATURAL LANGUAGE MODE) DESC"
+            rank_params = [text]
+            placeholder = "%s"
+            # Backslash is the default LIKE escape character in mysql, while its literal depends on sql mode
+            escape = ""
+
+        for field, value in filters.items():
+            where.append(f"hotel.{field} LIKE {placeholder}{escape}")
+            params.append(cls._escape_like(value))
+
+        if (rooms := cls._rooms_filter(query, placeholder)) is not None:
+            where.append(rooms[0])
+            params.extend(rooms[1])
+
+        return f"FROM {source} WHERE {' AND '.join(where)}", params, f"{rank}, hotel.id", rank_params
+
+    @classmethod
+    async def search(
+            cls, query: SearchHotelsQuery, filters: dict[str, str],
+    ) -> tuple[int | None, list[Hotel], str | None]:
+        if (built := cls._build_query(query, filters)) is None:
+            return 0 if query.with_count else None, [], None
+
+        from_where, params, order_by, order_params = built
+        placeholder = "?" if cls._dialect == "sqlite" else "%s"
+        connection = Tortoise.get_connection("default")
+
+        offset = (query.page - 1) * query.page_size
+        if query.after is not None:
+            offset = decode_cursor("rank", query.after)
+
+        rows = await connection.execute_query_dict(
+            f"SELECT hotel.id AS id {from_where} ORDER BY {order_by} LIMIT {placeholder} OFFSET {placeholder}",
+            params + order_params + [query.page_size, offset],
+        )
+        ids = [row["id"] for row in rows]
+
+        hotels = {hotel.id: hotel for hotel in await Hotel.filter(id__in=ids)} if ids else {}
+        hotels = [hotels[hotel_id] for hotel_id in ids if hotel_id in hotels]
+
+        count = None
+        if query.with_count:
+            # Counts with room filters depend on rooms and bookings, so they are invalidated together with those
+            namespace = "hotels" if cls._rooms_filter(query, placeholder) is None else "rooms"
+            key = CountCache.make_key(
+                namespace, "fts", filters=query.model_dump(exclude_defaults=True, exclude=PAGINATION_FIELDS),
+            )
+            if (count := CountCache.get(key)) is None:
+                rows = await connection.execute_query_dict(f"SELECT COUNT(*) AS count {from_where}", params)
+                count = rows[0]["count"]
+                CountCache.set(key, count)
+
+        next_cursor = None
+        if len(ids) == query.page_size:
+            next_cursor = encode_cursor("rank", offset + len(ids))
+
+        return count, hotels, next_cursor
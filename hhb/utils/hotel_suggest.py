@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import re
+from bisect import bisect_left, insort
+
+from .. import config, models
+
+
+class HotelSuggestIndex:
+    """
+    Sorted array of (token, kind, hotel_id) for prefix lookups over hotel names and address cities.
+    Kind orders matches: whole name first, then words of the name, then city.
+    """
+
+    NAME = 0
+    WORD = 1
+    CITY = 2
+
+    _keys: list[tuple[str, int, int]] = []
+    _hotels: dict[int, tuple[str, list[tuple[str, int, int]]]] = {}
+    # Set when some hotels did not fit into the index, suggestions then come from the database
+    _overflow = False
+    _loaded = False
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return " ".join(text.casefold().split())[:config.HOTEL_SUGGEST_MAX_KEY_LENGTH]
+
+    @classmethod
+    def _make_keys(cls, hotel_id: int, name: str, address: str) -> list[tuple[str, int, int]]:
+        keys = {(cls._normalize(name), cls.NAME, hotel_id)}
+        keys.update((word, cls.WORD, hotel_id) for word in re.findall(r"\w+", cls._normalize(name))[1:])
+        # Addresses are "street, city", last part is used as city
+        if (city := cls._normalize(address.rsplit(",", 1)[-1])) and "," in address:
+            keys.add((city, cls.CITY, hotel_id))
+
+        return sorted(keys)
+
+    @classmethod
+    async def load(cls) -> None:
+        cls.clear()
+        hotels = await models.Hotel.all().order_by("id").limit(config.HOTEL_SUGGEST_MAX_HOTELS + 1).values_list(
+            "id", "name", "address",
+        )
+        cls._overflow = len(hotels) > config.HOTEL_SUGGEST_MAX_HOTELS
+
+        keys = []
+        for hotel_id, name, address in hotels[:config.HOTEL_SUGGEST_MAX_HOTELS]:
+            hotel_keys = cls._make_keys(hotel_id, name, address)
+            cls._hotels[hotel_id] = (name, hotel_keys)
+            keys.extend(hotel_keys)
+
+        keys.sort()
+        cls._keys = keys
+        cls._loaded = True
+
+    @classmethod
+    def clear(cls) -> None:
+        cls._keys = []
+        cls._hotels = {}
+        cls._overflow = False
+        cls._loaded = False
+
+    @classmethod
+    def update(cls, hotel: models.Hotel) -> None:
+        if not cls._loaded:
+            return
+
+        cls.remove(hotel.id)
+        if len(cls._hotels) >= config.HOTEL_SUGGEST_MAX_HOTELS:
+            cls._overflow = True
+            return
+
+        hotel_keys = cls._make_keys(hotel.id, hotel.name, hotel.address)
+        cls._hotels[hotel.id] = (hotel.name, hotel_keys)
+        for key in hotel_keys:
+            insort(cls._keys, key)
+
+    @classmethod
+    async def refresh(cls, hotel_id: int | None) -> None:
+        if not cls._loaded:
+            return
+        if hotel_id is None:
+            return await cls.load()
+
+        if (hotel := await models.Hotel.get_or_none(id=hotel_id)) is None:
+            cls.remove(hotel_id)
+        else:
+            cls.update(hotel)
+
+    @classmethod
+    def remove(cls, hotel_id: int) -> None:
+        if (hotel := cls._hotels.pop(hotel_id, None)) is None:
+            return
+
+        for key in hotel[1]:
+            idx = bisect_left(cls._keys, key)
+            if idx < len(cls._keys) and cls._keys[idx] == key:
+                del cls._keys[idx]
+
+    @classmethod
+    async def suggest(cls, prefix: str, limit: int) -> list[dict]:
+        prefix = cls._normalize(prefix)
+        if not prefix:
+            return []
+        if not cls._loaded or cls._overflow:
+            hotels = await models.Hotel.filter(name__istartswith=prefix).order_by("name").limit(limit)
+            return [{"id": hotel.id, "name": hotel.name} for hotel in hotels]
+
+        # Scan is bounded, so very short prefixes matching most of the index stay cheap
+        matches = []
+        idx = bisect_left(cls._keys, (prefix,))
+        end = min(len(cls._keys), idx + limit * config.HOTEL_SUGGEST_SCAN_FACTOR)
+        while idx < end and cls._keys[idx][0].startswith(prefix):
+            matches.append(cls._keys[idx])
+            idx += 1
+
+        result = []
+        seen = set()
+        for _, _, hotel_id in sorted(matches, key=lambda key: (key[1], key[0])):
+            if hotel_id in seen:
+                continue
+            seen.add(hotel_id)
+            result.append({"id": hotel_id, "name": cls._hotels[hotel_id][0]})
+            if len(result) >= limit:
+                break
+
+        return result
@@ -0,0 +1,45 @@
+import hashlib
+import json
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from starlette.requests import Request
+from starlette.responses import Response, JSONResponse
+
+
+def make_etag(payload: Any, weak: bool = True) -> str:
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    etag = f"\"{hashlib.sha256(body.encode('utf8')).hexdigest()[:32]}\""
+    return f"W/{etag}" if weak else etag
+
+
+def version_etag(*parts: Any) -> str:
+    return f"\"{'-'.join(map(str, parts))}\""
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if (if_none_match := request.headers.get("if-none-match")) is None:
+        return False
+
+    # If-None-Match uses weak comparison, so "W/" prefix is ignored on both sides
+    etag = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+
+    return False
+
+
+def cached_json_response(request: Request, payload: Any, cache_control: str = "no-cache") -> Response:
+    payload = jsonable_encoder(payload)
+    return etag_json_response(request, payload, make_etag(payload), cache_control)
+
+
+def etag_json_response(request: Request, payload: Any, etag: str, cache_control: str = "no-cache") -> Response:
+    # Payload must already be json-encodable, cached payloads are encoded once when they are stored
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    return JSONResponse(payload, headers=headers)
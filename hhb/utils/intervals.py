@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+from typing import Iterable
+
+# All intervals here are inclusive on both ends, same as bookings holding their check-out day
+
+DAY = timedelta(days=1)
+
+
+def merge_intervals(intervals: Iterable[tuple[date, date]]) -> list[tuple[date, date]]:
+    merged: list[tuple[date, date]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + DAY:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+
+    return merged
+
+
+def clip_intervals(intervals: Iterable[tuple[date, date]], start: date, end: date) -> list[tuple[date, date]]:
+    return [
+        (max(interval_start, start), min(interval_end, end))
+        for interval_start, interval_end in intervals
+        if interval_start <= end and interval_end >= start
+    ]
+
+
+def free_intervals(occupied: list[tuple[date, date]], start: date, end: date) -> list[tuple[date, date]]:
+    # Expects merged and clipped intervals
+    free = []
+    current = start
+    for occupied_start, occupied_end in occupied:
+        if occupied_start > current:
+            free.append((current, occupied_start - DAY))
+        current = occupied_end + DAY
+    if current <= end:
+        free.append((current, end))
+
+    return free
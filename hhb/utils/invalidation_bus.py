@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+from datetime import datetime, timedelta
+from time import monotonic
+from typing import Awaitable, Callable
+
+import logfire
+from tortoise import timezone
+
+from .. import config, models
+
+Handler = Callable[[int | None], Awaitable[None] | None]
+
+
+class InvalidationBus:
+    """
+    Tells other workers which cached entities were changed. Writes append CacheChange rows (published from model
+    signals), every worker polls rows created since its last poll and calls handlers subscribed to the entity type.
+    Changes made by this worker are evicted locally by the signals themselves, so they are not handled again.
+    """
+
+    _handlers: dict[str, list[Handler]] = {}
+    # Changes already handled inside overlap window, mapped to the time they were seen
+    _seen: dict[int, datetime] = {}
+    _watermark: datetime | None = None
+    _synced_at = 0.0
+    _pruned_at = 0.0
+    _task: asyncio.Task | None = None
+
+    _applied = logfire.metric_counter(
+        "cache_invalidation.applied", unit="1", description="Cache invalidations received from other workers",
+    )
+
+    @classmethod
+    def subscribe(cls, entity: str, handler: Handler) -> None:
+        cls._handlers.setdefault(entity, []).append(handler)
+
+    @classmethod
+    async def start(cls) -> None:
+        if not config.CACHE_INVALIDATION_ENABLED:
+            return
+
+        # Caches of a new worker are empty, so older changes are irrelevant for it
+        cls._watermark = timezone.now()
+        cls._seen = {}
+        cls._synced_at = cls._pruned_at = monotonic()
+        cls._task = asyncio.create_task(cls._loop())
+
+    @classmethod
+    async def stop(cls) -> None:
+        if cls._task is not None:
+            task, cls._task = cls._task, None
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        cls._watermark = None
+
+    @classmethod
+    async def publish(cls, entity: str, entity_id: int | None = None) -> None:
+        if cls._watermark is None:
+            return
+
+        change = await models.CacheChange.create(entity=entity, entity_id=entity_id)
+        cls._seen[change.id] = timezone.now()
+
+    @classmethod
+    async def _dispatch(cls, entity: str, entity_id: int | None) -> None:
+        for handler in cls._handlers.get(entity, ()):
+            if inspect.isawaitable(result := handler(entity_id)):
+                await result
+
+    @classmethod
+    async def _loop(cls) -> None:
+        while True:
+            await asyncio.sleep(config.CACHE_INVALIDATION_POLL_INTERVAL)
+            try:
+                await cls.poll()
+                if monotonic() - cls._pruned_at > config.CACHE_INVALIDATION_RETENTION:
+                    await cls.prune()
+            except Exception as e:  # pragma: no cover
+                logfire.exception("Failed to poll cache invalidations", _exc_info=e)
+
+    @classmethod
+    async def poll(cls) -> int:
+        started_at = timezone.now()
+        # Changes older than retention may be pruned already, so everything is evicted if worker fell that far behind
+        if monotonic() - cls._synced_at > config.CACHE_INVALIDATION_RETENTION:
+            logfire.warn("Cache invalidations were not polled for too long, evicting all cached entities")
+            for entity in cls._handlers:
+                await cls._dispatch(entity, None)
+
+        # Overlap covers changes committed late with earlier created_at and clock skew between workers
+        since = cls._watermark - timedelta(seconds=config.CACHE_INVALIDATION_OVERLAP)
+        changes = await models.CacheChange.filter(created_at__gte=since).order_by("id").values_list(
+            "id", "entity", "entity_id",
+        )
+
+        applied = 0
+        for change_id, entity, entity_id in changes:
+            if change_id in cls._seen:
+                continue
+            cls._seen[change_id] = started_at
+            await cls._dispatch(entity, entity_id)
+            applied += 1
+
+        cls._seen = {change_id: seen_at for change_id, seen_at in cls._seen.items() if seen_at >= since}
+        cls._watermark = started_at
+        cls._synced_at = monotonic()
+        if applied:
+            cls._applied.add(applied)
+
+        return applied
+
+    @classmethod
+    async def prune(cls) -> None:
+        cutoff = timezone.now() - timedelta(seconds=config.CACHE_INVALIDATION_RETENTION)
+        await models.CacheChange.filter(created_at__lt=cutoff).delete()
+        cls._pruned_at = monotonic()
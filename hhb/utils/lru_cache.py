@@ -0,0 +1,81 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import TypeVar, Generic, Hashable, Iterable
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self._max_size = max_size
+        self._ttl = ttl
+        self._items: OrderedDict[K, tuple[float, V, tuple[Hashable, ...]]] = OrderedDict()
+        # Keys by tag, so entries are evicted by tag without scanning the whole cache
+        self._tagged: dict[Hashable, set[K]] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: K) -> V | None:
+        if (item := self._items.get(key)) is None:
+            self.misses += 1
+            return
+
+        expires_at, value, _ = item
+        if expires_at < monotonic():
+            self._remove(key)
+            self.misses += 1
+            return
+
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: K, value: V, ttl: float | None = None, tags: Iterable[Hashable] = ()) -> None:
+        if self._max_size <= 0:
+            return
+
+        self._remove(key)
+        tags = tuple(tags)
+        self._items[key] = (monotonic() + (self._ttl if ttl is None else ttl), value, tags)
+        for tag in tags:
+            self._tagged.setdefault(tag, set()).add(key)
+
+        while len(self._items) > self._max_size:
+            self._remove(next(iter(self._items)))
+
+    def _remove(self, key: K) -> None:
+        if (item := self._items.pop(key, None)) is None:
+            return
+
+        for tag in item[2]:
+            if (keys := self._tagged.get(tag)) is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def delete(self, key: K) -> None:
+        self._remove(key)
+
+    def evict_tag(self, tag: Hashable) -> int:
+        keys = self._tagged.pop(tag, set())
+        for key in keys:
+            self._remove(key)
+
+        return len(keys)
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._tagged.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._items),
+            "max_size": self._max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import asyncio
+from bisect import insort, bisect_right
+from datetime import date, timedelta
+from time import monotonic
+
+import logfire
+from tortoise import timezone
+
+from .. import config, models
+
+
+class OccupancyIndex:
+    """
+    Optional in-process copy of active bookings, kept as per-room interval lists sorted by check-in.
+    Local changes are applied through Booking signals, changes made by other workers are pulled
+    from Booking.updated_at feed. Callers must fall back to SQL when index is not fresh.
+    """
+
+    _rooms: dict[int, list[tuple[date, date, int]]] = {}
+    _bookings: dict[int, tuple[int, date, date]] = {}
+    _loaded = False
+    _synced_at = 0.0
+    _reloaded_at = 0.0
+    _watermark = None
+    _task: asyncio.Task | None = None
+
+    _lag = logfire.metric_histogram(
+        "occupancy_index.refresh_time", unit="ms", description="Time spent pulling booking changes into the index",
+    )
+
+    @classmethod
+    async def start(cls) -> None:
+        if not config.OCCUPANCY_INDEX_ENABLED:
+            return
+
+        await cls.load()
+        cls._task = asyncio.create_task(cls._loop())
+
+    @classmethod
+    async def stop(cls) -> None:
+        if cls._task is not None:
+            task, cls._task = cls._task, None
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        cls._clear()
+
+    @classmethod
+    def _clear(cls) -> None:
+        cls._rooms = {}
+        cls._bookings = {}
+        cls._loaded = False
+        cls._watermark = None
+
+    @classmethod
+    def is_fresh(cls) -> bool:
+        return cls._loaded and monotonic() - cls._synced_at <= config.OCCUPANCY_INDEX_MAX_STALENESS
+
+    @classmethod
+    async def load(cls) -> None:
+        started_at = timezone.now()
+        rows = await models.Booking.filter(
+            status__in=models.ACTIVE_BOOKING_STATUSES, check_out__gte=date.today(),
+        ).values_list("id", "room_id", "check_in", "check_out")
+
+        cls._clear()
+        for booking_id, room_id, check_in, check_out in rows:
+            cls._add(booking_id, room_id, check_in, check_out)
+
+        cls._watermark = started_at
+        cls._loaded = True
+        cls._synced_at = cls._reloaded_at = monotonic()
+
+    @classmethod
+    async def _loop(cls) -> None:
+        while True:
+            await asyncio.sleep(config.OCCUPANCY_INDEX_POLL_INTERVAL)
+            try:
+                # Deleted bookings are not in the feed (bookings are cancelled instead), periodic full reload drops them
+                if monotonic() - cls._reloaded_at > config.OCCUPANCY_INDEX_RELOAD_INTERVAL:
+                    await cls.load()
+                else:
+                    await cls.refresh()
+            except Exception as e:  # pragma: no cover
+                logfire.exception("Failed to refresh occupancy index", _exc_info=e)
+
+    @classmethod
+    async def refresh(cls) -> None:
+        start = monotonic()
+        started_at = timezone.now()
+        # Overlap covers transactions that committed late with earlier updated_at and clock skew between workers
+        since = cls._watermark - timedelta(seconds=config.OCCUPANCY_INDEX_FEED_OVERLAP)
+        rows = await models.Booking.filter(updated_at__gte=since).values_list(
+            "id", "room_id", "check_in", "check_out", "status",
+        )
+        for booking_id, room_id, check_in, check_out, status in rows:
+            cls.apply(booking_id, room_id, check_in, check_out, status)
+
+        cls._watermark = started_at
+        cls._synced_at = monotonic()
+        cls._lag.record((cls._synced_at - start) * 1000)
+
+    @classmethod
+    def _add(cls, booking_id: int, room_id: int, check_in: date, check_out: date) -> None:
+        insort(cls._rooms.setdefault(room_id, []), (check_in, check_out, booking_id))
+        cls._bookings[booking_id] = (room_id, check_in, check_out)
+
+    @classmethod
+    def apply(
+            cls, booking_id: int, room_id: int, check_in: date, check_out: date, status: models.BookingStatus,
+    ) -> None:
+        if not cls._loaded:
+            return
+
+        cls.discard(booking_id)
+        if status in models.ACTIVE_BOOKING_STATUSES and check_out >= date.today():
+            cls._add(booking_id, room_id, check_in, check_out)
+
+    @classmethod
+    def discard(cls, booking_id: int) -> None:
+        if (booking := cls._bookings.pop(booking_id, None)) is None:
+            return
+
+        room_id, check_in, check_out = booking
+        intervals = cls._rooms[room_id]
+        intervals.remove((check_in, check_out, booking_id))
+        if not intervals:
+            del cls._rooms[room_id]
+
+    @classmethod
+    def is_free(cls, room_id: int, check_in: date, check_out: date) -> bool:
+        # Active bookings of one room never overlap (RoomSlot holds every day once), so intervals sorted by check-in
+        # are sorted by check-out too and only the last one starting before check_out can overlap.
+        # Same inclusive overlap as Booking.overlap_q
+        intervals = cls._rooms.get(room_id, ())
+        idx = bisect_right(intervals, (check_out, date.max, 0))
+        return idx == 0 or intervals[idx - 1][1] < check_in
+
+    @classmethod
+    def free_rooms(cls, room_ids: list[int], check_in: date, check_out: date) -> set[int] | None:
+        if not cls.is_fresh():
+            return None
+
+        return {room_id for room_id in room_ids if cls.is_free(room_id, check_in, check_out)}
+
+    @classmethod
+    def occupied_rooms(cls, check_in: date, check_out: date) -> set[int] | None:
+        # None is also returned when there are too many occupied rooms to pass them to database as a list
+        if not cls.is_fresh():
+            return None
+
+        occupied = set()
+        for room_id in cls._rooms:
+            if cls.is_free(room_id, check_in, check_out):
+                continue
+            if len(occupied) >= config.OCCUPANCY_INDEX_MAX_EXCLUDED_ROOMS:
+                return None
+            occupied.add(room_id)
+
+        return occupied
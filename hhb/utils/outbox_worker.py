@@ -0,0 +1,167 @@
+import asyncio
+import random
+from time import time
+
+import logfire
+from httpx import HTTPError
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import Q
+from tortoise.transactions import in_transaction
+
+from .multiple_errors_exception import MultipleErrorsException
+from .paypal import PayPal
+from .. import config
+from ..models import Booking, BookingStatus, Payment, RoomSlot, OutboxJob, OutboxJobStatus, OutboxJobKind
+
+
+class OutboxWorker:
+    _task: asyncio.Task | None = None
+    _wakeup: asyncio.Event | None = None
+    _semaphore: asyncio.Semaphore | None = None
+
+    @classmethod
+    def start(cls) -> None:
+        cls._wakeup = asyncio.Event()
+        cls._semaphore = asyncio.Semaphore(config.OUTBOX_CONCURRENCY)
+        cls._task = asyncio.create_task(cls._loop())
+
+    @classmethod
+    async def stop(cls) -> None:
+        if cls._task is None:
+            return
+
+        task, cls._task = cls._task, None
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    @classmethod
+    def notify(cls) -> None:
+        if cls._wakeup is not None:
+            cls._wakeup.set()
+
+    @classmethod
+    async def _loop(cls) -> None:
+        while True:
+            cls._wakeup.clear()
+            try:
+                await cls.drain()
+            except Exception as e:  # pragma: no cover
+                logfire.exception("Failed to process outbox jobs", _exc_info=e)
+
+            try:
+                await asyncio.wait_for(cls._wakeup.wait(), config.OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def _due_q(now: int) -> Q:
+        # Processing jobs with expired lock were claimed by a worker that died before finishing them
+        return (
+                Q(status=OutboxJobStatus.PENDING, run_after__lte=now)
+                | Q(status=OutboxJobStatus.PROCESSING, locked_until__lt=now)
+        )
+
+    @classmethod
+    async def _claim(cls) -> list[OutboxJob]:
+        now = int(time())
+        job_ids = await OutboxJob.filter(cls._due_q(now)).order_by("id").limit(config.OUTBOX_BATCH_SIZE)\
+            .values_list("id", flat=True)
+
+        claimed = []
+        for job_id in job_ids:
+            # Conditional update, other workers polling the same table can not claim the job twice
+            if await OutboxJob.filter(cls._due_q(now), id=job_id).update(
+                    status=OutboxJobStatus.PROCESSING, locked_until=now + config.OUTBOX_LOCK_TIMEOUT,
+            ):
+                claimed.append(job_id)
+
+        if not claimed:
+            return []
+        return await OutboxJob.filter(id__in=claimed).select_related("booking")
+
+    @classmethod
+    async def drain(cls) -> int:
+        if cls._semaphore is None:
+            cls._semaphore = asyncio.Semaphore(config.OUTBOX_CONCURRENCY)
+
+        processed = 0
+        while jobs := await cls._claim():
+            await asyncio.gather(*(cls._process(job) for job in jobs))
+            processed += len(jobs)
+
+        return processed
+
+    @classmethod
+    async def join(cls) -> None:
+        # Also waits for jobs claimed by other workers (or by background loop of this one)
+        while await OutboxJob.filter(
+                Q(status=OutboxJobStatus.PROCESSING) | Q(status=OutboxJobStatus.PENDING, run_after__lte=int(time()))
+        ).exists():
+            if not await cls.drain():
+                await asyncio.sleep(0.05)
+
+    @classmethod
+    async def _process(cls, job: OutboxJob) -> None:
+        if job.kind == OutboxJobKind.REFUND:
+            return await cls._refund(job)
+
+        booking = job.booking
+        if booking.status != BookingStatus.PENDING or await Payment.exists(booking=booking):
+            return await cls._set_status(job, OutboxJobStatus.DONE)
+
+        async with cls._semaphore:
+            try:
+                order_id = await PayPal.create(booking.total_price, request_id=f"booking-{booking.id}")
+            except (MultipleErrorsException, HTTPError) as e:
+                logfire.warn("Failed to create PayPal order for booking", booking_id=booking.id, _exc_info=e)
+                return await cls._retry(job)
+
+        try:
+            async with in_transaction():
+                await Payment.create(booking=booking, paypal_order_id=order_id)
+                await cls._set_status(job, OutboxJobStatus.DONE)
+        except IntegrityError:  # pragma: no cover
+            await cls._set_status(job, OutboxJobStatus.DONE)
+
+    @classmethod
+    async def _refund(cls, job: OutboxJob) -> None:
+        payment = await Payment.get_or_none(booking=job.booking)
+        if payment is None or payment.paypal_capture_id is None:  # pragma: no cover
+            return await cls._set_status(job, OutboxJobStatus.DONE)
+
+        async with cls._semaphore:
+            try:
+                refunded = await PayPal.refund(payment.paypal_capture_id, job.booking.total_price)
+            except (MultipleErrorsException, HTTPError) as e:
+                logfire.warn("Failed to refund PayPal capture for booking", booking_id=job.booking.id, _exc_info=e)
+                refunded = False
+
+        if not refunded:
+            return await cls._retry(job)
+        await cls._set_status(job, OutboxJobStatus.DONE)
+
+    @classmethod
+    async def _retry(cls, job: OutboxJob) -> None:
+        job.attempts += 1
+        if job.attempts < config.OUTBOX_ATTEMPTS:
+            delay = config.OUTBOX_RETRY_DELAY * 2 ** (job.attempts - 1)
+            job.run_after = int(time() + random.uniform(delay / 2, delay))
+            return await cls._set_status(job, OutboxJobStatus.PENDING)
+
+        if job.kind == OutboxJobKind.REFUND:  # pragma: no cover
+            logfire.error("Giving up on PayPal refund, it has to be issued manually", booking_id=job.booking.id)
+            return await cls._set_status(job, OutboxJobStatus.FAILED)
+
+        logfire.error("Giving up on PayPal order creation, cancelling booking", booking_id=job.booking.id)
+        async with in_transaction():
+            if (booking := await Booking.get_or_none(id=job.booking.id, status=BookingStatus.PENDING)) is not None:
+                booking.status = BookingStatus.CANCELLED
+                await booking.save(update_fields=["status"])
+            await RoomSlot.filter(booking_id=job.booking.id).delete()
+            await cls._set_status(job, OutboxJobStatus.FAILED)
+
+    @staticmethod
+    async def _set_status(job: OutboxJob, status: OutboxJobStatus) -> None:
+        job.status = status
+        job.locked_until = 0
+        await job.save(update_fields=["status", "attempts", "run_after", "locked_until"])
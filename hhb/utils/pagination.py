@@ -0,0 +1,71 @@
+import asyncio
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from typing import TypeVar, Hashable
+
+from tortoise import Model
+from tortoise.queryset import QuerySet
+
+from .count_cache import CountCache
+from .multiple_errors_exception import MultipleErrorsException
+from ..schemas.common import PaginationQuery
+
+M = TypeVar("M", bound=Model)
+PAGINATION_FIELDS = {"page", "page_size", "after", "with_count"}
+
+
+def encode_cursor(ordering: str, last_id: int) -> str:
+    payload = json.dumps({"o": ordering, "v": last_id}, separators=(",", ":")).encode("utf8")
+    return urlsafe_b64encode(payload).decode("utf8").rstrip("=")
+
+
+def decode_cursor(ordering: str, cursor: str) -> int:
+    try:
+        payload = json.loads(urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        assert payload["o"] == ordering
+        assert isinstance(payload["v"], int)
+    except (ValueError, TypeError, KeyError, AssertionError):
+        raise MultipleErrorsException("Invalid pagination cursor.")
+
+    return payload["v"]
+
+
+async def _count(query: PaginationQuery, db_query: QuerySet[M], count_cache: tuple[Hashable, ...] | None) -> int:
+    if count_cache is None:
+        return await db_query.count()
+
+    filters = query.model_dump(exclude_defaults=True, exclude=PAGINATION_FIELDS)
+    key = CountCache.make_key(*count_cache, filters=filters)
+    if (count := CountCache.get(key)) is None:
+        count = await db_query.count()
+        CountCache.set(key, count)
+
+    return count
+
+
+async def paginate(
+        query: PaginationQuery, db_query: QuerySet[M], ordering: str = "id", related: tuple[str, ...] = (),
+        count_cache: tuple[Hashable, ...] | None = None,
+) -> tuple[int | None, list[M], str | None]:
+    # Cursor mode seeks past the last returned id instead of offsetting, page mode is kept for old clients
+    page_query = db_query
+    if query.after is not None:
+        last_id = decode_cursor(ordering, query.after)
+        page_query = page_query.filter(**{"id__lt" if ordering.startswith("-") else "id__gt": last_id})
+    else:
+        page_query = page_query.offset((query.page - 1) * query.page_size)
+
+    if related:
+        page_query = page_query.select_related(*related)
+    page_query = page_query.order_by(ordering).limit(query.page_size)
+
+    if query.with_count:
+        count, items = await asyncio.gather(_count(query, db_query, count_cache), page_query)
+    else:
+        count, items = None, await page_query
+
+    next_cursor = None
+    if len(items) == query.page_size:
+        next_cursor = encode_cursor(ordering, items[-1].id)
+
+    return count, items, next_cursor
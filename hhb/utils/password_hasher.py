@@ -0,0 +1,81 @@
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from time import perf_counter
+
+import bcrypt
+import logfire
+
+from .multiple_errors_exception import MultipleErrorsException
+from .. import config
+
+
+def _hash(password: bytes, rounds: int) -> tuple[str, float]:
+    start = perf_counter()
+    result = bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode("utf8")
+    return result, perf_counter() - start
+
+
+def _check(password: bytes, hashed: bytes) -> tuple[bool, float]:
+    start = perf_counter()
+    result = bcrypt.checkpw(password, hashed)
+    return result, perf_counter() - start
+
+
+class PasswordHasher:
+    _executor: Executor | None = None
+    _in_flight = 0
+
+    _queue_wait = logfire.metric_histogram(
+        "password_hasher.queue_wait", unit="ms", description="Time spent waiting for a free hashing worker",
+    )
+    _hash_time = logfire.metric_histogram(
+        "password_hasher.hash_time", unit="ms", description="Time spent hashing or verifying a password",
+    )
+    _rejected = logfire.metric_counter(
+        "password_hasher.rejected", unit="1", description="Hashing requests rejected because the queue is full",
+    )
+
+    @classmethod
+    def _get_executor(cls) -> Executor:
+        if cls._executor is None:
+            if config.PASSWORD_HASHER_EXECUTOR == "process":  # pragma: no cover
+                cls._executor = ProcessPoolExecutor(max_workers=config.PASSWORD_HASHER_WORKERS)
+            else:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=config.PASSWORD_HASHER_WORKERS, thread_name_prefix="password-hasher",
+                )
+
+        return cls._executor
+
+    @classmethod
+    async def _run(cls, func, *args):
+        if cls._in_flight >= config.PASSWORD_HASHER_WORKERS + config.PASSWORD_HASHER_QUEUE_SIZE:
+            cls._rejected.add(1)
+            raise MultipleErrorsException("Server is busy, try again later.", 503)
+
+        cls._in_flight += 1
+        submitted_at = perf_counter()
+        try:
+            result, hash_time = await asyncio.get_running_loop().run_in_executor(cls._get_executor(), func, *args)
+        finally:
+            cls._in_flight -= 1
+
+        total_time = perf_counter() - submitted_at
+        cls._hash_time.record(hash_time * 1000)
+        cls._queue_wait.record(max(total_time - hash_time, 0) * 1000)
+
+        return result
+
+    @classmethod
+    async def hash(cls, password: str) -> str:
+        return await cls._run(_hash, password.encode("utf8"), config.BCRYPT_ROUNDS)
+
+    @classmethod
+    async def check(cls, password: str, hashed: str) -> bool:
+        return await cls._run(_check, password.encode("utf8"), hashed.encode("utf8"))
+
+    @classmethod
+    def shutdown(cls) -> None:
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False, cancel_futures=True)
+            cls._executor = None
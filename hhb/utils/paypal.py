@@ -1,121 +1,257 @@
+import asyncio
+from importlib.util import find_spec
+from typing import Mapping
 from time import time
+from uuid import uuid4
 
 import logfire
-from httpx import AsyncClient
+from httpx import AsyncClient, AsyncBaseTransport, Limits, Timeout, Response
 
+from .cache import Cache
 from .multiple_errors_exception import MultipleErrorsException
+from .resilience import ExternalService
 from .. import config
 
+HTTP2_AVAILABLE = find_spec("h2") is not None
+
 
 class PayPal:
     _access_token: str | None = None
     _access_token_expires_at: int = 0
+    _access_token_renew_at: int = 0
+    _refresh_lock: asyncio.Lock | None = None
+    _refresh_task: asyncio.Task | None = None
+    _client: AsyncClient | None = None
+    _service = ExternalService("PayPal")
 
     BASE = "https://api-m.sandbox.paypal.com"
     AUTHORIZE = f"{BASE}/v1/oauth2/token"
     CHECKOUT = f"{BASE}/v2/checkout/orders"
     CAPTURES = f"{BASE}/v2/payments/captures"
+    VERIFY_WEBHOOK = f"{BASE}/v1/notifications/verify-webhook-signature"
+
+    TIMEOUTS = {
+        "auth": Timeout(config.PAYPAL_AUTH_TIMEOUT, connect=config.PAYPAL_CONNECT_TIMEOUT),
+        "create": Timeout(config.PAYPAL_CREATE_TIMEOUT, connect=config.PAYPAL_CONNECT_TIMEOUT),
+        "capture": Timeout(config.PAYPAL_CAPTURE_TIMEOUT, connect=config.PAYPAL_CONNECT_TIMEOUT),
+        "refund": Timeout(config.PAYPAL_REFUND_TIMEOUT, connect=config.PAYPAL_CONNECT_TIMEOUT),
+        "verify_webhook": Timeout(config.PAYPAL_AUTH_TIMEOUT, connect=config.PAYPAL_CONNECT_TIMEOUT),
+    }
 
     @classmethod
-    async def _get_access_token(cls) -> str:
-        if cls._access_token is None or cls._access_token_expires_at < time():
-            async with AsyncClient() as client:
-                resp = await client.post(
-                    cls.AUTHORIZE,
-                    content="grant_type=client_credentials",
-                    auth=(config.PAYPAL_ID, config.PAYPAL_SECRET),
-                )
+    async def init_client(cls, transport: AsyncBaseTransport | None = None) -> None:
+        await cls.close_client()
+        cls._service.reset()
+        cls._refresh_lock = asyncio.Lock()
+        cls._client = AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=Limits(
+                max_connections=config.PAYPAL_MAX_CONNECTIONS,
+                max_keepalive_connections=config.PAYPAL_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=config.PAYPAL_KEEPALIVE_EXPIRY,
+            ),
+            transport=transport,
+        )
 
-                j = resp.json()
-                logfire.debug(f"Paypal token response", code=resp.status_code, body=j)
+    @classmethod
+    async def close_client(cls) -> None:
+        if cls._refresh_task is not None:
+            cls._refresh_task.cancel()
+            cls._refresh_task = None
+        if cls._client is not None:
+            client, cls._client = cls._client, None
+            await client.aclose()
 
-                if "access_token" not in j or "expires_in" not in j:
-                    raise MultipleErrorsException(
-                        "Failed to obtain PayPal access token!" if config.IS_DEBUG else "An error occurred with PayPal"
-                    )
+    @classmethod
+    async def _get_client(cls) -> AsyncClient:
+        if cls._client is None:
+            await cls.init_client()
+        return cls._client
+
+    @classmethod
+    async def _post(cls, url: str, operation: str, idempotent: bool = True, **kwargs) -> Response:
+        client = await cls._get_client()
+        return await cls._service.call(
+            lambda: client.post(url, timeout=cls.TIMEOUTS[operation], **kwargs), idempotent=idempotent,
+        )
+
+    @classmethod
+    async def _get_access_token(cls) -> str:
+        now = time()
+        if cls._access_token is None or cls._access_token_expires_at < now:
+            return await cls._refresh_access_token()
 
-                cls._access_token = j["access_token"]
-                cls._access_token_expires_at = time() + j["expires_in"]
+        if cls._access_token_renew_at < now and (cls._refresh_task is None or cls._refresh_task.done()):
+            cls._refresh_task = asyncio.create_task(cls._refresh_access_token())
+            cls._refresh_task.add_done_callback(cls._on_refresh_done)
 
         return cls._access_token
 
+    @staticmethod
+    def _on_refresh_done(task: asyncio.Task) -> None:
+        if not task.cancelled() and (exc := task.exception()) is not None:
+            logfire.error("Failed to renew PayPal access token in background", _exc_info=exc)
+
     @classmethod
-    async def create(cls, price: float, currency: str = "USD") -> str:
-        async with AsyncClient() as client:
-            resp = await client.post(
-                cls.CHECKOUT, headers={"Authorization": f"Bearer {await cls._get_access_token()}"},
-                json={
-                    "intent": "CAPTURE",
-                    "purchase_units": [{
-                        "amount": {
-                            "currency_code": currency,
-                            "value": f"{price:.2f}",
-                        },
-                    }],
-                },
+    async def _refresh_access_token(cls) -> str:
+        if cls._refresh_lock is None:
+            cls._refresh_lock = asyncio.Lock()
+
+        async with cls._refresh_lock:
+            # Token might have been renewed by another coroutine (or another worker) while we were waiting
+            if cls._access_token is not None and cls._access_token_renew_at > time():
+                return cls._access_token
+
+            stored = await Cache.get("paypal_token", config.PAYPAL_ID)
+            if stored is not None and stored["renew_at"] > time():
+                cls._set_access_token(stored["access_token"], stored["expires_at"], stored["renew_at"])
+                return cls._access_token
+
+            resp = await cls._post(
+                cls.AUTHORIZE,
+                content="grant_type=client_credentials",
+                auth=(config.PAYPAL_ID, config.PAYPAL_SECRET),
+                operation="auth",
             )
 
-            j_resp = resp.json()
-            logfire.debug(f"Paypal create order response", code=resp.status_code, body=j_resp)
+            j = resp.json()
+            logfire.debug(f"Paypal token response", code=resp.status_code, body=j)
 
-            if "id" not in j_resp:
-                logfire.error(
-                    f"Failed to create PayPal order!", paypal_code=resp.status_code, paypal_resp=j_resp,
-                )
+            if "access_token" not in j or "expires_in" not in j:
                 raise MultipleErrorsException(
-                    "Failed to create PayPal order!" if config.IS_DEBUG else "An error occurred with PayPal"
+                    "Failed to obtain PayPal access token!" if config.IS_DEBUG else "An error occurred with PayPal"
                 )
 
-            return j_resp["id"]
+            now = int(time())
+            expires_at = now + j["expires_in"]
+            renew_at = expires_at - min(config.PAYPAL_TOKEN_RENEW_MARGIN, j["expires_in"] // 2)
+            cls._set_access_token(j["access_token"], expires_at, renew_at)
+            # Token is shared with other workers only through cache, so it is never persisted in the database
+            await Cache.set("paypal_token", config.PAYPAL_ID, {
+                "access_token": j["access_token"], "expires_at": expires_at, "renew_at": renew_at,
+            }, ttl=max(1, renew_at - now))
+
+        return cls._access_token
 
     @classmethod
-    async def capture(cls, order_id: str) -> str | None:
-        async with AsyncClient() as client:
-            resp = await client.post(
-                f"{cls.CHECKOUT}/{order_id}/capture",
-                headers={"Authorization": f"Bearer {await cls._get_access_token()}"},
-                json={},
+    def _set_access_token(cls, token: str, expires_at: int, renew_at: int) -> None:
+        cls._access_token = token
+        cls._access_token_expires_at = expires_at
+        cls._access_token_renew_at = renew_at
+
+    @classmethod
+    async def create(cls, price: float, currency: str = "USD", request_id: str | None = None) -> str:
+        headers = {"Authorization": f"Bearer {await cls._get_access_token()}"}
+        if request_id is not None:
+            # PayPal returns the same order instead of creating a new one when request is retried with same id
+            headers["PayPal-Request-Id"] = request_id
+
+        resp = await cls._post(
+            cls.CHECKOUT, headers=headers,
+            json={
+                "intent": "CAPTURE",
+                "purchase_units": [{
+                    "amount": {
+                        "currency_code": currency,
+                        "value": f"{price:.2f}",
+                    },
+                }],
+            },
+            operation="create",
+            idempotent=request_id is not None,
+        )
+
+        j_resp = resp.json()
+        logfire.debug(f"Paypal create order response", code=resp.status_code, body=j_resp)
+
+        if "id" not in j_resp:
+            logfire.error(
+                f"Failed to create PayPal order!", paypal_code=resp.status_code, paypal_resp=j_resp,
+            )
+            raise MultipleErrorsException(
+                "Failed to create PayPal order!" if config.IS_DEBUG else "An error occurred with PayPal"
             )
 
-            j_resp = resp.json()
-            logfire.debug(f"Paypal capture response", code=resp.status_code, body=j_resp)
+        return j_resp["id"]
 
-            if resp.status_code >= 400 or j_resp["status"] != "COMPLETED":
-                logfire.error(
-                    f"Failed to capture PayPal!", paypal_code=resp.status_code, paypal_resp=j_resp,
-                )
-                return
+    @classmethod
+    async def capture(cls, order_id: str) -> str | None:
+        resp = await cls._post(
+            f"{cls.CHECKOUT}/{order_id}/capture",
+            headers={
+                "Authorization": f"Bearer {await cls._get_access_token()}",
+                # Id is shared only by retries of this call. PayPal replays response stored for the id,
+                # so a fixed one would keep returning ORDER_NOT_APPROVED after the order is approved
+                "PayPal-Request-Id": f"capture-{order_id}-{uuid4().hex}",
+            },
+            json={},
+            operation="capture",
+        )
 
-            try:
-                return j_resp["purchase_units"][0]["payments"]["captures"][0]["id"]
-            except (KeyError, IndexError):  # pragma: no cover
-                return
+        j_resp = resp.json()
+        logfire.debug(f"Paypal capture response", code=resp.status_code, body=j_resp)
+
+        if resp.status_code >= 400 or j_resp["status"] != "COMPLETED":
+            logfire.error(
+                f"Failed to capture PayPal!", paypal_code=resp.status_code, paypal_resp=j_resp,
+            )
+            return
+
+        try:
+            return j_resp["purchase_units"][0]["payments"]["captures"][0]["id"]
+        except (KeyError, IndexError):  # pragma: no cover
+            return
 
     @classmethod
     async def refund(cls, capture_id: str, amount: float, currency: str = "USD") -> bool:
-        async with AsyncClient() as client:
-            resp = await client.post(
-                f"{cls.CAPTURES}/{capture_id}/refund",
-                headers={"Authorization": f"Bearer {await cls._get_access_token()}"},
-                json={
-                    "amount": {
-                        "currency_code": currency,
-                        "value": f"{amount:.2f}",
-                    },
+        resp = await cls._post(
+            f"{cls.CAPTURES}/{capture_id}/refund",
+            headers={
+                "Authorization": f"Bearer {await cls._get_access_token()}",
+                "PayPal-Request-Id": f"refund-{capture_id}",
+            },
+            json={
+                "amount": {
+                    "currency_code": currency,
+                    "value": f"{amount:.2f}",
                 },
+            },
+            operation="refund",
+        )
+
+        j_resp = resp.json()
+        logfire.debug(f"Paypal refund response", code=resp.status_code, body=j_resp)
+
+        if resp.status_code >= 400 and j_resp.get("details") and \
+                j_resp["details"][0]["issue"] == "CAPTURE_FULLY_REFUNDED":
+            return True
+
+        success = resp.status_code < 400 and resp.json()["status"] == "COMPLETED"
+        if not success:
+            logfire.error(
+                f"Failed to request PayPal refund!", paypal_code=resp.status_code, paypal_resp=resp.json(),
             )
 
-            j_resp = resp.json()
-            logfire.debug(f"Paypal refund response", code=resp.status_code, body=j_resp)
+        return success
 
-            if resp.status_code >= 400 and j_resp.get("details") and \
-                    j_resp["details"][0]["issue"] == "CAPTURE_FULLY_REFUNDED":
-                return True
+    @classmethod
+    async def verify_webhook(cls, headers: Mapping[str, str], event: dict) -> bool:
+        resp = await cls._post(
+            cls.VERIFY_WEBHOOK,
+            headers={"Authorization": f"Bearer {await cls._get_access_token()}"},
+            json={
+                "auth_algo": headers.get("paypal-auth-algo"),
+                "cert_url": headers.get("paypal-cert-url"),
+                "transmission_id": headers.get("paypal-transmission-id"),
+                "transmission_sig": headers.get("paypal-transmission-sig"),
+                "transmission_time": headers.get("paypal-transmission-time"),
+                "webhook_id": config.PAYPAL_WEBHOOK_ID,
+                "webhook_event": event,
+            },
+            operation="verify_webhook",
+        )
 
-            success = resp.status_code < 400 and resp.json()["status"] == "COMPLETED"
-            if not success:
-                logfire.error(
-                    f"Failed to request PayPal refund!", paypal_code=resp.status_code, paypal_resp=resp.json(),
-                )
+        j_resp = resp.json()
+        logfire.debug(f"Paypal webhook verification response", code=resp.status_code, body=j_resp)
 
-            return success
\ No newline at end of file
+        return resp.status_code < 400 and j_resp.get("verification_status") == "SUCCESS"
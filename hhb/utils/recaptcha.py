@@ -0,0 +1,99 @@
+import asyncio
+from time import perf_counter
+
+import logfire
+from httpx import AsyncClient, AsyncBaseTransport, Limits, Timeout, HTTPError
+
+from .multiple_errors_exception import MultipleErrorsException
+from .resilience import ExternalService
+from .. import config
+
+
+class _QueueTimeout(asyncio.TimeoutError):
+    ...
+
+
+class ReCaptcha:
+    _client: AsyncClient | None = None
+    _semaphore: asyncio.Semaphore | None = None
+    _service = ExternalService("reCAPTCHA")
+
+    VERIFY = "https://www.google.com/recaptcha/api/siteverify"
+
+    _verify_time = logfire.metric_histogram(
+        "recaptcha.verify_time", unit="ms", description="Time spent verifying captcha, including waiting for a slot",
+    )
+    _degraded = logfire.metric_counter(
+        "recaptcha.degraded", unit="1", description="Captcha verifications that could not reach reCAPTCHA in time",
+    )
+
+    @classmethod
+    async def init_client(cls, transport: AsyncBaseTransport | None = None) -> None:
+        await cls.close_client()
+        cls._service.reset()
+        cls._semaphore = asyncio.Semaphore(config.RECAPTCHA_CONCURRENCY)
+        cls._client = AsyncClient(
+            limits=Limits(
+                max_connections=config.RECAPTCHA_CONCURRENCY,
+                max_keepalive_connections=config.RECAPTCHA_CONCURRENCY,
+            ),
+            timeout=Timeout(config.RECAPTCHA_DEADLINE_MS / 1000),
+            transport=transport,
+        )
+
+    @classmethod
+    async def close_client(cls) -> None:
+        if cls._client is not None:
+            client, cls._client = cls._client, None
+            await client.aclose()
+
+    @classmethod
+    async def _request(cls, token: str) -> bool:
+        if cls._client is None:
+            await cls.init_client()
+
+        # Deadline covers both waiting for a free slot and the request itself
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + config.RECAPTCHA_DEADLINE_MS / 1000
+        try:
+            await asyncio.wait_for(cls._semaphore.acquire(), config.RECAPTCHA_DEADLINE_MS / 1000)
+        except asyncio.TimeoutError:
+            # Slots are taken by other verifications, this says nothing about reCAPTCHA itself
+            raise _QueueTimeout
+
+        try:
+            # Captcha tokens are single-use, so verification request is never retried
+            resp = await asyncio.wait_for(cls._service.call(lambda: cls._client.post(cls.VERIFY, data={
+                "secret": config.RECAPTCHA_SECRET, "response": token,
+            })), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            cls._service.breaker.record_failure()
+            raise
+        finally:
+            cls._semaphore.release()
+
+        if ExternalService.is_failure(resp):
+            raise MultipleErrorsException("reCAPTCHA responded with an error.", 503)
+
+        return bool(resp.json().get("success"))
+
+    @classmethod
+    async def verify(cls, token: str) -> bool:
+        start = perf_counter()
+        outcome = "error"
+        try:
+            result = await cls._request(token)
+            outcome = "success" if result else "rejected"
+            return result
+        except (asyncio.TimeoutError, HTTPError, MultipleErrorsException, ValueError) as e:
+            if isinstance(e, _QueueTimeout):
+                outcome = "queue_timeout"
+            elif isinstance(e, asyncio.TimeoutError):
+                outcome = "timeout"
+            cls._degraded.add(1, {"outcome": outcome, "fail_open": config.RECAPTCHA_FAIL_OPEN})
+            logfire.warn("Captcha verification is degraded", outcome=outcome, fail_open=config.RECAPTCHA_FAIL_OPEN)
+            if config.RECAPTCHA_FAIL_OPEN:
+                return True
+            raise MultipleErrorsException("Captcha verification is not available now, try again later.", 503)
+        finally:
+            cls._verify_time.record((perf_counter() - start) * 1000, {"outcome": outcome})
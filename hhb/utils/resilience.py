@@ -0,0 +1,189 @@
+import asyncio
+import random
+from enum import IntEnum
+from time import monotonic
+from typing import Awaitable, Callable
+
+import logfire
+from httpx import Response, TransportError
+
+from .multiple_errors_exception import MultipleErrorsException
+from .. import config
+
+
+class BreakerState(IntEnum):
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+
+_breaker_state = logfire.metric_gauge(
+    "circuit_breaker.state", unit="1", description="Circuit breaker state (0 - closed, 1 - half-open, 2 - open)",
+)
+_breaker_rejected = logfire.metric_counter(
+    "circuit_breaker.rejected", unit="1", description="Calls rejected because circuit breaker is open",
+)
+_retries = logfire.metric_counter(
+    "external_service.retries", unit="1", description="Retried calls to external services",
+)
+_retries_denied = logfire.metric_counter(
+    "external_service.retries_denied", unit="1", description="Retries not made because retry budget is exhausted",
+)
+
+
+class ServiceUnavailableException(MultipleErrorsException):
+    def __init__(self, service: str):
+        super().__init__(f"{service} is temporarily unavailable, try again later.", 503)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._recovery_timeout = recovery_timeout
+        self.reset()
+
+    def reset(self) -> None:
+        self._state = BreakerState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        _breaker_state.set(self._state, {"service": self.name})
+
+    @property
+    def state(self) -> BreakerState:
+        if self._state == BreakerState.OPEN and monotonic() - self._opened_at >= self._recovery_timeout:
+            return BreakerState.HALF_OPEN
+        return self._state
+
+    def _set_state(self, state: BreakerState) -> None:
+        if state == self._state:
+            return
+
+        logfire.info("Circuit breaker state changed", service=self.name, old=self._state.name, new=state.name)
+        self._state = state
+        _breaker_state.set(state, {"service": self.name})
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == BreakerState.CLOSED:
+            return True
+        # Only one probe call is let through after recovery timeout, everything else still fails fast
+        if state == BreakerState.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            self._set_state(BreakerState.HALF_OPEN)
+            return True
+
+        _breaker_rejected.add(1, {"service": self.name})
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._probe_in_flight = False
+        self._set_state(BreakerState.CLOSED)
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probe_in_flight = False
+        if self._state == BreakerState.HALF_OPEN or self._failures >= self._failure_threshold:
+            self._opened_at = monotonic()
+            self._set_state(BreakerState.OPEN)
+
+    def release(self) -> None:
+        self._probe_in_flight = False
+
+
+class RetryBudget:
+    """
+    Allows retries only for a fraction of calls (plus a small constant rate),
+    so retries can not multiply load on a service that is already struggling.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, capacity: float):
+        self._ratio = ratio
+        self._min_per_second = min_per_second
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated_at = monotonic()
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._min_per_second)
+        self._updated_at = now
+
+    def deposit(self) -> None:
+        self._refill()
+        self._tokens = min(self._capacity, self._tokens + self._ratio)
+
+    def withdraw(self) -> bool:
+        self._refill()
+        if self._tokens < 1:
+            return False
+
+        self._tokens -= 1
+        return True
+
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    # "Full jitter": spreads retries of concurrent callers instead of retrying in lockstep
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class ExternalService:
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker(name, config.BREAKER_FAILURE_THRESHOLD, config.BREAKER_RECOVERY_TIMEOUT)
+        self.budget = self._new_budget()
+
+    @staticmethod
+    def _new_budget() -> RetryBudget:
+        return RetryBudget(
+            config.RETRY_BUDGET_PERCENT / 100, config.RETRY_BUDGET_MIN_PER_SECOND, config.RETRY_BUDGET_CAPACITY,
+        )
+
+    def reset(self) -> None:
+        self.breaker.reset()
+        self.budget = self._new_budget()
+
+    @staticmethod
+    def is_failure(response: Response) -> bool:
+        return response.status_code >= 500 or response.status_code == 429
+
+    def _can_retry(self, idempotent: bool, attempt: int) -> bool:
+        if not idempotent or attempt + 1 >= config.RETRY_ATTEMPTS:
+            return False
+        if not self.budget.withdraw():
+            _retries_denied.add(1, {"service": self.name})
+            return False
+
+        return True
+
+    async def call(self, func: Callable[[], Awaitable[Response]], idempotent: bool = False) -> Response:
+        self.budget.deposit()
+
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise ServiceUnavailableException(self.name)
+
+            try:
+                response = await func()
+            except TransportError:
+                self.breaker.record_failure()
+                if not self._can_retry(idempotent, attempt):
+                    raise
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                if not self.is_failure(response):
+                    self.breaker.record_success()
+                    return response
+
+                self.breaker.record_failure()
+                if not self._can_retry(idempotent, attempt):
+                    return response
+
+            _retries.add(1, {"service": self.name})
+            await asyncio.sleep(backoff(attempt, config.RETRY_BASE_DELAY_MS / 1000, config.RETRY_MAX_DELAY_MS / 1000))
+            attempt += 1
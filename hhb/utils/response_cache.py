@@ -0,0 +1,39 @@
+from typing import Any, Hashable
+
+import logfire
+
+from .lru_cache import LRUCache
+from .. import config
+
+
+class ResponseCache:
+    """
+    Serialized public responses with their ETags, keyed by (namespace, *parts). Model signals evict entries.
+    """
+
+    _cache: LRUCache[tuple, tuple[Any, str]] = LRUCache(config.RESPONSE_CACHE_SIZE, config.RESPONSE_CACHE_TTL)
+    _hits_counter = logfire.metric_counter("response_cache.hits", unit="1", description="Response cache hits")
+    _misses_counter = logfire.metric_counter("response_cache.misses", unit="1", description="Response cache misses")
+
+    @classmethod
+    def get(cls, namespace: str, *parts: Hashable) -> tuple[Any, str] | None:
+        cached = cls._cache.get((namespace, *parts))
+        if cached is None:
+            cls._misses_counter.add(1)
+        else:
+            cls._hits_counter.add(1)
+
+        return cached
+
+    @classmethod
+    def set(cls, key: tuple, payload: Any, etag: str) -> None:
+        # Tagged by every key prefix, so invalidation by (namespace, *parts) prefix does not scan the cache
+        cls._cache.set(key, (payload, etag), tags=[key[:idx] for idx in range(1, len(key) + 1)])
+
+    @classmethod
+    def invalidate(cls, namespace: str, *parts: Hashable) -> None:
+        cls._cache.evict_tag((namespace, *parts))
+
+    @classmethod
+    def clear(cls) -> None:
+        cls._cache.clear()
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from copy import copy
+from typing import TYPE_CHECKING
+
+import logfire
+
+from .lru_cache import LRUCache
+from .. import config
+
+if TYPE_CHECKING:  # pragma: no cover
+    from ..models import Session
+
+
+class SessionCache:
+    """
+    Entries are evicted by Session and User signals. Queryset updates and deletes do not fire signals,
+    so code changing sessions or users in bulk must call invalidate_session/invalidate_user itself.
+    """
+
+    _cache: LRUCache[tuple[int, str], Session] = LRUCache(config.SESSION_CACHE_SIZE, config.SESSION_CACHE_TTL)
+    _hits_counter = logfire.metric_counter("session_cache.hits", unit="1", description="Session cache hits")
+    _misses_counter = logfire.metric_counter("session_cache.misses", unit="1", description="Session cache misses")
+
+    @classmethod
+    def get(cls, session_id: int, nonce: str) -> Session | None:
+        session = cls._cache.get((session_id, nonce))
+        if session is None:
+            cls._misses_counter.add(1)
+            return
+
+        cls._hits_counter.add(1)
+        return cls._copy(session)
+
+    @staticmethod
+    def _copy(session: Session) -> Session:
+        # Every request gets its own copy, so changes made before save() are not seen by concurrent requests
+        session = copy(session)
+        session.user = copy(session.user)
+        return session
+
+    @classmethod
+    def set(cls, session: Session) -> None:
+        tags = (("session", session.id), ("user", session.user.id))
+        cls._cache.set((session.id, session.nonce), cls._copy(session), tags=tags)
+
+    @classmethod
+    def invalidate_session(cls, session_id: int) -> None:
+        cls._cache.evict_tag(("session", session_id))
+
+    @classmethod
+    def invalidate_user(cls, user_id: int) -> None:
+        cls._cache.evict_tag(("user", user_id))
+
+    @classmethod
+    def clear(cls) -> None:
+        cls._cache.clear()
+
+    @classmethod
+    def stats(cls) -> dict:
+        return cls._cache.stats()
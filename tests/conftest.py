@@ -10,6 +10,10 @@ from httpx import AsyncClient, Request, Response
 from hhb import config
 
 config.BCRYPT_ROUNDS = 4
+config.PAYPAL_CAPTURE_RETRY_DELAY = 0
+config.OUTBOX_RETRY_DELAY = 0
+config.RETRY_BASE_DELAY_MS = 0
+config.PAYPAL_WEBHOOK_ID = "WH-TEST"
 config.DB_CONNECTION_STRING = "sqlite://:memory:"
 config.RECAPTCHA_SECRET = "6LeIxAcTAAAAAGG-vFI1TnRWxMZNFuojJ4WifJWe"  # Google test key
 
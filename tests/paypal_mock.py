@@ -1,7 +1,9 @@
+import json
 from base64 import b64encode
 from time import time
+from uuid import uuid4
 
-from httpx import Request, Response
+from httpx import Request, Response, MockTransport
 
 from hhb import config
 
@@ -12,8 +14,11 @@ class PaypalMockState:
         self._client_secret = client_secret
         self._orders = {}
         self._captures = {}
+        self._sent_events = {}
+        self.auth_requests = 0
 
     def auth_callback(self, request: Request) -> Response:
+        self.auth_requests += 1
         auth = b64encode(f"{self._client_id}:{self._client_secret}".encode("utf8")).decode("utf8")
         if request.headers.get("authorization") != f"Basic {auth}":
             return Response(status_code=401, json={
@@ -41,6 +46,7 @@ class PaypalMockState:
             "payed": False,
             "refunded": False,
             "capture_id": None,
+            "amount": json.loads(request.content)["purchase_units"][0]["amount"]["value"],
         }
 
         return Response(status_code=200, json={
@@ -110,6 +116,89 @@ class PaypalMockState:
             "status": "COMPLETED",
         })
 
+    def verify_webhook_callback(self, request: Request) -> Response:
+        auth = b64encode(f"{self._client_id}/{self._client_secret}".encode("utf8")).decode("utf8")
+        if request.headers.get("authorization") != f"Bearer {auth}":
+            return Response(status_code=401, json={
+                "error": "invalid_client", "error_description": "Client Authentication failed"
+            })
+
+        body = json.loads(request.content)
+        transmission_id = body.get("transmission_id")
+        verified = (
+                body.get("webhook_id") == config.PAYPAL_WEBHOOK_ID
+                and transmission_id in self._sent_events
+                and self._sent_events[transmission_id] == body.get("webhook_event")
+        )
+
+        return Response(status_code=200, json={
+            "verification_status": "SUCCESS" if verified else "FAILURE",
+        })
+
+    def make_webhook_event(self, event_type: str, resource: dict, event_id: str | None = None) -> tuple[dict, dict]:
+        event = {
+            "id": event_id or f"WH-{uuid4().hex}",
+            "event_type": event_type,
+            "resource_type": event_type.split(".")[-2].lower(),
+            "resource": resource,
+        }
+        transmission_id = str(uuid4())
+        self._sent_events[transmission_id] = json.loads(json.dumps(event))
+
+        headers = {
+            "paypal-auth-algo": "SHA256withRSA",
+            "paypal-cert-url": "https://api.sandbox.paypal.com/v1/notifications/certs/CERT-test",
+            "paypal-transmission-id": transmission_id,
+            "paypal-transmission-sig": b64encode(transmission_id.encode("utf8")).decode("utf8"),
+            "paypal-transmission-time": "2024-10-22T09:01:50Z",
+        }
+
+        return headers, event
+
+    def order_approved_event(self, order_id: str) -> tuple[dict, dict]:
+        return self.make_webhook_event("CHECKOUT.ORDER.APPROVED", {"id": order_id, "status": "APPROVED"})
+
+    def capture_completed_event(self, order_id: str) -> tuple[dict, dict]:
+        self.mark_as_payed(order_id)
+        return self.make_webhook_event("PAYMENT.CAPTURE.COMPLETED", {
+            "id": self._orders[order_id]["capture_id"],
+            "status": "COMPLETED",
+            "supplementary_data": {"related_ids": {"order_id": order_id}},
+        })
+
+    def capture_refunded_event(self, capture_id: str, amount: str | None = None) -> tuple[dict, dict]:
+        captured = self._captures[capture_id]["amount"]
+        if amount is None or amount == captured:
+            amount = captured
+            self._captures[capture_id]["refunded"] = True
+        return self.make_webhook_event("PAYMENT.CAPTURE.REFUNDED", {
+            "id": str(time() * 1000),
+            "status": "COMPLETED",
+            "amount": {"currency_code": "USD", "value": amount},
+            "seller_payable_breakdown": {"total_refunded_amount": {"currency_code": "USD", "value": amount}},
+            "links": [{"rel": "up", "href": f"https://api.sandbox.paypal.com/v2/payments/captures/{capture_id}"}],
+        })
+
+    def handle_request(self, request: Request) -> Response:
+        path = request.url.path
+        if request.method != "POST":
+            return Response(status_code=405)
+        if path == "/v1/oauth2/token":
+            return self.auth_callback(request)
+        if path == "/v2/checkout/orders":
+            return self.order_callback(request)
+        if path.startswith("/v2/checkout/orders/") and path.endswith("/capture"):
+            return self.capture_callback(request)
+        if path.startswith("/v2/payments/captures/") and path.endswith("/refund"):
+            return self.refund_callback(request)
+        if path == "/v1/notifications/verify-webhook-signature":
+            return self.verify_webhook_callback(request)
+
+        return Response(status_code=404, json={"error": "not_found", "error_description": ""})
+
+    def transport(self) -> MockTransport:
+        return MockTransport(self.handle_request)
+
     def mark_as_payed(self, order_id: str) -> None:
         if order_id not in self._orders:
             return
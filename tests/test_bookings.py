@@ -1,16 +1,21 @@
+import asyncio
 import re
-from datetime import date, timedelta
+from datetime import date, timedelta, datetime, timezone
 from time import time
 
 import pytest
-from httpx import AsyncClient
+from httpx import AsyncClient, Response, Request, MockTransport
 from pytest_httpx import HTTPXMock
 
 from hhb import config
-from hhb.models import Hotel, Room, BookingStatus, Booking, UserRole
+from hhb.models import Hotel, Room, BookingStatus, Booking, UserRole, RoomSlot, OutboxJob, OutboxJobStatus, Payment, \
+    Session, OutboxJobKind
 from hhb.schemas.bookings import BookingType
+from hhb.utils.capture_worker import CaptureWorker
+from hhb.utils.expiry_sweeper import ExpirySweeper
+from hhb.utils.outbox_worker import OutboxWorker
 from hhb.utils.paypal import PayPal
-from tests.conftest import create_token
+from tests.conftest import create_token, create_user
 from tests.paypal_mock import PaypalMockState
 
 
@@ -40,6 +45,16 @@ async def check_bookings_counts(
         assert len(response.json()["result"]) == count
 
 
+async def get_booking_after_capture(client: AsyncClient, token: str, booking_id: int) -> Response:
+    # Approval is reported by CHECKOUT.ORDER.APPROVED webhook, capture is not attempted before it
+    await Payment.filter(booking_id=booking_id).update(approved=True)
+    response = await client.get(f"/bookings/{booking_id}", headers={"authorization": token})
+    assert response.status_code == 200, response.json()
+    await CaptureWorker.join()
+
+    return await client.get(f"/bookings/{booking_id}", headers={"authorization": token})
+
+
 @httpx_mock_decorator
 @pytest.mark.asyncio
 async def test_full_booking_process(client: AsyncClient, httpx_mock: HTTPXMock):
@@ -72,13 +87,14 @@ async def test_full_booking_process(client: AsyncClient, httpx_mock: HTTPXMock):
     assert response.status_code == 200, response.json()
     assert response.json()["payment_id"] is not None
     assert response.json()["status"] == BookingStatus.PENDING
+    assert not response.json()["capture_in_progress"]
 
     response = await client.get(f"/bookings/{booking_id}/verification-token", headers={"authorization": token})
     assert response.status_code == 400, response.json()
 
     mock_state.mark_as_payed(payment_id)
 
-    response = await client.get(f"/bookings/{booking_id}", headers={"authorization": token})
+    response = await get_booking_after_capture(client, token, booking_id)
     assert response.status_code == 200, response.json()
     assert response.json()["payment_id"] is not None
     assert response.json()["status"] == BookingStatus.CONFIRMED
@@ -92,6 +108,9 @@ async def test_full_booking_process(client: AsyncClient, httpx_mock: HTTPXMock):
 
     response = await client.post(f"/bookings/{booking_id}/cancel", headers={"authorization": token})
     assert response.status_code == 204, response.json()
+    await OutboxWorker.join()
+    assert (await OutboxJob.get(booking_id=booking_id, kind=OutboxJobKind.REFUND)).status == OutboxJobStatus.DONE
+    assert [request for request in httpx_mock.get_requests() if request.url.path.endswith("/refund")]
 
     await check_bookings_counts(client, token, 0, 0, 1, 0)
 
@@ -127,7 +146,7 @@ async def test_booking_cancel_twice(client: AsyncClient, httpx_mock: HTTPXMock):
 
     mock_state.mark_as_payed(payment_id)
 
-    response = await client.get(f"/bookings/{booking_id}", headers={"authorization": token})
+    response = await get_booking_after_capture(client, token, booking_id)
     assert response.status_code == 200, response.json()
     assert response.json()["payment_id"] is not None
     assert response.json()["status"] == BookingStatus.CONFIRMED
@@ -224,7 +243,7 @@ async def test_booking_verify_cancelled(client: AsyncClient, httpx_mock: HTTPXMo
 
     mock_state.mark_as_payed(payment_id)
 
-    response = await client.get(f"/bookings/{booking_id}", headers={"authorization": token})
+    response = await get_booking_after_capture(client, token, booking_id)
     assert response.status_code == 200, response.json()
     assert response.json()["payment_id"] is not None
     assert response.json()["status"] == BookingStatus.CONFIRMED
@@ -266,6 +285,16 @@ async def test_booking_invalid_dates(client: AsyncClient):
     )
     assert response.status_code == 400, response.json()
 
+    response = await client.post(
+        f"/bookings", headers={"authorization": token}, json={
+            "room_id": 123123,
+            "check_in": str(date.today() + timedelta(days=1)),
+            "check_out": str(date.today() + timedelta(days=1 + config.MAX_BOOKING_DAYS + 1)),
+        },
+    )
+    assert response.status_code == 400, response.json()
+    assert response.json()["errors"] == [f"Booking cannot be longer than {config.MAX_BOOKING_DAYS} days."]
+
 
 @pytest.mark.skipif(not config.IS_DEBUG, reason="Not debug")
 @httpx_mock_decorator
@@ -365,7 +394,7 @@ async def test_booking_verification(client: AsyncClient, httpx_mock: HTTPXMock):
     payment_id = response.json()["payment_id"]
     mock_state.mark_as_payed(payment_id)
 
-    response = await client.get(f"/bookings/{booking_id}", headers={"authorization": token})
+    response = await get_booking_after_capture(client, token, booking_id)
     assert response.status_code == 200, response.json()
     assert response.json()["payment_id"] is not None
     assert response.json()["status"] == BookingStatus.CONFIRMED
@@ -384,3 +413,240 @@ async def test_booking_verification(client: AsyncClient, httpx_mock: HTTPXMock):
     assert response.status_code == 200, response.json()
     assert response.json()["id"] == booking_id
     assert response.json()["room"]["id"] == room.id
+
+
+@pytest.mark.asyncio
+async def test_booking_with_paypal_mock_transport(client: AsyncClient):
+    mock_state = PaypalMockState()
+    await PayPal.init_client(mock_state.transport())
+
+    token = await create_token()
+    hotel = await Hotel.create(name="test", address="test address")
+    room = await Room.create(hotel=hotel, type="test", price=123)
+
+    response = await client.post(
+        f"/bookings", headers={"authorization": token}, json={
+            "room_id": room.id,
+            "check_in": str(date.today() + timedelta(days=1)),
+            "check_out": str(date.today() + timedelta(days=7)),
+        },
+    )
+    assert response.status_code == 200, response.json()
+    booking_id = response.json()["id"]
+    mock_state.mark_as_payed(response.json()["payment_id"])
+
+    response = await get_booking_after_capture(client, token, booking_id)
+    assert response.status_code == 200, response.json()
+    assert response.json()["status"] == BookingStatus.CONFIRMED
+
+    response = await client.post(f"/bookings/{booking_id}/cancel", headers={"authorization": token})
+    assert response.status_code == 204, response.json()
+
+
+@pytest.mark.asyncio
+async def test_booking_concurrent_requests_for_same_dates(client: AsyncClient):
+    mock_state = PaypalMockState()
+    await PayPal.init_client(mock_state.transport())
+
+    tokens = [await create_token() for _ in range(5)]
+    hotel = await Hotel.create(name="test", address="test address")
+    room = await Room.create(hotel=hotel, type="test", price=123)
+
+    responses = await asyncio.gather(*[
+        client.post(
+            f"/bookings", headers={"authorization": token}, json={
+                "room_id": room.id,
+                "check_in": str(date.today() + timedelta(days=1 + idx)),
+                "check_out": str(date.today() + timedelta(days=7 + idx)),
+            },
+        )
+        for idx, token in enumerate(tokens)
+    ])
+    assert sorted(response.status_code for response in responses) == [200, 400, 400, 400, 400]
+    booking = next(response.json() for response in responses if response.status_code == 200)
+    assert await RoomSlot.filter(room=room).count() == 7
+
+    owner_token = tokens[[response.status_code for response in responses].index(200)]
+    response = await client.post(f"/bookings/{booking['id']}/cancel", headers={"authorization": owner_token})
+    assert response.status_code == 204, response.json()
+    assert await RoomSlot.filter(room=room).count() == 0
+
+    response = await client.post(
+        f"/bookings", headers={"authorization": tokens[0]}, json={
+            "room_id": room.id,
+            "check_in": str(booking["check_in"]),
+            "check_out": str(booking["check_out"]),
+        },
+    )
+    assert response.status_code == 200, response.json()
+
+
+@pytest.mark.asyncio
+async def test_booking_outbox_mode(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(config, "PAYPAL_ORDER_MODE", "outbox")
+    mock_state = PaypalMockState()
+    await PayPal.init_client(mock_state.transport())
+
+    token = await create_token()
+    hotel = await Hotel.create(name="test", address="test address")
+    room = await Room.create(hotel=hotel, type="test", price=123)
+
+    response = await client.post(
+        f"/bookings", headers={"authorization": token}, json={
+            "room_id": room.id,
+            "check_in": str(date.today() + timedelta(days=1)),
+            "check_out": str(date.today() + timedelta(days=7)),
+        },
+    )
+    assert response.status_code == 200, response.json()
+    assert response.json()["payment_id"] is None
+    assert response.json()["status"] == BookingStatus.PENDING
+    booking_id = response.json()["id"]
+    assert await OutboxJob.filter(booking__id=booking_id).exists()
+
+    await OutboxWorker.join()
+    job = await OutboxJob.get(booking__id=booking_id)
+    assert job.status == OutboxJobStatus.DONE
+
+    response = await client.get(f"/bookings/{booking_id}", headers={"authorization": token})
+    assert response.status_code == 200, response.json()
+    payment_id = response.json()["payment_id"]
+    assert payment_id is not None
+
+    mock_state.mark_as_payed(payment_id)
+    response = await get_booking_after_capture(client, token, booking_id)
+    assert response.status_code == 200, response.json()
+    assert response.json()["status"] == BookingStatus.CONFIRMED
+
+
+@pytest.mark.asyncio
+async def test_booking_outbox_mode_paypal_failure(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(config, "PAYPAL_ORDER_MODE", "outbox")
+    mock_state = PaypalMockState()
+
+    def handle_request(request: Request) -> Response:
+        if request.url.path == "/v2/checkout/orders":
+            return Response(status_code=500, json={"name": "INTERNAL_SERVER_ERROR"})
+        return mock_state.handle_request(request)
+
+    await PayPal.init_client(MockTransport(handle_request))
+
+    token = await create_token()
+    hotel = await Hotel.create(name="test", address="test address")
+    room = await Room.create(hotel=hotel, type="test", price=123)
+
+    response = await client.post(
+        f"/bookings", headers={"authorization": token}, json={
+            "room_id": room.id,
+            "check_in": str(date.today() + timedelta(days=1)),
+            "check_out": str(date.today() + timedelta(days=7)),
+        },
+    )
+    assert response.status_code == 200, response.json()
+    booking_id = response.json()["id"]
+
+    await OutboxWorker.join()
+    job = await OutboxJob.get(booking__id=booking_id)
+    assert job.status == OutboxJobStatus.FAILED
+    assert job.attempts == config.OUTBOX_ATTEMPTS
+
+    response = await client.get(f"/bookings/{booking_id}", headers={"authorization": token})
+    assert response.status_code == 200, response.json()
+    assert response.json()["status"] == BookingStatus.CANCELLED
+    assert response.json()["payment_id"] is None
+    assert await RoomSlot.filter(booking__id=booking_id).count() == 0
+
+
+@pytest.mark.asyncio
+async def test_pending_booking_expiry(client: AsyncClient):
+    mock_state = PaypalMockState()
+    await PayPal.init_client(mock_state.transport())
+
+    token = await create_token()
+    hotel = await Hotel.create(name="test", address="test address")
+    room = await Room.create(hotel=hotel, type="test", price=123)
+
+    booking_ids = []
+    for idx in range(3):
+        response = await client.post(
+            f"/bookings", headers={"authorization": token}, json={
+                "room_id": room.id,
+                "check_in": str(date.today() + timedelta(days=1 + idx * 10)),
+                "check_out": str(date.today() + timedelta(days=7 + idx * 10)),
+            },
+        )
+        assert response.status_code == 200, response.json()
+        booking_ids.append(response.json()["id"])
+
+    expired_id, paid_id, fresh_id = booking_ids
+    mock_state.mark_as_payed((await Payment.get(booking__id=paid_id)).paypal_order_id)
+    await Booking.filter(id__in=[expired_id, paid_id]).update(
+        created_at=datetime.now(timezone.utc) - timedelta(seconds=config.PENDING_BOOKING_TTL + 60),
+    )
+
+    assert await ExpirySweeper.sweep() == 1
+
+    assert (await Booking.get(id=expired_id)).status == BookingStatus.CANCELLED
+    assert (await Booking.get(id=paid_id)).status == BookingStatus.CONFIRMED
+    assert (await Booking.get(id=fresh_id)).status == BookingStatus.PENDING
+    assert await RoomSlot.filter(booking__id=expired_id).count() == 0
+
+    response = await client.post(
+        f"/bookings", headers={"authorization": token}, json={
+            "room_id": room.id,
+            "check_in": str(date.today() + timedelta(days=1)),
+            "check_out": str(date.today() + timedelta(days=7)),
+        },
+    )
+    assert response.status_code == 200, response.json()
+
+    assert await ExpirySweeper.sweep() == 0
+
+    # Booking claimed by sweeper of another worker is left to it
+    claimed_id = response.json()["id"]
+    await Booking.filter(id=claimed_id).update(
+        created_at=datetime.now(timezone.utc) - timedelta(seconds=config.PENDING_BOOKING_TTL + 60),
+        sweep_locked_until=int(time() + 60),
+    )
+    assert await ExpirySweeper.sweep() == 0
+    assert (await Booking.get(id=claimed_id)).status == BookingStatus.PENDING
+
+    await Booking.filter(id=claimed_id).update(sweep_locked_until=int(time() - 1))
+    assert await ExpirySweeper.sweep() == 1
+    assert (await Booking.get(id=claimed_id)).status == BookingStatus.CANCELLED
+
+
+@pytest.mark.asyncio
+async def test_list_bookings_payment_ids(client: AsyncClient):
+    mock_state = PaypalMockState()
+    await PayPal.init_client(mock_state.transport())
+
+    user = await create_user()
+    token = (await Session.create(user=user)).to_jwt()
+    hotel = await Hotel.create(name="test", address="test address")
+    room = await Room.create(hotel=hotel, type="test", price=123)
+
+    for idx in range(3):
+        response = await client.post(
+            f"/bookings", headers={"authorization": token}, json={
+                "room_id": room.id,
+                "check_in": str(date.today() + timedelta(days=1 + idx * 10)),
+                "check_out": str(date.today() + timedelta(days=7 + idx * 10)),
+            },
+        )
+        assert response.status_code == 200, response.json()
+
+    # PayPal order is not created yet
+    unpaid = await Booking.create(
+        user=user, room=room, check_in=date.today() + timedelta(days=40), check_out=date.today() + timedelta(days=41),
+        total_price=123,
+    )
+
+    response = await client.get(f"/bookings", headers={"authorization": token})
+    assert response.status_code == 200, response.json()
+    result = response.json()["result"]
+
+    payments = dict(await Payment.filter(booking__room=room).values_list("booking_id", "paypal_order_id"))
+    assert len(payments) == 3
+    assert len(set(payments.values())) == 3
+    assert {booking["id"]: booking["payment_id"] for booking in result} == {**payments, unpaid.id: None}
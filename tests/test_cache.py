@@ -0,0 +1,223 @@
+import asyncio
+import socket
+
+import pytest
+import pytest_asyncio
+from fakeredis import FakeServer, FakeAsyncRedis
+from httpx import AsyncClient
+
+from hhb import config
+from hhb.models import Hotel, CacheChange, Session, UserRole
+from hhb.utils.cache import Cache, RedisCacheBackend, MemoryCacheBackend
+from hhb.utils.invalidation_bus import InvalidationBus
+from hhb.utils.lru_cache import LRUCache
+from hhb.utils.resilience import BreakerState
+from tests.conftest import create_token
+
+
+@pytest.fixture
+def redis_server() -> FakeServer:
+    return FakeServer()
+
+
+@pytest_asyncio.fixture(params=["memory", "redis"])
+async def cache_backend(request, client: AsyncClient, redis_server: FakeServer) -> str:
+    if request.param == "redis":
+        await Cache.init(RedisCacheBackend(FakeAsyncRedis(server=redis_server)))
+    else:
+        await Cache.init(MemoryCacheBackend(100))
+    yield request.param
+    await Cache.init()
+
+
+def test_lru_cache_evict_tag():
+    cache = LRUCache(3, 60)
+    cache.set("a", 1, tags=("x", "y"))
+    cache.set("b", 2, tags=("x",))
+    cache.set("c", 3)
+
+    assert cache.evict_tag("x") == 2
+    assert cache.get("a") is None and cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.evict_tag("y") == 0
+
+    # Keys pushed out by size limit or overwritten are dropped from their tags
+    cache.set("d", 4, tags=("z",))
+    cache.set("e", 5, tags=("z",))
+    cache.set("f", 6, tags=("z",))
+    cache.set("f", 6)
+    assert len(cache) == 3
+    assert cache.evict_tag("z") == 2
+    assert cache.get("f") == 6
+    assert cache._tagged == {}
+
+
+@pytest.mark.asyncio
+async def test_cache_get_set(cache_backend: str):
+    assert await Cache.get("hotels", "1") is None
+
+    await Cache.set("hotels", "1", {"id": 1, "name": "test"})
+    await Cache.set_many("hotels", {"2": {"id": 2}, "3": [1, 2, 3]})
+    await Cache.set("rooms", "1", "room")
+
+    assert await Cache.get("hotels", "1") == {"id": 1, "name": "test"}
+    assert await Cache.get_many("hotels", ["1", "2", "3", "4"]) == {
+        "1": {"id": 1, "name": "test"}, "2": {"id": 2}, "3": [1, 2, 3],
+    }
+    assert await Cache.get("rooms", "1") == "room"
+
+    await Cache.delete("hotels", "1", "2")
+    assert await Cache.get_many("hotels", ["1", "2", "3"]) == {"3": [1, 2, 3]}
+    assert await Cache.get("rooms", "1") == "room"
+
+
+@pytest.mark.asyncio
+async def test_cache_ttl(cache_backend: str):
+    await Cache.set("hotels", "1", 1, ttl=0.05)
+    await Cache.set("hotels", "2", 2, ttl=10)
+    assert await Cache.get_many("hotels", ["1", "2"]) == {"1": 1, "2": 2}
+
+    await asyncio.sleep(0.1)
+    assert await Cache.get_many("hotels", ["1", "2"]) == {"2": 2}
+
+
+@pytest.mark.asyncio
+async def test_cache_get_or_set_single_flight(cache_backend: str):
+    calls = 0
+
+    async def _factory():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"value": calls}
+
+    results = await asyncio.gather(*(Cache.get_or_set("hotels", "1", _factory) for _ in range(10)))
+    assert results == [{"value": 1}] * 10
+    assert calls == 1
+
+    assert await Cache.get_or_set("hotels", "1", _factory) == {"value": 1}
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_get_or_set_waits_for_other_worker(
+        client: AsyncClient, redis_server: FakeServer, monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(config, "CACHE_LOCK_POLL_MS", 10)
+    other_worker = RedisCacheBackend(FakeAsyncRedis(server=redis_server))
+    await Cache.init(RedisCacheBackend(FakeAsyncRedis(server=redis_server)))
+
+    calls = 0
+
+    async def _factory():
+        nonlocal calls
+        calls += 1
+        return "loaded here"
+
+    # Other worker is already loading the value
+    assert await other_worker.add("hhb:hotels:1:lock", b"1", 10)
+    task = asyncio.create_task(Cache.get_or_set("hotels", "1", _factory))
+    await asyncio.sleep(0.05)
+    assert not task.done()
+
+    await other_worker.set_many({"hhb:hotels:1": b"\"loaded by other worker\""}, 10)
+    assert await task == "loaded by other worker"
+    assert calls == 0
+
+    await other_worker.close()
+    await Cache.init()
+
+
+@pytest.mark.asyncio
+async def test_cache_redis_shared_between_workers(client: AsyncClient, redis_server: FakeServer):
+    other_worker = RedisCacheBackend(FakeAsyncRedis(server=redis_server))
+    await Cache.init(RedisCacheBackend(FakeAsyncRedis(server=redis_server)))
+
+    await Cache.set_many("hotels", {str(i): i for i in range(10)}, ttl=60)
+    keys = [f"{config.CACHE_KEY_PREFIX}:hotels:{i}" for i in range(10)]
+    assert await other_worker.get_many(keys) == [str(i).encode("utf8") for i in range(10)]
+
+    await other_worker.delete(keys[:5])
+    assert await Cache.get_many("hotels", [str(i) for i in range(10)]) == {str(i): i for i in range(5, 10)}
+
+    await other_worker.close()
+    await Cache.init()
+
+
+def test_cache_redis_from_url():
+    backend = RedisCacheBackend.from_url("redis://:test-password@127.0.0.1:6380/2", 4, 0.5)
+    pool = backend._redis.connection_pool
+    assert pool.max_connections == 4
+    assert pool.connection_kwargs["db"] == 2
+    assert pool.connection_kwargs["password"] == "test-password"
+    assert pool.connection_kwargs["socket_timeout"] == 0.5
+
+
+@pytest.mark.asyncio
+async def test_cache_redis_unavailable(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    backend = RedisCacheBackend.from_url(f"redis://127.0.0.1:{port}/0", 4, 1)
+    await Cache.init(backend)
+
+    async def _factory():
+        return "value"
+
+    assert await Cache.get("hotels", "1") is None
+    await Cache.set("hotels", "1", "value")
+    assert await Cache.get_or_set("hotels", "1", _factory) == "value"
+
+    for _ in range(config.BREAKER_FAILURE_THRESHOLD):
+        await Cache.get("hotels", "1")
+    assert backend.breaker.state == BreakerState.OPEN
+
+    await Cache.init()
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidation_from_other_worker(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(config, "CACHE_INVALIDATION_ENABLED", True)
+    monkeypatch.setattr(config, "CACHE_INVALIDATION_POLL_INTERVAL", 3600)
+    await InvalidationBus.start()
+
+    token = await create_token(UserRole.GLOBAL_ADMIN)
+    hotel = await Hotel.create(name="test", address="test address")
+    assert await InvalidationBus.poll() == 0
+
+    response = await client.get(f"/hotels/{hotel.id}")
+    assert response.status_code == 200, response.json()
+    assert (await client.get("/user/info", headers={"authorization": token})).status_code == 200
+
+    # Writes made by another worker do not fire signals in this one
+    await Hotel.filter(id=hotel.id).update(name="changed", version=2)
+    await CacheChange.create(entity="hotel", entity_id=hotel.id)
+    session = await Session.filter().order_by("-id").first()
+    await Session.filter(id=session.id).delete()
+    await CacheChange.create(entity="session", entity_id=session.id)
+
+    response = await client.get(f"/hotels/{hotel.id}")
+    assert response.json()["name"] == "test"
+    assert (await client.get("/user/info", headers={"authorization": token})).status_code == 200
+
+    assert await InvalidationBus.poll() == 2
+    assert await InvalidationBus.poll() == 0
+
+    response = await client.get(f"/hotels/{hotel.id}")
+    assert response.json()["name"] == "changed"
+    assert response.headers["etag"] == f"\"hotel-{hotel.id}-2\""
+    response = await client.get("/hotels/suggest", params={"prefix": "chan"})
+    assert response.json() == [{"id": hotel.id, "name": "changed"}]
+    assert (await client.get("/user/info", headers={"authorization": token})).status_code == 401
+
+    # Changes made by this worker are already evicted by signals
+    token = await create_token(UserRole.GLOBAL_ADMIN)
+    response = await client.patch(f"/admin/hotels/{hotel.id}", headers={"authorization": token}, json={
+        "name": "test123",
+    })
+    assert response.status_code == 200, response.json()
+    assert await CacheChange.filter(entity="hotel", entity_id=hotel.id).count() == 3
+    assert await InvalidationBus.poll() == 0
+
+    await InvalidationBus.stop()
@@ -2,6 +2,7 @@ import pytest
 from httpx import AsyncClient
 
 from hhb.models import UserRole, Hotel, HotelAdmin, Session
+from hhb.utils.hotel_admin_cache import HotelAdminCache
 from tests.conftest import create_token, create_user
 
 
@@ -416,3 +417,36 @@ async def test_get_all_hotel_admin_hotels(client: AsyncClient):
     assert response.status_code == 200, response.json()
     assert response.json()["count"] == 1
     assert len(response.json()["result"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_hotel_admin_membership_cache(client: AsyncClient):
+    global_token = await create_token(UserRole.GLOBAL_ADMIN)
+    admin = await create_user(UserRole.USER)
+    admin_token = (await Session.create(user=admin)).to_jwt()
+    hotel = await Hotel.create(name="test", address="test address")
+
+    response = await client.get(f"/admin/hotels/{hotel.id}/rooms", headers={"authorization": admin_token})
+    assert response.status_code == 403, response.json()
+
+    response = await client.post(f"/admin/hotels/{hotel.id}/admins", headers={"authorization": global_token}, json={
+        "user_id": admin.id,
+        "role": UserRole.ROOM_ADMIN,
+    })
+    assert response.status_code == 200, response.json()
+
+    response = await client.get(f"/admin/hotels/{hotel.id}/rooms", headers={"authorization": admin_token})
+    assert response.status_code == 200, response.json()
+    assert await HotelAdminCache.get_hotel_id(admin.id) == hotel.id
+
+    response = await client.delete(f"/admin/hotels/{hotel.id}/admins/{admin.id}", headers={
+        "authorization": global_token,
+    })
+    assert response.status_code == 204
+    assert await HotelAdminCache.get_hotel_id(admin.id) is None
+
+    admin.role = UserRole.ROOM_ADMIN
+    await admin.save(update_fields=["role"])
+    admin_token = (await Session.create(user=admin)).to_jwt()
+    response = await client.get(f"/admin/hotels/{hotel.id}/rooms", headers={"authorization": admin_token})
+    assert response.status_code == 403, response.json()
@@ -1,8 +1,13 @@
+from datetime import date
+
 import pytest
 from httpx import AsyncClient
 
-from hhb.models import UserRole, Hotel
-from tests.conftest import create_token
+from hhb import config
+from hhb.models import UserRole, Hotel, Room, Booking
+from hhb.schemas.hotels import SearchHotelsQuery
+from hhb.utils.hotel_search import HotelSearch
+from tests.conftest import create_token, create_user
 
 
 @pytest.mark.asyncio
@@ -98,3 +103,334 @@ async def test_search_hotels(client: AsyncClient):
     assert response.json()["count"] == 4
     assert len(response.json()["result"]) == 4
 
+
+@pytest.mark.asyncio
+async def test_search_hotels_cursor_pagination(client: AsyncClient):
+    await Hotel.bulk_create([Hotel(name=f"test {i}", address="test address") for i in range(12)])
+
+    response = await client.get("/hotels", params={"page": 2, "page_size": 5})
+    assert response.status_code == 200, response.json()
+    by_page = [hotel["id"] for hotel in response.json()["result"]]
+
+    ids = []
+    cursor = None
+    for _ in range(3):
+        response = await client.get("/hotels", params={"page_size": 5, **({"after": cursor} if cursor else {})})
+        assert response.status_code == 200, response.json()
+        assert response.json()["count"] == 12
+        ids.extend(hotel["id"] for hotel in response.json()["result"])
+        cursor = response.json()["next_cursor"]
+
+    assert cursor is None
+    assert len(ids) == 12
+    assert ids == sorted(ids)
+    assert ids[5:10] == by_page
+
+    response = await client.get("/hotels", params={"after": "not-a-cursor"})
+    assert response.status_code == 400, response.json()
+
+
+@pytest.mark.asyncio
+async def test_search_hotels_count(client: AsyncClient):
+    token = await create_token(UserRole.GLOBAL_ADMIN)
+    await Hotel.bulk_create([Hotel(name=f"test {i}", address="test address") for i in range(3)])
+
+    response = await client.get("/hotels", params={"with_count": False})
+    assert response.status_code == 200, response.json()
+    assert response.json()["count"] is None
+    assert len(response.json()["result"]) == 3
+
+    response = await client.get("/hotels", params={"name": "test"})
+    assert response.status_code == 200, response.json()
+    assert response.json()["count"] == 3
+
+    response = await client.post("/admin/hotels", headers={"authorization": token}, json={
+        "name": "test 3",
+        "address": "test address",
+    })
+    assert response.status_code == 200, response.json()
+
+    response = await client.get("/hotels", params={"name": "test"})
+    assert response.status_code == 200, response.json()
+    assert response.json()["count"] == 4
+
+
+@pytest.mark.asyncio
+async def test_search_hotels_full_text(client: AsyncClient):
+    assert HotelSearch.available()
+
+    await Hotel.create(name="Grand Plaza", address="1 Main street, Kyiv", description="Rooms with sea view")
+    await Hotel.create(name="Sea Breeze", address="5 Beach road, Odesa", description="Small family hotel")
+    await Hotel.create(name="Mountain Lodge", address="10 Hill street, Lviv", description=None)
+    hotel = await Hotel.create(name="City Inn", address="3 Central square, Kyiv", description="Business hotel")
+
+    response = await client.get("/hotels", params={"q": "sea"})
+    assert response.status_code == 200, response.json()
+    assert response.json()["count"] == 2
+    # Match in name is ranked higher than match in description
+    assert [h["name"] for h in response.json()["result"]] == ["Sea Breeze", "Grand Plaza"]
+
+    response = await client.get("/hotels", params={"q": "kyiv", "name": "city"})
+    assert response.status_code == 200, response.json()
+    assert response.json()["count"] == 1
+    assert response.json()["result"][0]["id"] == hotel.id
+
+    response = await client.get("/hotels", params={"q": "moun"})
+    assert response.status_code == 200, response.json()
+    assert [h["name"] for h in response.json()["result"]] == ["Mountain Lodge"]
+
+    response = await client.get("/hotels", params={"q": "\"*) OR"})
+    assert response.status_code == 200, response.json()
+    assert response.json()["count"] == 0
+
+    response = await client.get("/hotels", params={"q": "!!!"})
+    assert response.status_code == 200, response.json()
+    assert response.json()["count"] == 0
+
+    hotel.name = "Sea Side Inn"
+    await hotel.save()
+    response = await client.get("/hotels", params={"q": "sea"})
+    assert response.status_code == 200, response.json()
+    assert response.json()["count"] == 3
+
+
+@pytest.mark.asyncio
+async def test_search_hotels_full_text_pagination(client: AsyncClient):
+    for i in range(7):
+        await Hotel.create(name=f"Hotel {i}", address="Riverside", description=None)
+
+    seen = []
+    params = {"q": "riverside", "page_size": 5}
+    while True:
+        response = await client.get("/hotels", params=params)
+        assert response.status_code == 200, response.json()
+        seen.extend(h["id"] for h in response.json()["result"])
+        if not response.json()["next_cursor"]:
+            break
+        params["after"] = response.json()["next_cursor"]
+
+    assert len(seen) == len(set(seen)) == 7
+
+    response = await client.get("/hotels", params={"q": "riverside", "page_size": 5, "page": 2})
+    assert response.status_code == 200, response.json()
+    assert len(response.json()["result"]) == 2
+    assert response.json()["count"] == 7
+
+
+@pytest.mark.asyncio
+async def test_search_hotels_full_text_fallback(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(HotelSearch, "_dialect", None)
+    await Hotel.create(name="Grand Plaza", address="1 Main street", description="Rooms with sea view")
+    await Hotel.create(name="Sea Breeze", address="5 Beach road", description=None)
+    await Hotel.create(name="Mountain Lodge", address="10 Hill street", description=None)
+
+    response = await client.get("/hotels", params={"q": "sea"})
+    assert response.status_code == 200, response.json()
+    assert response.json()["count"] == 2
+
+
+def test_search_hotels_full_text_sql_dialects(monkeypatch: pytest.MonkeyPatch):
+    query = SearchHotelsQuery(
+        q="sea view", check_in=date(2024, 12, 13), check_out=date(2024, 12, 11), price_max=100,
+    )
+
+    monkeypatch.setattr(HotelSearch, "_dialect", "sqlite")
+    from_where, params, _, _ = HotelSearch._build_query(query, {"name": "50%_off"})
+    assert "hotel.name LIKE ? ESCAPE '\\'" in from_where
+    assert "2024" not in from_where
+    assert params == ["\"sea\" \"view\"*", "%50\\%\\_off%", 100, "2024-12-13", "2024-12-11", 0, 1]
+
+    monkeypatch.setattr(HotelSearch, "_dialect", "mysql")
+    from_where, params, _, _ = HotelSearch._build_query(query, {"name": "50%_off"})
+    assert "hotel.name LIKE %s AND" in from_where
+    assert "ESCAPE" not in from_where
+    assert "?" not in from_where
+    assert from_where.count("%s") == len(params)
+    assert params == ["sea view", "%50\\%\\_off%", 100, "2024-12-13", "2024-12-11", 0, 1]
+
+
+@pytest.mark.asyncio
+async def test_suggest_hotels(client: AsyncClient):
+    token = await create_token(UserRole.GLOBAL_ADMIN)
+    await Hotel.create(name="Grand Plaza", address="1 Main street, Kyiv")
+    await Hotel.create(name="Plaza Inn", address="5 Beach road, Odesa")
+    await Hotel.create(name="Mountain Lodge", address="10 Hill street, Lviv")
+
+    response = await client.get("/hotels/suggest", params={"prefix": "pla"})
+    assert response.status_code == 200, response.json()
+    assert [hotel["name"] for hotel in response.json()] == ["Plaza Inn", "Grand Plaza"]
+
+    response = await client.get("/hotels/suggest", params={"prefix": "LVI"})
+    assert response.status_code == 200, response.json()
+    assert [hotel["name"] for hotel in response.json()] == ["Mountain Lodge"]
+
+    response = await client.get("/hotels/suggest", params={"prefix": "pla", "limit": 1})
+    assert response.status_code == 200, response.json()
+    assert [hotel["name"] for hotel in response.json()] == ["Plaza Inn"]
+
+    response = await client.post("/admin/hotels", headers={"authorization": token}, json={
+        "name": "Sunny Plaza",
+        "address": "7 Sea road, Odesa",
+    })
+    assert response.status_code == 200, response.json()
+    hotel_id = response.json()["id"]
+
+    response = await client.patch(f"/admin/hotels/{hotel_id}", headers={"authorization": token}, json={
+        "name": "Sunny Palace",
+    })
+    assert response.status_code == 200, response.json()
+
+    response = await client.get("/hotels/suggest", params={"prefix": "sunny"})
+    assert response.status_code == 200, response.json()
+    assert response.json() == [{"id": hotel_id, "name": "Sunny Palace"}]
+
+    response = await client.get("/hotels/suggest", params={"prefix": "pla"})
+    assert response.status_code == 200, response.json()
+    assert [hotel["name"] for hotel in response.json()] == ["Plaza Inn", "Grand Plaza"]
+
+    response = await client.get("/hotels/suggest", params={"prefix": "pal"})
+    assert response.status_code == 200, response.json()
+    assert [hotel["name"] for hotel in response.json()] == ["Sunny Palace"]
+
+
+@pytest.mark.asyncio
+async def test_suggest_hotels_over_capacity(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(config, "HOTEL_SUGGEST_MAX_HOTELS", 1)
+    await Hotel.create(name="Grand Plaza", address="1 Main street, Kyiv")
+    await Hotel.create(name="Grand Hotel", address="5 Beach road, Odesa")
+
+    response = await client.get("/hotels/suggest", params={"prefix": "grand"})
+    assert response.status_code == 200, response.json()
+    assert [hotel["name"] for hotel in response.json()] == ["Grand Hotel", "Grand Plaza"]
+
+
+@pytest.mark.asyncio
+async def test_search_hotels_available_rooms(client: AsyncClient):
+    user = await create_user()
+    hotel1 = await Hotel.create(name="Riverside Plaza", address="1 Main street")
+    hotel2 = await Hotel.create(name="Riverside Inn", address="5 Beach road")
+    hotel3 = await Hotel.create(name="Mountain Lodge", address="10 Hill street")
+    room1 = await Room.create(hotel=hotel1, type="single", price=50)
+    await Room.create(hotel=hotel1, type="double", price=80)
+    await Room.create(hotel=hotel1, type="suite", price=200)
+    room2 = await Room.create(hotel=hotel2, type="single", price=40)
+    await Room.create(hotel=hotel3, type="single", price=300)
+
+    await Booking.create(
+        user=user, room=room1, check_in=date(2024, 12, 10), check_out=date(2024, 12, 12), total_price=150,
+    )
+    await Booking.create(
+        user=user, room=room2, check_in=date(2024, 12, 11), check_out=date(2024, 12, 15), total_price=200,
+    )
+
+    params = {"check_in": "2024-12-11", "check_out": "2024-12-13", "price_max": 250, "with_count": True}
+    response = await client.get("/hotels", params=params)
+    assert response.status_code == 200, response.json()
+    assert response.json()["count"] == 1
+    assert response.json()["result"] == [{
+        **hotel1.to_json(), "min_price": 80, "free_rooms": 2,
+    }]
+
+    response = await client.get("/hotels", params={**params, "q": "riverside"})
+    assert response.status_code == 200, response.json()
+    assert response.json()["count"] == 1
+    assert [hotel["id"] for hotel in response.json()["result"]] == [hotel1.id]
+
+    response = await client.get("/hotels", params={"check_in": "2024-12-16", "check_out": "2024-12-20"})
+    assert response.status_code == 200, response.json()
+    assert [(hotel["id"], hotel["min_price"], hotel["free_rooms"]) for hotel in response.json()["result"]] == [
+        (hotel1.id, 50, 3), (hotel2.id, 40, 1), (hotel3.id, 300, 1),
+    ]
+
+    response = await client.get("/hotels", params={"price_max": 100})
+    assert response.status_code == 200, response.json()
+    assert [(hotel["id"], hotel["min_price"], hotel["free_rooms"]) for hotel in response.json()["result"]] == [
+        (hotel1.id, 50, None), (hotel2.id, 40, None),
+    ]
+
+    response = await client.get("/hotels", params={"check_in": "2024-12-16"})
+    assert response.status_code == 400, response.json()
+
+    response = await client.get("/hotels")
+    assert response.status_code == 200, response.json()
+    assert "min_price" not in response.json()["result"][0]
+
+
+@pytest.mark.asyncio
+async def test_get_hotel_conditional(client: AsyncClient):
+    token = await create_token(UserRole.GLOBAL_ADMIN)
+    hotel = await Hotel.create(name="test", address="test address")
+
+    response = await client.get(f"/hotels/{hotel.id}")
+    assert response.status_code == 200, response.json()
+    etag = response.headers["etag"]
+    assert etag == f"\"hotel-{hotel.id}-1\""
+    assert "must-revalidate" in response.headers["cache-control"]
+
+    response = await client.get(f"/hotels/{hotel.id}", headers={"if-none-match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+    response = await client.patch(f"/admin/hotels/{hotel.id}", headers={"authorization": token}, json={
+        "name": "test123",
+    })
+    assert response.status_code == 200, response.json()
+
+    response = await client.get(f"/hotels/{hotel.id}", headers={"if-none-match": etag})
+    assert response.status_code == 200, response.json()
+    assert response.json()["name"] == "test123"
+    assert response.headers["etag"] == f"\"hotel-{hotel.id}-2\""
+    assert (await Hotel.get(id=hotel.id)).version == 2
+
+
+@pytest.mark.asyncio
+async def test_hotel_version_concurrent_saves(client: AsyncClient):
+    hotel = await Hotel.create(name="test", address="test address")
+    first = await Hotel.get(id=hotel.id)
+    second = await Hotel.get(id=hotel.id)
+
+    first.name = "first"
+    await first.save(update_fields=["name"])
+    second.description = "second"
+    await second.save()
+
+    assert first.version == 2
+    assert second.version == 3
+    assert (await Hotel.get(id=hotel.id)).version == 3
+
+
+@pytest.mark.asyncio
+async def test_search_hotels_conditional(client: AsyncClient):
+    token = await create_token(UserRole.GLOBAL_ADMIN)
+    hotel = await Hotel.create(name="test", address="test address")
+
+    response = await client.get("/hotels")
+    assert response.status_code == 200, response.json()
+    etag = response.headers["etag"]
+
+    response = await client.get("/hotels", headers={"if-none-match": etag})
+    assert response.status_code == 304
+
+    response = await client.get("/hotels", params={"name": "test"})
+    assert response.status_code == 200, response.json()
+    assert "etag" not in response.headers
+
+    response = await client.patch(f"/admin/hotels/{hotel.id}", headers={"authorization": token}, json={
+        "description": "desc",
+    })
+    assert response.status_code == 200, response.json()
+
+    response = await client.get("/hotels", headers={"if-none-match": etag})
+    assert response.status_code == 200, response.json()
+    assert response.json()["result"][0]["description"] == "desc"
+    assert response.headers["etag"] != etag
+
+    response = await client.post("/admin/hotels", headers={"authorization": token}, json={
+        "name": "test 2",
+        "address": "test address",
+    })
+    assert response.status_code == 200, response.json()
+
+    response = await client.get("/hotels")
+    assert response.status_code == 200, response.json()
+    assert len(response.json()["result"]) == 2
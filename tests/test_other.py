@@ -1,3 +1,4 @@
+import asyncio
 from time import time
 
 import pytest
@@ -5,6 +6,9 @@ import pytest_asyncio
 from httpx import AsyncClient
 from pytest_httpx import HTTPXMock
 
+from hhb import config
+from hhb.utils.multiple_errors_exception import MultipleErrorsException
+from hhb.utils.password_hasher import PasswordHasher
 from tests.conftest import recaptcha_mock_callback
 
 
@@ -62,3 +66,21 @@ async def test_captcha_fail_no_key(client: AsyncClient):
         "last_name": "last",
     })
     assert response.status_code == 400, response.json()
+
+
+@pytest.mark.httpx_mock(assert_all_responses_were_requested=False)
+@pytest.mark.asyncio
+async def test_password_hasher_saturated(monkeypatch):
+    monkeypatch.setattr(config, "PASSWORD_HASHER_WORKERS", 1)
+    monkeypatch.setattr(config, "PASSWORD_HASHER_QUEUE_SIZE", 0)
+    PasswordHasher.shutdown()
+
+    results = await asyncio.gather(
+        PasswordHasher.hash("123456789"), PasswordHasher.hash("123456789"), return_exceptions=True,
+    )
+    PasswordHasher.shutdown()
+
+    assert isinstance(results[0], str)
+    assert await PasswordHasher.check("123456789", results[0])
+    assert isinstance(results[1], MultipleErrorsException)
+    assert results[1].status_code == 503
@@ -0,0 +1,295 @@
+import re
+from datetime import date, timedelta
+
+import pytest
+from httpx import AsyncClient
+from pytest_httpx import HTTPXMock
+
+from hhb import config
+from hhb.models import Hotel, Room, BookingStatus, Payment, PaypalEvent, RoomSlot, Booking, OutboxJob, OutboxJobKind, \
+    OutboxJobStatus
+from hhb.utils.capture_worker import CaptureWorker
+from hhb.utils.outbox_worker import OutboxWorker
+from hhb.utils.paypal import PayPal
+from tests.conftest import create_token
+from tests.paypal_mock import PaypalMockState
+
+
+httpx_mock_decorator = pytest.mark.httpx_mock(
+    assert_all_requests_were_expected=False,
+    assert_all_responses_were_requested=False,
+    can_send_already_matched_responses=True,
+)
+
+
+async def create_booking(client: AsyncClient, httpx_mock: HTTPXMock) -> tuple[PaypalMockState, str, int, str]:
+    mock_state = PaypalMockState()
+    httpx_mock.add_callback(mock_state.handle_request, url=re.compile(rf"{re.escape(PayPal.BASE)}/.+"))
+
+    token = await create_token()
+    hotel = await Hotel.create(name="test", address="test address")
+    room = await Room.create(hotel=hotel, type="test", price=123)
+
+    response = await client.post(
+        f"/bookings", headers={"authorization": token}, json={
+            "room_id": room.id,
+            "check_in": str(date.today() + timedelta(days=1)),
+            "check_out": str(date.today() + timedelta(days=7)),
+        },
+    )
+    assert response.status_code == 200, response.json()
+
+    return mock_state, token, response.json()["id"], response.json()["payment_id"]
+
+
+@httpx_mock_decorator
+@pytest.mark.asyncio
+async def test_webhook_capture_completed(client: AsyncClient, httpx_mock: HTTPXMock):
+    mock_state, token, booking_id, order_id = await create_booking(client, httpx_mock)
+
+    headers, event = mock_state.capture_completed_event(order_id)
+    response = await client.post("/payments/paypal/webhook", headers=headers, json=event)
+    assert response.status_code == 204, response.json()
+
+    response = await client.get(f"/bookings/{booking_id}", headers={"authorization": token})
+    assert response.status_code == 200, response.json()
+    assert response.json()["status"] == BookingStatus.CONFIRMED
+    assert not response.json()["capture_in_progress"]
+
+    payment = await Payment.get(paypal_order_id=order_id)
+    assert payment.paypal_capture_id == event["resource"]["id"]
+
+
+@httpx_mock_decorator
+@pytest.mark.asyncio
+async def test_webhook_order_approved_schedules_capture(client: AsyncClient, httpx_mock: HTTPXMock):
+    mock_state, token, booking_id, order_id = await create_booking(client, httpx_mock)
+    mock_state.mark_as_payed(order_id)
+
+    headers, event = mock_state.order_approved_event(order_id)
+    response = await client.post("/payments/paypal/webhook", headers=headers, json=event)
+    assert response.status_code == 204, response.json()
+    await CaptureWorker.join()
+
+    response = await client.get(f"/bookings/{booking_id}", headers={"authorization": token})
+    assert response.status_code == 200, response.json()
+    assert response.json()["status"] == BookingStatus.CONFIRMED
+
+
+@httpx_mock_decorator
+@pytest.mark.asyncio
+async def test_capture_of_cancelled_booking_is_refunded(
+        client: AsyncClient, httpx_mock: HTTPXMock, monkeypatch: pytest.MonkeyPatch,
+):
+    mock_state, token, booking_id, order_id = await create_booking(client, httpx_mock)
+    mock_state.mark_as_payed(order_id)
+
+    # Order is not approved yet, so polling booking does not try to capture it
+    response = await client.get(f"/bookings/{booking_id}", headers={"authorization": token})
+    assert response.status_code == 200, response.json()
+    assert not response.json()["capture_in_progress"]
+    assert not [request for request in httpx_mock.get_requests() if request.url.path.endswith("/capture")]
+
+    capture = PayPal.capture
+
+    async def _capture_cancelled(order_id_: str) -> str | None:
+        # Booking is cancelled by another worker while PayPal captures it
+        await Booking.filter(id=booking_id).update(status=BookingStatus.CANCELLED)
+        return await capture(order_id_)
+
+    monkeypatch.setattr(PayPal, "capture", _capture_cancelled)
+
+    headers, event = mock_state.order_approved_event(order_id)
+    response = await client.post("/payments/paypal/webhook", headers=headers, json=event)
+    assert response.status_code == 204, response.json()
+    await CaptureWorker.join()
+    await OutboxWorker.join()
+
+    assert (await Booking.get(id=booking_id)).status == BookingStatus.CANCELLED
+    job = await OutboxJob.get(booking_id=booking_id, kind=OutboxJobKind.REFUND)
+    assert job.status == OutboxJobStatus.DONE
+    assert [request for request in httpx_mock.get_requests() if request.url.path.endswith("/refund")]
+
+
+@httpx_mock_decorator
+@pytest.mark.asyncio
+async def test_capture_without_webhooks(client: AsyncClient, httpx_mock: HTTPXMock, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(config, "PAYPAL_WEBHOOK_ID", None)
+    mock_state, token, booking_id, order_id = await create_booking(client, httpx_mock)
+
+    def captures_count() -> int:
+        return len([request for request in httpx_mock.get_requests() if request.url.path.endswith("/capture")])
+
+    # Approval is never reported, so every poll tries to capture once and does not block the booking
+    response = await client.get(f"/bookings/{booking_id}", headers={"authorization": token})
+    assert response.status_code == 200, response.json()
+    assert not response.json()["capture_in_progress"]
+    await CaptureWorker.join()
+    assert captures_count() == 1
+    assert (await Booking.get(id=booking_id)).status == BookingStatus.PENDING
+
+    mock_state.mark_as_payed(order_id)
+    response = await client.get(f"/bookings/{booking_id}", headers={"authorization": token})
+    assert response.status_code == 200, response.json()
+    await CaptureWorker.join()
+    assert captures_count() == 2
+    assert (await Booking.get(id=booking_id)).status == BookingStatus.CONFIRMED
+
+    booking = await Booking.get(id=booking_id)
+    response = await client.post(
+        f"/bookings", headers={"authorization": token}, json={
+            "room_id": booking.room_id,
+            "check_in": str(date.today() + timedelta(days=10)),
+            "check_out": str(date.today() + timedelta(days=12)),
+        },
+    )
+    assert response.status_code == 200, response.json()
+    booking_id = response.json()["id"]
+
+    response = await client.get(f"/bookings/{booking_id}", headers={"authorization": token})
+    assert response.status_code == 200, response.json()
+    response = await client.post(f"/bookings/{booking_id}/cancel", headers={"authorization": token})
+    assert response.status_code == 204, response.json()
+    await CaptureWorker.join()
+    assert (await Booking.get(id=booking_id)).status == BookingStatus.CANCELLED
+
+
+@httpx_mock_decorator
+@pytest.mark.asyncio
+async def test_cancel_losing_race_is_not_refunded(
+        client: AsyncClient, httpx_mock: HTTPXMock, monkeypatch: pytest.MonkeyPatch,
+):
+    mock_state, token, booking_id, order_id = await create_booking(client, httpx_mock)
+    mock_state.mark_as_payed(order_id)
+    headers, event = mock_state.order_approved_event(order_id)
+    response = await client.post("/payments/paypal/webhook", headers=headers, json=event)
+    assert response.status_code == 204, response.json()
+    await CaptureWorker.join()
+    assert (await Booking.get(id=booking_id)).status == BookingStatus.CONFIRMED
+
+    change_status = Booking.change_status
+
+    async def _change_status_after_other_worker(self, expected: BookingStatus, status: BookingStatus) -> bool:
+        # Booking is cancelled by another worker between loading it and changing its status
+        await Booking.filter(id=booking_id).update(status=BookingStatus.CANCELLED)
+        return await change_status(self, expected, status)
+
+    monkeypatch.setattr(Booking, "change_status", _change_status_after_other_worker)
+    response = await client.post(f"/bookings/{booking_id}/cancel", headers={"authorization": token})
+    assert response.status_code == 400, response.json()
+    await OutboxWorker.join()
+
+    assert not await OutboxJob.exists(booking_id=booking_id, kind=OutboxJobKind.REFUND)
+    assert not [request for request in httpx_mock.get_requests() if request.url.path.endswith("/refund")]
+
+
+@httpx_mock_decorator
+@pytest.mark.asyncio
+async def test_webhook_capture_refunded(client: AsyncClient, httpx_mock: HTTPXMock):
+    mock_state, token, booking_id, order_id = await create_booking(client, httpx_mock)
+
+    headers, event = mock_state.capture_completed_event(order_id)
+    response = await client.post("/payments/paypal/webhook", headers=headers, json=event)
+    assert response.status_code == 204, response.json()
+
+    headers, event = mock_state.capture_refunded_event(event["resource"]["id"])
+    response = await client.post("/payments/paypal/webhook", headers=headers, json=event)
+    assert response.status_code == 204, response.json()
+
+    response = await client.get(f"/bookings/{booking_id}", headers={"authorization": token})
+    assert response.status_code == 200, response.json()
+    assert response.json()["status"] == BookingStatus.CANCELLED
+    assert await RoomSlot.filter(booking__id=booking_id).count() == 0
+
+
+@httpx_mock_decorator
+@pytest.mark.asyncio
+async def test_webhook_capture_refunded_partially(client: AsyncClient, httpx_mock: HTTPXMock):
+    mock_state, token, booking_id, order_id = await create_booking(client, httpx_mock)
+
+    headers, event = mock_state.capture_completed_event(order_id)
+    response = await client.post("/payments/paypal/webhook", headers=headers, json=event)
+    assert response.status_code == 204, response.json()
+    capture_id = event["resource"]["id"]
+
+    headers, event = mock_state.capture_refunded_event(capture_id, "100.00")
+    response = await client.post("/payments/paypal/webhook", headers=headers, json=event)
+    assert response.status_code == 204, response.json()
+    assert (await Booking.get(id=booking_id)).status == BookingStatus.CONFIRMED
+
+    headers, event = mock_state.capture_refunded_event(capture_id)
+    response = await client.post("/payments/paypal/webhook", headers=headers, json=event)
+    assert response.status_code == 204, response.json()
+    assert (await Booking.get(id=booking_id)).status == BookingStatus.CANCELLED
+
+
+@httpx_mock_decorator
+@pytest.mark.asyncio
+async def test_webhook_capture_completed_for_cancelled_booking(client: AsyncClient, httpx_mock: HTTPXMock):
+    mock_state, token, booking_id, order_id = await create_booking(client, httpx_mock)
+
+    response = await client.post(f"/bookings/{booking_id}/cancel", headers={"authorization": token})
+    assert response.status_code == 204, response.json()
+
+    headers, event = mock_state.capture_completed_event(order_id)
+    response = await client.post("/payments/paypal/webhook", headers=headers, json=event)
+    assert response.status_code == 204, response.json()
+    await OutboxWorker.join()
+
+    assert (await Booking.get(id=booking_id)).status == BookingStatus.CANCELLED
+    job = await OutboxJob.get(booking_id=booking_id, kind=OutboxJobKind.REFUND)
+    assert job.status == OutboxJobStatus.DONE
+
+
+@httpx_mock_decorator
+@pytest.mark.asyncio
+async def test_webhook_malformed_resource(client: AsyncClient, httpx_mock: HTTPXMock):
+    mock_state, token, booking_id, order_id = await create_booking(client, httpx_mock)
+
+    headers, event = mock_state.capture_completed_event(order_id)
+    event["resource"] = ["not", "an", "object"]
+    response = await client.post("/payments/paypal/webhook", headers=headers, json=event)
+    assert response.status_code == 400, response.json()
+
+    headers, event = mock_state.make_webhook_event("PAYMENT.CAPTURE.COMPLETED", {
+        "id": "capture", "supplementary_data": "malformed",
+    })
+    response = await client.post("/payments/paypal/webhook", headers=headers, json=event)
+    assert response.status_code == 400, response.json()
+    assert await PaypalEvent.filter(event_id=event["id"]).count() == 0
+
+
+@httpx_mock_decorator
+@pytest.mark.asyncio
+async def test_webhook_duplicate_event(client: AsyncClient, httpx_mock: HTTPXMock):
+    mock_state, token, booking_id, order_id = await create_booking(client, httpx_mock)
+
+    headers, event = mock_state.capture_completed_event(order_id)
+    for _ in range(3):
+        response = await client.post("/payments/paypal/webhook", headers=headers, json=event)
+        assert response.status_code == 204, response.json()
+
+    assert await PaypalEvent.filter(event_id=event["id"]).count() == 1
+    verify_requests = [
+        request for request in httpx_mock.get_requests()
+        if request.url.path == "/v1/notifications/verify-webhook-signature"
+    ]
+    assert len(verify_requests) == 1
+
+
+@httpx_mock_decorator
+@pytest.mark.asyncio
+async def test_webhook_invalid_signature(client: AsyncClient, httpx_mock: HTTPXMock):
+    mock_state, token, booking_id, order_id = await create_booking(client, httpx_mock)
+
+    headers, event = mock_state.capture_completed_event(order_id)
+    event["resource"]["id"] = "forged"
+    response = await client.post("/payments/paypal/webhook", headers=headers, json=event)
+    assert response.status_code == 400, response.json()
+
+    response = await client.get(f"/bookings/{booking_id}", headers={"authorization": token})
+    assert response.status_code == 200, response.json()
+    assert await PaypalEvent.filter(event_id=event["id"]).count() == 0
+
+    response = await client.post("/payments/paypal/webhook", headers=headers, json={"resource": {}})
+    assert response.status_code == 400, response.json()
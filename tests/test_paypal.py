@@ -0,0 +1,171 @@
+import asyncio
+from datetime import date, timedelta
+from time import time
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient, MockTransport, Request, Response
+
+from hhb import config
+from hhb.models import Hotel, Room, Booking, BookingStatus, RoomSlot
+from hhb.utils.cache import Cache
+from hhb.utils.multiple_errors_exception import MultipleErrorsException
+from hhb.utils.paypal import PayPal
+from hhb.utils.resilience import BreakerState, RetryBudget, ServiceUnavailableException
+from tests.conftest import create_token
+from tests.paypal_mock import PaypalMockState
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def reset_paypal_token() -> None:
+    yield
+    PayPal._set_access_token(None, 0, 0)
+    await Cache.delete("paypal_token", config.PAYPAL_ID)
+
+
+@pytest.mark.asyncio
+async def test_paypal_token_single_flight(client: AsyncClient):
+    mock_state = PaypalMockState()
+    await PayPal.init_client(mock_state.transport())
+    PayPal._set_access_token(None, 0, 0)
+
+    tokens = await asyncio.gather(*[PayPal._get_access_token() for _ in range(16)])
+    assert len(set(tokens)) == 1
+    assert mock_state.auth_requests == 1
+    assert (await Cache.get("paypal_token", config.PAYPAL_ID))["access_token"] == tokens[0]
+
+
+@pytest.mark.asyncio
+async def test_paypal_token_proactive_renewal(client: AsyncClient):
+    mock_state = PaypalMockState()
+    await PayPal.init_client(mock_state.transport())
+    PayPal._set_access_token("old-token", int(time() + 60), int(time() - 1))
+
+    assert await PayPal._get_access_token() == "old-token"
+    await PayPal._refresh_task
+    assert mock_state.auth_requests == 1
+    assert await PayPal._get_access_token() != "old-token"
+    assert PayPal._access_token_renew_at > time()
+
+
+@pytest.mark.asyncio
+async def test_paypal_token_shared_between_workers(client: AsyncClient):
+    mock_state = PaypalMockState()
+    await PayPal.init_client(mock_state.transport())
+    await Cache.set("paypal_token", config.PAYPAL_ID, {
+        "access_token": "shared-token", "expires_at": int(time() + 3600), "renew_at": int(time() + 3000),
+    })
+    PayPal._set_access_token(None, 0, 0)
+
+    assert await PayPal._get_access_token() == "shared-token"
+    assert mock_state.auth_requests == 0
+
+
+def failing_transport(mock_state: PaypalMockState, failures: int) -> MockTransport:
+    mock_state.order_requests = 0
+    mock_state.order_failures = failures
+
+    def handle_request(request: Request) -> Response:
+        if request.url.path == "/v2/checkout/orders":
+            mock_state.order_requests += 1
+            if mock_state.order_failures > 0:
+                mock_state.order_failures -= 1
+                return Response(status_code=503, json={"name": "SERVICE_UNAVAILABLE"})
+        return mock_state.handle_request(request)
+
+    return MockTransport(handle_request)
+
+
+@pytest.mark.asyncio
+async def test_paypal_retries_idempotent_calls(client: AsyncClient):
+    mock_state = PaypalMockState()
+    await PayPal.init_client(failing_transport(mock_state, 2))
+
+    assert await PayPal.create(10, request_id="test-retry")
+    assert mock_state.order_requests == 3
+    assert PayPal._service.breaker.state == BreakerState.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_paypal_capture_request_id_per_attempt(client: AsyncClient):
+    mock_state = PaypalMockState()
+    request_ids = []
+    failures = 1
+
+    def handle_request(request: Request) -> Response:
+        nonlocal failures
+        if request.url.path.endswith("/capture"):
+            request_ids.append(request.headers["paypal-request-id"])
+            if failures > 0:
+                failures -= 1
+                return Response(status_code=503, json={"name": "SERVICE_UNAVAILABLE"})
+        return mock_state.handle_request(request)
+
+    await PayPal.init_client(MockTransport(handle_request))
+    order_id = await PayPal.create(10)
+
+    assert await PayPal.capture(order_id) is None
+    mock_state.mark_as_payed(order_id)
+    assert await PayPal.capture(order_id) is not None
+
+    # Retry of the first attempt reuses its id, attempt made after approval gets a new one
+    assert len(request_ids) == 3
+    assert request_ids[0] == request_ids[1]
+    assert request_ids[2] != request_ids[0]
+
+
+@pytest.mark.asyncio
+async def test_paypal_does_not_retry_non_idempotent_calls(client: AsyncClient):
+    mock_state = PaypalMockState()
+    await PayPal.init_client(failing_transport(mock_state, 2))
+
+    with pytest.raises(MultipleErrorsException):
+        await PayPal.create(10)
+    assert mock_state.order_requests == 1
+
+
+@pytest.mark.asyncio
+async def test_paypal_circuit_breaker(client: AsyncClient):
+    mock_state = PaypalMockState()
+    await PayPal.init_client(failing_transport(mock_state, 1000))
+
+    for _ in range(config.BREAKER_FAILURE_THRESHOLD):
+        with pytest.raises(MultipleErrorsException):
+            await PayPal.create(10)
+    assert PayPal._service.breaker.state == BreakerState.OPEN
+
+    with pytest.raises(ServiceUnavailableException):
+        await PayPal.create(10)
+    assert mock_state.order_requests == config.BREAKER_FAILURE_THRESHOLD
+
+    token = await create_token()
+    hotel = await Hotel.create(name="test", address="test address")
+    room = await Room.create(hotel=hotel, type="test", price=123)
+    response = await client.post(
+        f"/bookings", headers={"authorization": token}, json={
+            "room_id": room.id,
+            "check_in": str(date.today() + timedelta(days=1)),
+            "check_out": str(date.today() + timedelta(days=7)),
+        },
+    )
+    assert response.status_code == 503, response.json()
+    assert await Booking.filter(status=BookingStatus.CANCELLED).count() == 1
+    assert await RoomSlot.all().count() == 0
+
+    # Recovery timeout passed, probe request succeeds and breaker closes
+    mock_state.order_failures = 0
+    PayPal._service.breaker._opened_at -= config.BREAKER_RECOVERY_TIMEOUT
+    assert PayPal._service.breaker.state == BreakerState.HALF_OPEN
+    assert await PayPal.create(10)
+    assert PayPal._service.breaker.state == BreakerState.CLOSED
+
+
+def test_retry_budget():
+    budget = RetryBudget(0.5, 0, 1)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
@@ -0,0 +1,90 @@
+import asyncio
+from time import time
+
+import pytest
+from httpx import AsyncClient, MockTransport, Request, Response
+
+from hhb import config
+from hhb.utils.recaptcha import ReCaptcha
+from hhb.utils.resilience import BreakerState
+from tests.conftest import recaptcha_mock_callback
+
+
+def slow_transport(delay: float) -> MockTransport:
+    async def handle_request(request: Request) -> Response:
+        await asyncio.sleep(delay)
+        return recaptcha_mock_callback(request)
+
+    return MockTransport(handle_request)
+
+
+async def register(client: AsyncClient) -> Response:
+    return await client.post("/auth/register", json={
+        "email": f"test{time()}@gmail.com",
+        "password": "123456789",
+        "first_name": "first",
+        "last_name": "last",
+        "captcha_key": "should-pass-test-key",
+    })
+
+
+@pytest.mark.asyncio
+async def test_recaptcha_pooled_client(client: AsyncClient):
+    await ReCaptcha.init_client(MockTransport(recaptcha_mock_callback))
+
+    assert await ReCaptcha.verify("should-pass-test-key")
+    assert not await ReCaptcha.verify("should-not-pass-test-key")
+
+    response = await register(client)
+    assert response.status_code == 200, response.json()
+
+
+@pytest.mark.asyncio
+async def test_recaptcha_deadline_fail_closed(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(config, "RECAPTCHA_DEADLINE_MS", 50)
+    await ReCaptcha.init_client(slow_transport(1))
+
+    started = time()
+    response = await register(client)
+    assert response.status_code == 503, response.json()
+    assert time() - started < 0.5
+
+
+@pytest.mark.asyncio
+async def test_recaptcha_deadline_fail_open(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(config, "RECAPTCHA_DEADLINE_MS", 50)
+    monkeypatch.setattr(config, "RECAPTCHA_FAIL_OPEN", True)
+    await ReCaptcha.init_client(slow_transport(1))
+
+    response = await register(client)
+    assert response.status_code == 200, response.json()
+
+
+@pytest.mark.asyncio
+async def test_recaptcha_concurrency_gate(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(config, "RECAPTCHA_CONCURRENCY", 2)
+    monkeypatch.setattr(config, "RECAPTCHA_DEADLINE_MS", 300)
+    await ReCaptcha.init_client(slow_transport(0.2))
+
+    results = await asyncio.gather(
+        *[ReCaptcha.verify("should-pass-test-key") for _ in range(4)], return_exceptions=True,
+    )
+    assert results[:2] == [True, True]
+    assert all(isinstance(result, Exception) for result in results[2:])
+
+
+@pytest.mark.asyncio
+async def test_recaptcha_queue_timeout_is_not_upstream_failure(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(config, "RECAPTCHA_CONCURRENCY", 1)
+    monkeypatch.setattr(config, "RECAPTCHA_DEADLINE_MS", 50)
+    await ReCaptcha.init_client(MockTransport(recaptcha_mock_callback))
+
+    # All slots are taken by verifications that are still running
+    await ReCaptcha._semaphore.acquire()
+    for _ in range(config.BREAKER_FAILURE_THRESHOLD):
+        response = await register(client)
+        assert response.status_code == 503, response.json()
+    ReCaptcha._semaphore.release()
+
+    assert ReCaptcha._service.breaker.state == BreakerState.CLOSED
+    assert await ReCaptcha.verify("should-pass-test-key")
@@ -1,9 +1,12 @@
-from datetime import date
+from datetime import date, timedelta
 
 import pytest
 from httpx import AsyncClient
+from tortoise import timezone
 
-from hhb.models import UserRole, Hotel, Room, Booking
+from hhb import config
+from hhb.models import UserRole, Hotel, Room, Booking, BookingStatus
+from hhb.utils.occupancy_index import OccupancyIndex
 from tests.conftest import create_token, create_user
 
 
@@ -23,6 +26,41 @@ async def test_get_room(client: AsyncClient):
     assert response.status_code == 404, response.json()
 
 
+@pytest.mark.asyncio
+async def test_get_room_conditional(client: AsyncClient):
+    token = await create_token(UserRole.GLOBAL_ADMIN)
+    user = await create_user()
+    hotel = await Hotel.create(name="test", address="test address")
+    room = await Room.create(type="test", hotel=hotel, price=123)
+
+    response = await client.get(f"/rooms/{room.id}")
+    assert response.status_code == 200, response.json()
+    etag = response.headers["etag"]
+    assert etag == f"\"room-{room.id}-1-1\""
+
+    response = await client.get(f"/rooms/{room.id}", headers={"if-none-match": etag})
+    assert response.status_code == 304
+
+    response = await client.patch(f"/admin/rooms/{room.id}", headers={"authorization": token}, json={
+        "price": 150,
+    })
+    assert response.status_code == 200, response.json()
+
+    response = await client.get(f"/rooms/{room.id}", headers={"if-none-match": etag})
+    assert response.status_code == 200, response.json()
+    assert response.json()["price"] == 150
+    etag = response.headers["etag"]
+    assert etag == f"\"room-{room.id}-2-1\""
+
+    today = date.today()
+    await Booking.create(user=user, room=room, check_in=today, check_out=today + timedelta(days=1), total_price=150)
+
+    response = await client.get(f"/rooms/{room.id}", headers={"if-none-match": etag})
+    assert response.status_code == 200, response.json()
+    assert not response.json()["available"]
+    assert response.headers["etag"] == f"\"room-{room.id}-2-0\""
+
+
 @pytest.mark.asyncio
 async def test_search_rooms(client: AsyncClient):
     hotel1 = await Hotel.create(name="1", address="test address")
@@ -117,3 +155,195 @@ async def test_search_booked_rooms(client: AsyncClient):
         assert response.status_code == 200, response.json()
         assert response.json()["count"] == expected
         assert len(response.json()["result"]) == expected
+
+
+@pytest.mark.asyncio
+async def test_search_rooms_available_field(client: AsyncClient):
+    hotel = await Hotel.create(name="1", address="test address")
+    user = await create_user()
+    rooms = [await Room.create(type="test", hotel=hotel, price=100 + i) for i in range(6)]
+    today = date.today()
+    for room in rooms[::2]:
+        await Booking.create(
+            user=user, room=room, check_in=today - timedelta(days=1), check_out=today + timedelta(days=1),
+            total_price=200,
+        )
+
+    response = await client.get(f"/rooms", params={"hotel_id": hotel.id})
+    assert response.status_code == 200, response.json()
+    assert response.json()["count"] == 6
+    assert [room["available"] for room in response.json()["result"]] == [False, True] * 3
+
+
+@pytest.mark.asyncio
+async def test_search_rooms_ignores_cancelled_bookings(client: AsyncClient):
+    hotel = await Hotel.create(name="1", address="test address")
+    user = await create_user()
+    room = await Room.create(type="test", hotel=hotel, price=100)
+    booking = await Booking.create(
+        user=user, room=room, check_in=date(2024, 12, 1), check_out=date(2024, 12, 15), total_price=1500,
+    )
+
+    params = {"hotel_id": hotel.id, "check_in": "2024-12-05", "check_out": "2024-12-10"}
+    response = await client.get(f"/rooms", params=params)
+    assert response.status_code == 200, response.json()
+    assert response.json()["count"] == 0
+
+    booking.status = BookingStatus.CANCELLED
+    await booking.save(update_fields=["status"])
+
+    response = await client.get(f"/rooms", params=params)
+    assert response.status_code == 200, response.json()
+    assert response.json()["count"] == 1
+    assert response.json()["result"][0]["id"] == room.id
+
+
+@pytest.mark.asyncio
+async def test_room_calendar(client: AsyncClient):
+    hotel = await Hotel.create(name="1", address="test address")
+    user = await create_user()
+    room = await Room.create(type="test", hotel=hotel, price=100)
+    for check_in, check_out, status in [
+        (date(2024, 11, 25), date(2024, 12, 2), BookingStatus.CONFIRMED),
+        (date(2024, 12, 3), date(2024, 12, 5), BookingStatus.PENDING),
+        (date(2024, 12, 4), date(2024, 12, 8), BookingStatus.CONFIRMED),
+        (date(2024, 12, 12), date(2024, 12, 14), BookingStatus.CANCELLED),
+        (date(2024, 12, 20), date(2025, 1, 10), BookingStatus.CONFIRMED),
+    ]:
+        await Booking.create(
+            user=user, room=room, check_in=check_in, check_out=check_out, total_price=100, status=status,
+        )
+
+    params = {"from": "2024-12-01", "to": "2024-12-31"}
+    response = await client.get(f"/rooms/{room.id}/calendar", params=params)
+    assert response.status_code == 200, response.json()
+    assert response.json() == {
+        "room_id": room.id,
+        "start": "2024-12-01",
+        "end": "2024-12-31",
+        "occupied": [
+            {"start": "2024-12-01", "end": "2024-12-08"},
+            {"start": "2024-12-20", "end": "2024-12-31"},
+        ],
+        "free": [
+            {"start": "2024-12-09", "end": "2024-12-19"},
+        ],
+    }
+    etag = response.headers["etag"]
+
+    response = await client.get(f"/rooms/{room.id}/calendar", params=params, headers={"if-none-match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+    await Booking.create(
+        user=user, room=room, check_in=date(2024, 12, 10), check_out=date(2024, 12, 11), total_price=100,
+    )
+    response = await client.get(f"/rooms/{room.id}/calendar", params=params, headers={"if-none-match": etag})
+    assert response.status_code == 200, response.json()
+    assert response.headers["etag"] != etag
+    assert response.json()["free"] == [
+        {"start": "2024-12-09", "end": "2024-12-09"},
+        {"start": "2024-12-12", "end": "2024-12-19"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_room_calendar_invalid_range(client: AsyncClient):
+    hotel = await Hotel.create(name="1", address="test address")
+    room = await Room.create(type="test", hotel=hotel, price=100)
+
+    response = await client.get(f"/rooms/{room.id}/calendar", params={"from": "2024-12-01", "to": "2024-11-01"})
+    assert response.status_code == 400, response.json()
+
+    response = await client.get(f"/rooms/{room.id}/calendar", params={"from": "2024-01-01", "to": "2025-06-01"})
+    assert response.status_code == 400, response.json()
+
+    response = await client.get(f"/rooms/{room.id}/calendar", params={"from": "2024-01-01", "to": "2024-01-01"})
+    assert response.status_code == 200, response.json()
+    assert response.json()["free"] == [{"start": "2024-01-01", "end": "2024-01-01"}]
+
+
+@pytest.mark.asyncio
+async def test_occupancy_index(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    hotel = await Hotel.create(name="1", address="test address")
+    user = await create_user()
+    rooms = [await Room.create(type="test", hotel=hotel, price=100 + i) for i in range(3)]
+    room_ids = [room.id for room in rooms]
+    today = date.today()
+    await Booking.create(
+        user=user, room=rooms[0], check_in=today + timedelta(days=1), check_out=today + timedelta(days=5),
+        total_price=500,
+    )
+
+    await Booking.create(
+        user=user, room=rooms[0], check_in=today + timedelta(days=10), check_out=today + timedelta(days=12),
+        total_price=300,
+    )
+
+    await OccupancyIndex.load()
+    assert OccupancyIndex.free_rooms(room_ids, today, today) == set(room_ids)
+    assert OccupancyIndex.free_rooms(room_ids, today + timedelta(days=5), today + timedelta(days=8)) == {
+        rooms[1].id, rooms[2].id,
+    }
+    assert OccupancyIndex.free_rooms(room_ids, today + timedelta(days=6), today + timedelta(days=9)) == set(room_ids)
+    assert OccupancyIndex.free_rooms(room_ids, today + timedelta(days=11), today + timedelta(days=11)) == {
+        rooms[1].id, rooms[2].id,
+    }
+    assert OccupancyIndex.occupied_rooms(today + timedelta(days=12), today + timedelta(days=20)) == {rooms[0].id}
+
+    # Too many occupied rooms for NOT IN list, searches fall back to subquery
+    monkeypatch.setattr(config, "OCCUPANCY_INDEX_MAX_EXCLUDED_ROOMS", 0)
+    assert OccupancyIndex.occupied_rooms(today + timedelta(days=12), today + timedelta(days=20)) is None
+    assert OccupancyIndex.occupied_rooms(today + timedelta(days=6), today + timedelta(days=9)) == set()
+    response = await client.get(f"/rooms", params={
+        "hotel_id": hotel.id, "check_in": str(today + timedelta(days=2)), "check_out": str(today + timedelta(days=3)),
+    })
+    assert [room["id"] for room in response.json()["result"]] == [rooms[1].id, rooms[2].id]
+    monkeypatch.setattr(config, "OCCUPANCY_INDEX_MAX_EXCLUDED_ROOMS", 500)
+
+    token = await create_token()
+    response = await client.post("/bookings", headers={"authorization": token}, json={
+        "room_id": rooms[0].id,
+        "check_in": str(today + timedelta(days=2)),
+        "check_out": str(today + timedelta(days=3)),
+    })
+    assert response.status_code == 400, response.json()
+
+    # Local changes come through model signals
+    booking = await Booking.create(
+        user=user, room=rooms[1], check_in=today - timedelta(days=1), check_out=today + timedelta(days=1),
+        total_price=200,
+    )
+    assert OccupancyIndex.free_rooms(room_ids, today, today) == {rooms[0].id, rooms[2].id}
+
+    response = await client.get(f"/rooms", params={"hotel_id": hotel.id})
+    assert response.status_code == 200, response.json()
+    assert [room["available"] for room in response.json()["result"]] == [True, False, True]
+
+    booking.status = BookingStatus.CANCELLED
+    await booking.save(update_fields=["status"])
+    assert OccupancyIndex.free_rooms(room_ids, today, today) == set(room_ids)
+
+    # Changes made by other workers come through updated_at feed
+    await Booking.filter(id=booking.id).update(status=BookingStatus.CONFIRMED, updated_at=timezone.now())
+    assert OccupancyIndex.free_rooms(room_ids, today, today) == set(room_ids)
+    # Searches are served by the index until it pulls the change
+    params = {"hotel_id": hotel.id, "check_in": str(today), "check_out": str(today)}
+    response = await client.get(f"/rooms", params=params)
+    assert response.status_code == 200, response.json()
+    assert [room["id"] for room in response.json()["result"]] == room_ids
+
+    await OccupancyIndex.refresh()
+    assert OccupancyIndex.free_rooms(room_ids, today, today) == {rooms[0].id, rooms[2].id}
+    response = await client.get(f"/rooms", params=params)
+    assert [room["id"] for room in response.json()["result"]] == [rooms[0].id, rooms[2].id]
+    response = await client.get(f"/hotels", params={"check_in": str(today), "check_out": str(today)})
+    assert response.json()["result"][0]["free_rooms"] == 2
+
+    monkeypatch.setattr(config, "OCCUPANCY_INDEX_MAX_STALENESS", -1)
+    assert OccupancyIndex.free_rooms(room_ids, today, today) is None
+    response = await client.get(f"/rooms", params={"hotel_id": hotel.id})
+    assert response.status_code == 200, response.json()
+    assert [room["available"] for room in response.json()["result"]] == [True, False, True]
+    response = await client.get(f"/rooms", params=params)
+    assert [room["id"] for room in response.json()["result"]] == [rooms[0].id, rooms[2].id]
@@ -6,6 +6,7 @@ from pytest_httpx import HTTPXMock
 
 from hhb.models import User, Session
 from hhb.utils.mfa import Mfa
+from hhb.utils.session_cache import SessionCache
 from tests.conftest import PWD_HASH_123456789, recaptcha_mock_callback
 
 
@@ -196,3 +197,57 @@ async def test_user_disable_mfa_errors(client: AsyncClient):
     })
     assert response.status_code == 400, response.json()  # Not enabled
 
+
+@pytest.mark.asyncio
+async def test_user_info_session_cache(client: AsyncClient):
+    user = await User.create(
+        email=f"test{time()}@gmail.com", password=PWD_HASH_123456789, first_name="first", last_name="last",
+    )
+    token = (await Session.create(user=user)).to_jwt()
+
+    response = await client.get("/user/info", headers={"authorization": token})
+    assert response.status_code == 200, response.json()
+
+    hits = SessionCache.stats()["hits"]
+    response = await client.get("/user/info", headers={"authorization": token})
+    assert response.status_code == 200, response.json()
+    assert SessionCache.stats()["hits"] == hits + 1
+
+    response = await client.patch("/user/info", headers={"authorization": token}, json={
+        "first_name": "first_edited", "phone_number": "",
+    })
+    assert response.status_code == 200, response.json()
+
+    user.last_name = "last_edited"
+    await user.save(update_fields=["last_name"])
+
+    response = await client.get("/user/info", headers={"authorization": token})
+    assert response.status_code == 200, response.json()
+    assert response.json()["first_name"] == "first_edited"
+    assert response.json()["last_name"] == "last_edited"
+
+    # Deleted through instances, so post_delete signal evicts cached sessions
+    for session in await Session.filter(user=user):
+        await session.delete()
+
+    response = await client.get("/user/info", headers={"authorization": token})
+    assert response.status_code == 401, response.json()
+
+
+@pytest.mark.asyncio
+async def test_session_cache_returns_copies(client: AsyncClient):
+    user = await User.create(
+        email=f"test{time()}@gmail.com", password=PWD_HASH_123456789, first_name="first", last_name="last",
+    )
+    token = (await Session.create(user=user)).to_jwt()
+
+    # Changes made by request before save() must not leak into sessions of concurrent requests
+    (await Session.from_jwt(token)).user.first_name = "not saved"
+    first = await Session.from_jwt(token)
+    second = await Session.from_jwt(token)
+    assert first.user.first_name == second.user.first_name == "first"
+    first.user.first_name = "not saved"
+    assert second.user.first_name == "first"
+
+    await first.user.save(update_fields=["first_name"])
+    assert (await Session.from_jwt(token)).user.first_name == "not saved"